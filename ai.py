@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from typing import Callable, Dict, List, Optional
+import multiprocessing
+import os
+import time
+
+from monopoly import Game, Property
+from simulation import Policy, play_turn, settle_payments
+
+# Computer players are added to games with negative user ids, so they can't clash with Telegram users.
+
+
+def is_bot(user_id) -> bool:
+    return user_id < 0
+
+
+def humans_left(game) -> bool:
+    return any(not is_bot(user_id) for user_id in game.players)
+
+
+def clone(game) -> Game:
+    """A quiet copy of game without a chat, to try things out on."""
+    copy = Game.from_state(game.get_state(events=False))
+    # The state keeps whether the live game is quiet, which it usually isn't.
+    copy.quiet = True
+    return copy
+
+
+def net_worth(player) -> int:
+    """Cash plus what the player paid for their properties and buildings, less what they owe on mortgages."""
+    total = player.get_money()
+    for p in player.get_properties():
+        total += p.get_cost() - (p.get_mortgage_value() if p.get_mortgaged() else 0)
+        if type(p) == Property:
+            total += p.get_house_cost() * p.get_houses() + p.get_hotel_cost() * p.get_hotels()
+    return total
+
+
+def wealth_share(game, user_id) -> float:
+    """How well user_id is doing: 1 if they have won, 0 if they are out, else their share of the net worth."""
+    player = game.players.get(user_id)
+    if player is None:
+        return 0.0
+    if len(game.players) == 1:
+        return 1.0
+    total = sum(max(0, net_worth(p)) for p in game.players.values())
+    return max(0, net_worth(player)) / total if total > 0 else 0.0
+
+
+def play_out(game, policy, horizon):
+    for _ in range(horizon):
+        if len(game.players) < 2:
+            break
+        play_turn(game, policy)
+
+
+def rollout(game, user_id, policy, horizon) -> float:
+    """Play horizon turns of game with policy and score the result for user_id."""
+    play_out(game, policy, horizon)
+    return wealth_share(game, user_id)
+
+
+def compare(game, user_id, options: List[Callable[[Game], object]], budget, horizon=40,
+            policy: Optional[Policy] = None) -> List[float]:
+    """
+    Mean rollout score for user_id after each option is applied to a copy of game.
+
+    Every option gets its own copy, which is snapshotted once and restored before each rollout. The options take
+    turns, and rollout k of every option uses the same dice, so they're compared on equal terms. Rollouts stop once
+    budget seconds have passed, but every option gets at least one.
+    """
+    if policy is None:
+        policy = Policy()
+    deadline = time.perf_counter() + budget
+
+    branches = []
+    for option in options:
+        branch = clone(game)
+        option(branch)
+        branches.append((branch, branch.snapshot(rng=False)))
+
+    totals = [0.0] * len(options)
+    k = 0
+    while k == 0 or time.perf_counter() < deadline:
+        for (i, (branch, snapshot)) in enumerate(branches):
+            branch.restore(snapshot)
+            branch.rng.seed(k)
+            totals[i] += rollout(branch, user_id, policy, horizon)
+        k += 1
+    return [total / k for total in totals]
+
+
+def apply_trade(game):
+    """Go through with the pending trade, as if both sides agreed."""
+    game.pending_trade.agreed = [True, True]
+    game.trade()
+
+
+def best(scores) -> int:
+    # Ties go to the first option, which is always doing nothing.
+    return max(range(len(scores)), key=lambda i: (scores[i], -i))
+
+
+class RolloutPolicy(Policy):
+    """
+    Decides by playing the game out with the default policy from each of its choices, within budget seconds per
+    decision. Falls back on the default policy's limits for what it can afford.
+    """
+    def __init__(self, budget=0.05, horizon=40, reserve=50):
+        super().__init__(reserve)
+        self.budget = budget
+        self.horizon = horizon
+
+    def should_buy(self, game, player, property) -> bool:
+        if not super().should_buy(game, player, property):
+            return False
+        user_id = player.get_user_id()
+        scores = compare(game, user_id, [lambda g: None, lambda g: g.purchase_property(user_id)], self.budget,
+                         self.horizon)
+        return best(scores) == 1
+
+    def houses_to_buy(self, game, player) -> List[str]:
+        ids = super().houses_to_buy(game, player)
+        if not ids:
+            return ids
+        user_id = player.get_user_id()
+        choices = [[], ids[:1], ids]
+        scores = compare(game, user_id, [lambda g, c=c: g.purchase_house(user_id, c) if c else None
+                                         for c in choices], self.budget, self.horizon)
+        return choices[best(scores)]
+
+    def should_trade(self, game, player) -> bool:
+        """Whether the pending trade is worth agreeing to."""
+        scores = compare(game, player.get_user_id(), [lambda g: None, apply_trade], self.budget, self.horizon)
+        return best(scores) == 1
+
+
+DIFFICULTIES: Dict[str, Policy] = {
+    "easy": Policy(),
+    "medium": RolloutPolicy(budget=0.02, horizon=20),
+    "hard": RolloutPolicy(budget=0.05, horizon=40),
+}
+DEFAULT_DIFFICULTY = "medium"
+
+
+def get_policy(difficulty) -> Policy:
+    return DIFFICULTIES.get(difficulty, DIFFICULTIES[DEFAULT_DIFFICULTY])
+
+
+def answer_trade(game, bots):
+    """A bot in the pending trade agrees or cancels once the other side has agreed."""
+    trade = game.pending_trade
+    if trade is None:
+        return
+    for (side, player) in enumerate(trade.players):
+        (agreed, other_agreed) = (trade.agreed[side], trade.agreed[1 - side])
+        user_id = player.get_user_id()
+        if user_id not in bots or agreed or not other_agreed:
+            continue
+        policy = get_policy(bots[user_id])
+        if isinstance(policy, RolloutPolicy) and policy.should_trade(game, player):
+            game.agree_to_trade(user_id)
+            game.trade()
+        else:
+            game.cancel_trade(user_id)
+        return
+
+
+def act(game, bots: Dict[int, str], max_turns=100, budget=1.0) -> int:
+    """
+    Let the bots (user id -> difficulty) in game do whatever is up to them: answer the pending trade, pay their
+    debts and play their turns, until it's a human's turn, no humans are left or the game is over. Stops early
+    after max_turns turns or once budget seconds have passed, leaving a bot to move. Returns the number of turns
+    played.
+    """
+    deadline = time.perf_counter() + budget
+    answer_trade(game, bots)
+    # Bots pay what they owe straight away, even outside their turn (e.g. to a card another player drew).
+    settle_payments(game, bots)
+    turns = 0
+    while turns < max_turns and time.perf_counter() < deadline and len(game.players) > 1 and humans_left(game):
+        player = game.get_player_by_local_id(game.turn)
+        if player is None or player.get_user_id() not in bots:
+            break
+        play_turn(game, get_policy(bots[player.get_user_id()]), payers=bots)
+        turns += 1
+        if sum(game.last_roll) != -1:
+            # The turn couldn't be ended, since a human still owes something (e.g. to a card the bot drew). After
+            # doubles the bot keeps the turn, but then it has been ended and the dice are reset.
+            break
+    return turns
+
+
+def bot_to_move(game, bots) -> bool:
+    """Whether act stopped early, leaving a bot with its turn still to play."""
+    player = game.get_player_by_local_id(game.turn)
+    return len(game.players) > 1 and humans_left(game) and player is not None and \
+        player.get_user_id() in bots and sum(game.last_roll) == -1
+
+
+class TradeEvaluation:
+    """
+    What the pending trade is expected to do for both sides. Chances of winning are estimated by the share of
+    the net worth at the end of the rollouts (the whole of it for a player who won).
+    """
+    def __init__(self, names, rollouts, horizon, shares, worths):
+        self.names = names
+        self.rollouts = rollouts
+        self.horizon = horizon
+        # [without trade, with trade][side] totals over the rollouts
+        self.shares = shares
+        self.worths = worths
+
+    def win_change(self, side) -> float:
+        return (self.shares[1][side] - self.shares[0][side]) / self.rollouts if self.rollouts else 0.0
+
+    def worth_change(self, side) -> float:
+        return (self.worths[1][side] - self.worths[0][side]) / self.rollouts if self.rollouts else 0.0
+
+    def summary(self):
+        if not self.rollouts:
+            return "There was no time to evaluate the trade!"
+        text = f"Trade evaluation over {self.rollouts} playouts of {self.horizon} turns:\n"
+        for (side, name) in enumerate(self.names):
+            text += f"{name}: win chance {100 * self.win_change(side):+.1f}%, net worth " \
+                    f"{self.worth_change(side):+.0f}\n"
+        return text
+
+
+def trade_rollouts(args):
+    """Plays out a game state with and without its pending trade, for evaluate_trade's worker processes."""
+    state, seeds, horizon, deadline = args
+    user_ids = state["pending_trade"][:2]
+    policy = Policy()
+
+    branches = []
+    for option in (None, apply_trade):
+        branch = Game.from_state(state)
+        branch.quiet = True
+        if option is not None:
+            option(branch)
+        branches.append((branch, branch.snapshot(rng=False)))
+
+    shares = [[0.0, 0.0], [0.0, 0.0]]
+    worths = [[0.0, 0.0], [0.0, 0.0]]
+    done = 0
+    for seed in seeds:
+        if time.time() > deadline:
+            break
+        for (i, (branch, snapshot)) in enumerate(branches):
+            branch.restore(snapshot)
+            branch.rng.seed(seed)
+            play_out(branch, policy, horizon)
+            for (side, user_id) in enumerate(user_ids):
+                shares[i][side] += wealth_share(branch, user_id)
+                player = branch.players.get(user_id)
+                worths[i][side] += 0 if player is None else net_worth(player)
+        done += 1
+    return done, shares, worths
+
+
+def new_trade_pool(processes=None):
+    """
+    Start the worker processes evaluate_trade plays its rollouts on. Meant to be called once at startup, before
+    any other threads are started, and kept for good, since starting workers is slow.
+
+    The workers are started fresh (by a fork server, or spawned where there is none) rather than forked from the
+    bot, so they never inherit locks held by its threads. They import the main module, which therefore has to be
+    safe to import (see telegram_interaction).
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        context.set_forkserver_preload(["ai"])
+    return context.Pool(processes)
+
+
+def evaluate_trade(game, pool, rollouts=2000, horizon=40, budget=2.0) -> TradeEvaluation:
+    """
+    Play the game out rollouts times with and without its pending trade, spread over pool (see new_trade_pool).
+    The workers get the game as its state, so the live game is never touched, and they stop once budget seconds
+    have passed.
+    """
+    deadline = time.time() + budget
+    state = game.get_state(events=False)
+    # A few chunks per worker evens out rollouts of very different lengths.
+    chunk_size = max(1, rollouts // ((os.cpu_count() or 1) * 4))
+    shards = [(state, range(first, min(first + chunk_size, rollouts)), horizon, deadline)
+              for first in range(0, rollouts, chunk_size)]
+
+    done = 0
+    shares = [[0.0, 0.0], [0.0, 0.0]]
+    worths = [[0.0, 0.0], [0.0, 0.0]]
+    for (part_done, part_shares, part_worths) in pool.imap_unordered(trade_rollouts, shards):
+        done += part_done
+        for i in range(2):
+            for side in range(2):
+                shares[i][side] += part_shares[i][side]
+                worths[i][side] += part_worths[i][side]
+
+    names = [p.get_name() for p in game.pending_trade.players]
+    return TradeEvaluation(names, done, horizon, shares, worths)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Benchmarks for the hot paths of the game engine. Runs offline, with seeded games and a NullBot.
+
+    python -m benchmarks.bench                                  # print the results as JSON
+    python -m benchmarks.bench --out results.json               # and save them
+    python -m benchmarks.bench --baseline results.json          # compare against an earlier run
+
+With a baseline, every benchmark that got slower by more than --threshold is reported and the exit status is 1.
+"""
+from __future__ import unicode_literals
+
+from typing import Callable, Dict, List, Tuple
+import argparse
+import json
+import platform
+import sys
+import time
+
+from monopoly import COLOR_GROUPS, PROPERTY_POSITIONS, Game, NullBot, Property
+
+PLAYER_COUNTS = [2, 4, 8]
+PHASES = ["early", "built"]
+
+
+def new_game(n_players, phase, seed=0):
+    """
+    A game that sends (and so formats) its messages like a chat game does. In the "built" phase every property is
+    owned, color sets go to one player each in turn, and every set has three houses on it.
+    """
+    players = {user_id: "bench_" + str(user_id) for user_id in range(n_players)}
+    game = Game(seed, players, NullBot(), seed=seed)
+    for p in game.players.values():
+        # Nobody goes bankrupt in the middle of a benchmark.
+        p.add_money(10 ** 9)
+    if phase == "built":
+        owners = list(game.players.values())
+        groups = list(COLOR_GROUPS.values()) + [(p,) for p in PROPERTY_POSITIONS
+                                                if type(game.board[p]) != Property]
+        for (i, positions) in enumerate(groups):
+            owner = owners[i % len(owners)]
+            for position in positions:
+                property = game.board[position]
+                property.set_owner(owner)
+                owner.add_property(property)
+                game.available_properties.remove(property)
+                if type(property) == Property:
+                    property.set_houses(3)
+        for p in owners:
+            p.sort_props_by_color()
+    return game
+
+
+def current_user_id(game):
+    return game.get_player_by_local_id(game.turn).get_user_id()
+
+
+def bench_roll(game):
+    def op():
+        user_id = current_user_id(game)
+        game.roll_dice(user_id)
+        game.pending_payments.clear()
+        game.end_turn(user_id)
+    return op
+
+
+def bench_purchase_house(game):
+    player = game.get_player_by_local_id(game.turn)
+    user_id = player.get_user_id()
+    ids = [str(i) for (i, p) in enumerate(player.get_properties()) if type(p) == Property]
+    if not ids:
+        # Early on this only measures how quickly a purchase is turned down.
+        ids = ["0"]
+
+    def op():
+        game.purchase_house(user_id, ids[:1])
+        game.sell_house(user_id, ids[:1])
+    return op
+
+
+def bench_trade(game):
+    p1 = game.get_player_by_local_id(game.turn)
+    p2 = game.get_player_by_local_id(game.ids[1])
+
+    def op():
+        game.setup_trade(p1.get_user_id(), str(p2.get_id()))
+        game.add_to_trade(p1.get_user_id(), 0 if p1.get_properties() else -1, 10, 0)
+        game.add_to_trade(p2.get_user_id(), 0 if p2.get_properties() else -1, 5, 0)
+        game.agree_to_trade(p1.get_user_id())
+        game.agree_to_trade(p2.get_user_id())
+        game.trade()
+    return op
+
+
+def bench_bankrupt(game):
+    snapshot = game.snapshot()
+    user_id = current_user_id(game)
+
+    def op():
+        game.bankrupt(user_id, "bank")
+        game.restore(snapshot)
+    return op
+
+
+def bench_total_assets(game):
+    players = list(game.players.values())
+
+    def op():
+        for p in players:
+            p.get_total_assets()
+    return op
+
+
+def bench_properties_str(game):
+    players = list(game.players.values())
+
+    def op():
+        for p in players:
+            p.get_properties_str()
+    return op
+
+
+def bench_properties_str_render(game):
+    players = list(game.players.values())
+
+    def op():
+        for p in players:
+            # As if something had changed since the last time, so the table is rendered again.
+            p.version += 1
+            p.get_properties_str()
+    return op
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "roll_dice+end_turn": bench_roll,
+    "purchase_house+sell_house": bench_purchase_house,
+    "trade": bench_trade,
+    "bankrupt+restore": bench_bankrupt,
+    "get_total_assets (all players)": bench_total_assets,
+    "get_properties_str (all players)": bench_properties_str,
+    "get_properties_str uncached (all players)": bench_properties_str_render,
+}
+
+
+def measure(setup, n_players, phase, number, repeat) -> float:
+    """Best time per op in nanoseconds, over repeat runs of number ops, each on a freshly set up game."""
+    times = []
+    for _ in range(repeat):
+        op = setup(new_game(n_players, phase))
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            op()
+        times.append((time.perf_counter_ns() - start) / number)
+    return min(times)
+
+
+def run(number=500, repeat=5, names=None) -> Dict:
+    results = {}
+    for (name, setup) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for n_players in PLAYER_COUNTS:
+            for phase in PHASES:
+                key = f"{name}[{n_players}p,{phase}]"
+                results[key] = {"ns_per_op": round(measure(setup, n_players, phase, number, repeat), 1),
+                                "number": number, "repeat": repeat}
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=0.2) -> List[Tuple[str, float, float]]:
+    """The benchmarks that got slower than baseline by more than threshold, as (name, baseline ns, new ns)."""
+    regressions = []
+    for (name, result) in results["results"].items():
+        old = baseline["results"].get(name)
+        if old is not None and result["ns_per_op"] > old["ns_per_op"] * (1 + threshold):
+            regressions.append((name, old["ns_per_op"], result["ns_per_op"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game engine's hot paths.")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown counted as a regression (0.2 = 20%%)")
+    parser.add_argument("--number", type=int, default=500, help="ops per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark; the best one counts")
+    args = parser.parse_args(argv)
+
+    results = run(args.number, args.repeat)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for (name, old, new) in regressions:
+            print(f"REGRESSION {name}: {old:.0f}ns -> {new:.0f}ns ({new / old - 1:+.0%})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
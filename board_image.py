@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, List, Tuple
+import logging
+import os
+import threading
+
+from PIL import Image, ImageDraw, ImageFont  # type: ignore
+from telegram.error import BadRequest  # type: ignore
+
+LOGGER = logging.getLogger("board_image")
+
+BOARD_IMAGE_PATH = "monopoly_board_org.jpg"
+FILE_ID_PATH = "board_file_id.txt"
+
+
+class BoardImage:
+    """
+    Sends the board picture without reading and uploading the full image every time.
+
+    The first upload goes out as a downscaled, re-encoded copy kept in memory. Telegram's file_id for it is saved
+    to file_id_path, and every later send (including after a restart) only refers to that file_id. If Telegram no
+    longer accepts the file_id, the image is uploaded again.
+    """
+    def __init__(self, path=BOARD_IMAGE_PATH, file_id_path=FILE_ID_PATH, max_size=1024, quality=85):
+        self.path = path
+        self.file_id_path = file_id_path
+        self.max_size = max_size
+        self.quality = quality
+        self.encoded = None
+        self.file_id = None
+        if file_id_path is not None and os.path.exists(file_id_path):
+            with open(file_id_path, "r", encoding="utf-8") as f:
+                self.file_id = f.read().strip() or None
+
+    def get_encoded(self) -> bytes:
+        if self.encoded is None:
+            with Image.open(self.path) as img:
+                img = img.convert("RGB")
+                img.thumbnail((self.max_size, self.max_size))
+                out = BytesIO()
+                img.save(out, format="JPEG", quality=self.quality, optimize=True)
+            self.encoded = out.getvalue()
+        return self.encoded
+
+    def remember(self, file_id):
+        self.file_id = file_id
+        if self.file_id_path is not None:
+            with open(self.file_id_path, "w", encoding="utf-8") as f:
+                f.write(file_id)
+
+    def send(self, bot, chat_id):
+        if self.file_id is not None:
+            try:
+                return bot.send_photo(chat_id=chat_id, photo=self.file_id)
+            except BadRequest as e:
+                LOGGER.warning("Board file_id %s was rejected (%s), uploading it again", self.file_id, e)
+                self.file_id = None
+
+        message = bot.send_photo(chat_id=chat_id, photo=BytesIO(self.get_encoded()))
+        if message is not None and message.photo:
+            # The last size Telegram lists is the largest.
+            self.remember(message.photo[-1].file_id)
+        return message
+
+
+# Board geometry, as fractions of the board picture's width: the corner squares and the squares between them.
+CORNER_SIZE = 199 / 1499
+TILE_SIZE = (1 - 2 * CORNER_SIZE) / 9
+LEGEND_TILE = 40
+
+HOUSE_COLOR = (34, 139, 34)
+HOTEL_COLOR = (200, 30, 30)
+MORTGAGE_COLOR = (70, 70, 70)
+
+
+def tile_box(position, size):
+    """The (left, top, right, bottom) pixel box of a board position, going anticlockwise from Go."""
+    c = round(size * CORNER_SIZE)
+    t = size * TILE_SIZE
+    side, offset = divmod(position, 10)
+    if offset == 0:
+        corners = [(size - c, size - c), (0, size - c), (0, 0), (size - c, 0)]
+        x, y = corners[side]
+        return (x, y, x + c, y + c)
+
+    near = round(c + (offset - 1) * t)
+    far = round(c + offset * t)
+    if side == 0:
+        return (size - far, size - c, size - near, size)
+    if side == 1:
+        return (0, size - far, c, size - near)
+    if side == 2:
+        return (near, 0, far, c)
+    return (size - c, near, size, far)
+
+
+def legend_box(size):
+    c = round(size * CORNER_SIZE)
+    return (c + c // 4, c + c // 4, size - c - c // 4, 3 * c)
+
+
+def load_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Older Pillow only has the fixed size bitmap font.
+        return ImageFont.load_default()
+
+
+class BoardRenderer:
+    """
+    Draws the state of games onto the board picture: owners, houses, hotels, mortgages, player tokens and a legend.
+
+    The decoded board is kept in memory and shared by every game. Each game also keeps its own canvas along with
+    the state of every tile when it was last drawn, so a render only redraws the tiles that changed since then.
+    The encoded JPEGs are cached by game state, so asking again without anything changing is a dict lookup, and so
+    are the file_ids Telegram gives them once sent: showing a board that was sent before doesn't upload it again.
+    """
+    def __init__(self, path=BOARD_IMAGE_PATH, max_size=1024, quality=80, max_canvases=32, max_encoded=256):
+        self.path = path
+        self.max_size = max_size
+        self.quality = quality
+        self.max_canvases = max_canvases
+        self.max_encoded = max_encoded
+        self.base = None
+        self.font = None
+        self.canvases: "OrderedDict[object, Tuple[Image.Image, List]]" = OrderedDict()
+        self.encoded: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self.file_ids: "OrderedDict[Tuple, str]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_base(self):
+        if self.base is None:
+            with Image.open(self.path) as img:
+                img = img.convert("RGB")
+                img.thumbnail((self.max_size, self.max_size))
+                self.base = img
+            self.font = load_font(max(10, self.base.width // 50))
+        return self.base
+
+    def tile_states(self, game) -> List[Tuple]:
+        tokens: Dict[int, List[Tuple]] = {}
+        for p in sorted(game.players.values(), key=lambda p: p.get_id()):
+            tokens.setdefault(p.get_position(), []).append(
+                (p.get_icon_color(), p.get_turns_left_in_jail() != -1))
+
+        states = []
+        for (position, square) in enumerate(game.board):
+            if isinstance(square, str):
+                states.append((None, 0, 0, False, tuple(tokens.get(position, ()))))
+                continue
+            owner = square.get_owner()
+            states.append((
+                None if owner is None else owner.get_icon_color(),
+                getattr(square, "houses", 0),
+                getattr(square, "hotels", 0),
+                square.get_mortgaged(),
+                tuple(tokens.get(position, ())),
+            ))
+        states.append(tuple((p.get_id(), p.get_name(), p.get_icon_color(), p.get_money())
+                            for p in sorted(game.players.values(), key=lambda p: p.get_id())))
+        return states
+
+    def render(self, game) -> bytes:
+        """The JPEG encoded board for the current state of game."""
+        states = self.tile_states(game)
+        return self.render_states(game.chat_id, states, tuple(states))
+
+    def send(self, outbox, game):
+        """
+        Queue the board for the current state of game in outbox (see MessageOutbox.send_photo), as its file_id if it
+        was sent before.
+        """
+        states = self.tile_states(game)
+        key = tuple(states)
+        with self.lock:
+            file_id = self.file_ids.get(key)
+            if file_id is not None:
+                self.file_ids.move_to_end(key)
+        if file_id is not None:
+            outbox.send_photo(game.chat_id, file_id, on_sent=lambda message: self.remember(key, file_id, message))
+        else:
+            outbox.send_photo(game.chat_id, self.render_states(game.chat_id, states, key),
+                              on_sent=lambda message: self.remember(key, None, message))
+
+    def remember(self, key, file_id, message):
+        """Note the file_id of a sent board, or forget one Telegram refused so that the next send uploads it again."""
+        with self.lock:
+            if message is not None and message.photo:
+                # The last size Telegram lists is the largest.
+                self.file_ids[key] = message.photo[-1].file_id
+                while len(self.file_ids) > self.max_encoded:
+                    self.file_ids.popitem(last=False)
+            elif file_id is not None and self.file_ids.get(key) == file_id:
+                del self.file_ids[key]
+
+    def render_states(self, chat_id, states, key) -> bytes:
+        with self.lock:
+            cached = self.encoded.get(key)
+            if cached is not None:
+                self.encoded.move_to_end(key)
+                return cached
+
+            base = self.get_base()
+            if chat_id in self.canvases:
+                canvas, drawn = self.canvases.pop(chat_id)
+            else:
+                canvas, drawn = base.copy(), [None] * len(states)
+
+            draw = ImageDraw.Draw(canvas)
+            for (position, state) in enumerate(states):
+                if state != drawn[position]:
+                    self.draw_tile(canvas, draw, position, state)
+                    drawn[position] = state
+
+            self.canvases[chat_id] = (canvas, drawn)
+            while len(self.canvases) > self.max_canvases:
+                self.canvases.popitem(last=False)
+
+            out = BytesIO()
+            canvas.save(out, format="JPEG", quality=self.quality)
+            encoded = out.getvalue()
+            self.encoded[key] = encoded
+            while len(self.encoded) > self.max_encoded:
+                self.encoded.popitem(last=False)
+            return encoded
+
+    def draw_tile(self, canvas, draw, position, state):
+        size = canvas.width
+        box = legend_box(size) if position == LEGEND_TILE else tile_box(position, size)
+        # Start from the plain board so whatever was drawn here before is gone.
+        canvas.paste(self.base.crop(box), box[:2])
+
+        if position == LEGEND_TILE:
+            self.draw_legend(draw, box, state)
+            return
+
+        (left, top, right, bottom) = box
+        width = right - left
+        height = bottom - top
+        unit = max(2, min(width, height) // 8)
+        owner_color, houses, hotels, mortgaged, tokens = state
+
+        if owner_color is not None:
+            draw.rectangle((left, top, right - 1, bottom - 1), outline=owner_color, width=max(2, unit // 2))
+        if mortgaged:
+            draw.line((left, top, right - 1, bottom - 1), fill=MORTGAGE_COLOR, width=max(1, unit // 3))
+            draw.line((left, bottom - 1, right - 1, top), fill=MORTGAGE_COLOR, width=max(1, unit // 3))
+
+        for i in range(houses):
+            x = left + unit // 2 + i * (unit + unit // 3)
+            draw.rectangle((x, top + unit // 2, x + unit, top + unit // 2 + unit), fill=HOUSE_COLOR, outline="black")
+        if hotels:
+            x = left + unit // 2
+            draw.rectangle((x, top + unit // 2, x + 3 * unit, top + unit // 2 + unit), fill=HOTEL_COLOR,
+                           outline="black")
+
+        token = 2 * unit
+        for (i, (color, jailed)) in enumerate(tokens):
+            row, col = divmod(i, 3)
+            x = left + unit // 2 + col * (token + unit // 2)
+            y = bottom - unit // 2 - (row + 1) * (token + unit // 3)
+            if jailed:
+                draw.rectangle((x, y, x + token, y + token), fill=color, outline="black", width=2)
+            else:
+                draw.ellipse((x, y, x + token, y + token), fill=color, outline="black", width=2)
+
+    def draw_legend(self, draw, box, players):
+        (left, top, right, bottom) = box
+        line_height = (bottom - top) // 8
+        if players:
+            draw.rectangle((left, top, right - 1, top + len(players) * line_height), fill="white")
+        for (i, (id, name, color, money)) in enumerate(players):
+            y = top + i * line_height
+            draw.rectangle((left, y, left + line_height * 2 // 3, y + line_height * 2 // 3), fill=color,
+                           outline="black")
+            draw.text((left + line_height, y), f"({id}) {name} ${money}", fill="black", font=self.font)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger("chat_executor")
+
+
+class ChatExecutor:
+    """
+    Runs tasks on a pool of worker threads. Tasks for the same chat run one at a time, in the order they were
+    submitted, so a chat's game is only ever touched by one thread. Tasks for different chats run in parallel.
+
+    Chats with work waiting take turns, one task each, so a busy chat can't starve the others. Once max_pending
+    tasks are waiting, submit blocks until there is room again, which pushes back on whoever feeds the executor.
+    """
+    def __init__(self, workers=8, max_pending=10000, on_error: Optional[Callable] = None, start=True):
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.tasks: Dict[int, Deque[Callable]] = {}
+        # Chats that have tasks waiting and aren't being worked on.
+        self.ready: Deque[int] = deque()
+        self.running = 0
+        self.pending = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.threads = [threading.Thread(target=self.run, name="chat-worker-%d" % i, daemon=True)
+                        for i in range(workers)]
+        if start:
+            for t in self.threads:
+                t.start()
+
+    def submit(self, chat_id, func, *args):
+        with self.cond:
+            while self.pending >= self.max_pending and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                raise RuntimeError("The executor has been closed")
+            queue = self.tasks.get(chat_id)
+            if queue is None:
+                # The chat isn't waiting or being worked on, so it's up next.
+                queue = self.tasks[chat_id] = deque()
+                self.ready.append(chat_id)
+            queue.append(lambda: func(*args))
+            self.pending += 1
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.ready:
+                    if self.closed:
+                        return
+                    self.cond.wait()
+                chat_id = self.ready.popleft()
+                task = self.tasks[chat_id].popleft()
+                self.pending -= 1
+                self.running += 1
+                self.cond.notify_all()
+
+            try:
+                task()
+            except Exception as e:
+                LOGGER.exception("Task for chat %s failed", chat_id)
+                if self.on_error is not None:
+                    self.on_error(chat_id, e)
+
+            with self.cond:
+                self.running -= 1
+                if self.tasks[chat_id]:
+                    self.ready.append(chat_id)
+                else:
+                    del self.tasks[chat_id]
+                self.cond.notify_all()
+
+    def wait_until_idle(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.pending or self.running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """Finish the tasks already submitted (for up to timeout seconds), then stop the workers."""
+        self.wait_until_idle(timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Set
+import threading
+import time
+
+
+def new_chat_data():
+    return {"is_game_pending": False, "pending_players": {}, "bots": {}, "game_obj": None}
+
+
+class GameRegistry:
+    """
+    Holds the pending players and the running game of every chat the bot is in, keyed by chat_id.
+
+    Every chat is saved to store (a GameStore) after it changes, so chats in memory are only a cache. Chats are
+    kept in least recently used order. Whenever a chat is looked up, the chats that have been idle for longer than
+    idle_timeout seconds, or that don't fit in max_resident, are dropped from memory. They are loaded back from
+    the store the next time they are looked up.
+
+    The registry can be used from several threads. Chats that are in_use are never evicted, so a chat that is
+    being worked on can't be dropped before its changes are saved. Chats are loaded and saved outside the lock, so
+    only lookups of the chat that is being loaded or evicted wait for it.
+    """
+    def __init__(self, bot, store, max_resident=1000, idle_timeout=60 * 60):
+        self.bot = bot
+        self.store = store
+        self.max_resident = max_resident
+        self.idle_timeout = idle_timeout
+        self.chats: "OrderedDict[int, Dict]" = OrderedDict()
+        self.last_used: Dict[int, float] = {}
+        self.users: Dict[int, int] = {}
+        # Chats being loaded or evicted. The store is only used outside the lock, so a chat stays busy (and anyone
+        # else looking it up waits for done) until it is in chats, or gone from them.
+        self.busy: Set[int] = set()
+        self.lock = threading.RLock()
+        self.done = threading.Condition(self.lock)
+
+    def __len__(self):
+        return len(self.chats)
+
+    def __contains__(self, chat_id):
+        with self.lock:
+            return chat_id in self.chats or chat_id in self.store
+
+    @contextmanager
+    def in_use(self, chat_id):
+        with self.lock:
+            self.users[chat_id] = self.users.get(chat_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.users[chat_id] -= 1
+                if not self.users[chat_id]:
+                    del self.users[chat_id]
+
+    def get(self, chat_id):
+        victims = []
+        with self.lock:
+            while chat_id in self.busy:
+                self.done.wait()
+            chat_data = self.chats.get(chat_id)
+            if chat_data is None:
+                self.busy.add(chat_id)
+            else:
+                self.chats.move_to_end(chat_id)
+                self.last_used[chat_id] = time.time()
+                victims = self.claim_victims(keep=chat_id)
+
+        if chat_data is None:
+            # Loading decodes the chat and rebuilds its game, which the other chats don't have to wait for.
+            try:
+                chat_data = self.store.load(chat_id, self.bot)
+                if chat_data is None:
+                    chat_data = new_chat_data()
+            finally:
+                with self.lock:
+                    self.busy.discard(chat_id)
+                    self.done.notify_all()
+                    if chat_data is not None:
+                        self.chats[chat_id] = chat_data
+                        self.last_used[chat_id] = time.time()
+                        victims = self.claim_victims(keep=chat_id)
+
+        self.evict_claimed(victims)
+        return chat_data
+
+    def save(self, chat_id):
+        with self.lock:
+            chat_data = self.chats.get(chat_id)
+        if chat_data is not None:
+            self.store.save(chat_id, chat_data)
+
+    def claim_victims(self, keep=None):
+        """
+        The chats (as (chat_id, chat_data)) that have been idle for too long or don't fit, marked busy so nobody
+        uses them while they are evicted. Has to be called with the lock held.
+        """
+        now = time.time()
+        # Chats that other threads are already evicting will be gone soon.
+        resident = len(self.chats) - sum(1 for chat_id in self.busy if chat_id in self.chats)
+        victims = []
+        for (chat_id, chat_data) in self.chats.items():
+            if resident - len(victims) <= self.max_resident and now - self.last_used[chat_id] < self.idle_timeout:
+                break
+            if chat_id != keep and chat_id not in self.users and chat_id not in self.busy:
+                victims.append((chat_id, chat_data))
+        self.busy.update(chat_id for (chat_id, _) in victims)
+        return victims
+
+    def evict_claimed(self, victims):
+        """Save the claimed chats, outside the lock, and drop them from memory. Chats that failed to save stay."""
+        saved = []
+        try:
+            for (chat_id, chat_data) in victims:
+                self.store.save(chat_id, chat_data)
+                saved.append(chat_id)
+        finally:
+            with self.lock:
+                for chat_id in saved:
+                    self.chats.pop(chat_id)
+                    self.last_used.pop(chat_id, None)
+                for (chat_id, _) in victims:
+                    self.busy.discard(chat_id)
+                self.done.notify_all()
+
+    def evict_idle(self, keep=None):
+        with self.lock:
+            victims = self.claim_victims(keep)
+        self.evict_claimed(victims)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import weakref
+
+from monopoly import Game
+
+LOGGER = logging.getLogger("game_store")
+
+
+def encode_chat_data(chat_data, game_state=True) -> Optional[Dict]:
+    """
+    Chat data as JSON-compatible values, or None for a chat with nothing going on. The game is left out (as None)
+    unless game_state is True.
+    """
+    game = chat_data.get("game_obj")
+    if game is None and not chat_data.get("is_game_pending", False):
+        return None
+    return {
+        "is_game_pending": chat_data.get("is_game_pending", False),
+        # JSON object keys are strings, so keep the user ids in pairs.
+        "pending_players": [[user_id, name] for (user_id, name) in chat_data.get("pending_players", {}).items()],
+        "bots": [[user_id, difficulty] for (user_id, difficulty) in chat_data.get("bots", {}).items()],
+        "game": None if game is None or not game_state else game.get_state(),
+    }
+
+
+def decode_chat_data(data, bot=None):
+    return {
+        "is_game_pending": data["is_game_pending"],
+        "pending_players": {user_id: name for (user_id, name) in data["pending_players"]},
+        "bots": {user_id: difficulty for (user_id, difficulty) in data.get("bots", [])},
+        "game_obj": None if data["game"] is None else Game.from_state(data["game"], bot),
+    }
+
+
+class GameStore:
+    """
+    Append-only log of chat states.
+
+    A save appends one line for the chat. Usually that is "<chat_id>\\t<json>", holding the whole state of the
+    chat. But when the chat's game is recording and has only played on since the chat was last saved or loaded, it
+    is "<chat_id>\\t+<json>", holding just the events logged since, which are played back on the state before
+    them when the chat is loaded. Since a game's event log is cut back to a checkpoint every MAX_EVENTS events,
+    which then gets saved in full, loading never plays back more than that.
+
+    An index from chat_id to the positions of its latest full line and the event lines after it is built when the
+    log is opened, without decoding any of the states. A chat's state is only read when it is loaded. Once the log
+    holds enough superseded lines, it is compacted on a background thread, keeping only the latest lines of every
+    chat.
+    """
+    def __init__(self, path="games.log", compact_ratio=4, min_compact_size=1 << 20, fsync=False):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.min_compact_size = min_compact_size
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        # chat_id -> (offset, length) of the chat's latest full line and of the event lines after it
+        self.index: Dict[int, List[Tuple[int, int]]] = {}
+        # Hash of the latest line saved for a chat in this run, to skip saving a chat that didn't change.
+        self.saved_hashes: Dict[int, int] = {}
+        # Recording games saved or loaded in this run -> (chat_id, length of the saved event log, its first and last
+        # event, hash of the rest of the chat data), to tell whether just the new events can be saved.
+        self.saved_logs: "weakref.WeakKeyDictionary[Game, Tuple]" = weakref.WeakKeyDictionary()
+        self.live_size = 0
+        self.compacting = False
+        self.compaction_thread: Optional[threading.Thread] = None
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.index, self.live_size = self.scan(f, 0)
+        self.file = open(path, "ab+")
+
+    def scan(self, f, offset):
+        index: Dict[int, List[Tuple[int, int]]] = {}
+        live_size = 0
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A partial line left behind by a crash.
+                LOGGER.warning("Ignoring incomplete record at offset %d of %s", offset, self.path)
+                break
+            tab = line.index(b"\t")
+            chat_id = int(line[:tab])
+            if line[tab + 1:tab + 2] != b"+":
+                if chat_id in index:
+                    live_size -= sum(length for (_, length) in index[chat_id])
+                index[chat_id] = [(offset, len(line))]
+                live_size += len(line)
+            elif chat_id in index:
+                index[chat_id].append((offset, len(line)))
+                live_size += len(line)
+            else:
+                LOGGER.warning("Ignoring events without a state at offset %d of %s", offset, self.path)
+            offset += len(line)
+        return index, live_size
+
+    def __contains__(self, chat_id):
+        with self.lock:
+            return chat_id in self.index
+
+    def __len__(self):
+        with self.lock:
+            return len(self.index)
+
+    def rest_hash(self, chat_data) -> int:
+        """Hash of the chat data apart from the game."""
+        return hash(json.dumps(encode_chat_data(chat_data, game_state=False), separators=(",", ":")))
+
+    def remember_log(self, chat_id, chat_data):
+        game = chat_data.get("game_obj")
+        if game is not None and game.events is not None:
+            self.saved_logs[game] = (chat_id, len(game.events), game.events[0], game.events[-1],
+                                     self.rest_hash(chat_data))
+
+    def new_events(self, chat_id, chat_data) -> Optional[List]:
+        """The events the chat's game logged since it was last saved or loaded, if that is all that changed."""
+        game = chat_data.get("game_obj")
+        if game is None or game.events is None or game not in self.saved_logs:
+            return None
+        (saved_chat_id, length, first, last, rest_hash) = self.saved_logs[game]
+        events = game.events
+        # A checkpoint replaces the first event and a restore cuts the log, so the saved events are still there
+        # only if the first and last of them are.
+        if saved_chat_id != chat_id or len(events) < length or events[0] is not first or \
+                events[length - 1] is not last or self.rest_hash(chat_data) != rest_hash:
+            return None
+        return events[length:]
+
+    def save(self, chat_id, chat_data):
+        events = self.new_events(chat_id, chat_data)
+        if events is not None:
+            if not events:
+                return
+            data = None
+            line = str(chat_id) + "\t+" + json.dumps(events, separators=(",", ":"), ensure_ascii=False) + "\n"
+        else:
+            data = encode_chat_data(chat_data)
+            line = str(chat_id) + "\t" + json.dumps(data, separators=(",", ":"), ensure_ascii=False) + "\n"
+        line = line.encode("utf-8")
+
+        with self.lock:
+            if events is None:
+                if data is None and chat_id not in self.index:
+                    return
+                if self.saved_hashes.get(chat_id) == hash(line):
+                    return
+                self.saved_hashes[chat_id] = hash(line)
+            else:
+                # The chat's latest full line is no longer its state.
+                self.saved_hashes.pop(chat_id, None)
+
+            self.file.seek(0, os.SEEK_END)
+            offset = self.file.tell()
+            self.file.write(line)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+
+            if events is not None:
+                self.index[chat_id].append((offset, len(line)))
+            else:
+                if chat_id in self.index:
+                    self.live_size -= sum(length for (_, length) in self.index[chat_id])
+                self.index[chat_id] = [(offset, len(line))]
+            self.live_size += len(line)
+            self.remember_log(chat_id, chat_data)
+            self.maybe_compact(offset + len(line))
+
+    def read_lines(self, chat_id) -> List[bytes]:
+        lines = []
+        for (offset, length) in self.index[chat_id]:
+            self.file.seek(offset)
+            lines.append(self.file.read(length))
+        return lines
+
+    def load(self, chat_id, bot=None):
+        """The chat's saved chat data, or None if nothing is saved for it."""
+        with self.lock:
+            if chat_id not in self.index:
+                return None
+            lines = self.read_lines(chat_id)
+        data = json.loads(lines[0][lines[0].index(b"\t") + 1:].decode("utf-8"))
+        if data is None:
+            return None
+        chat_data = decode_chat_data(data, bot)
+        for line in lines[1:]:
+            chat_data["game_obj"].play_back(json.loads(line[line.index(b"\t") + 2:].decode("utf-8")))
+        with self.lock:
+            self.remember_log(chat_id, chat_data)
+        return chat_data
+
+    def maybe_compact(self, size):
+        if self.compacting or size < self.min_compact_size or size < self.compact_ratio * self.live_size:
+            return
+        self.compacting = True
+        self.compaction_thread = threading.Thread(target=self.compact, name="game-store-compaction", daemon=True)
+        self.compaction_thread.start()
+
+    def compact(self):
+        """Rewrite the log with only the latest lines of every chat. Saves can carry on while this runs."""
+        tmp_path = self.path + ".compact"
+        try:
+            with self.lock:
+                self.file.seek(0, os.SEEK_END)
+                end = self.file.tell()
+                entries = sorted(entry for lines in self.index.values() for entry in lines)
+
+            # Lines before end never change, so they can be copied without holding the lock.
+            with open(self.path, "rb") as old, open(tmp_path, "wb") as new:
+                for (offset, length) in entries:
+                    old.seek(offset)
+                    line = old.read(length)
+                    # Chats without a game don't need to be kept around.
+                    if not line.endswith(b"\tnull\n"):
+                        new.write(line)
+
+            with self.lock:
+                # Whatever was saved in the meantime goes after the copied lines.
+                self.file.seek(end)
+                tail = self.file.read()
+                with open(tmp_path, "ab") as new:
+                    new.write(tail)
+                    new.flush()
+                    os.fsync(new.fileno())
+                self.file.close()
+                os.replace(tmp_path, self.path)
+                self.file = open(self.path, "ab+")
+                self.index, self.live_size = self.scan(self.file, 0)
+        finally:
+            self.compacting = False
+
+    def close(self):
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from monopoly import (BACK_THREE, CHANCE, CHANCE_CARDS, CHANCE_MOVES, COMMUNITY_CHEST, COMMUNITY_CHEST_CARDS,
+                      COMMUNITY_CHEST_MOVES, GO_TO_JAIL, JAIL_POSITION, SQUARE_TYPES, TO_JAIL, Property,
+                      OtherProperty)
+
+# Long-run landing probabilities, modelled as a Markov chain over rolls.
+#
+# There is a state for each of the 40 squares, plus one for each number of turns a jailed player has left
+# (Player.turns_left_in_jail). Each roll moves the chain along according to the rules in Game.roll_dice,
+# Game.enact_roll_result and the movement cards in CHANCE_MOVES and COMMUNITY_CHEST_MOVES:
+#  - A jailed player who rolls doubles gets out without moving and rolls again.
+#  - A jailed player who doesn't roll doubles loses one of their turns left, and moves normally once they're out.
+#  - The bot doesn't send players to jail for three doubles in a row, so doubles don't matter otherwise.
+
+BOARD_SIZE = len(SQUARE_TYPES)
+JAIL_TURNS = 3
+STATE_COUNT = BOARD_SIZE + JAIL_TURNS + 1
+
+# The cards of each deck, and how many of them there are.
+CARD_DECKS = {CHANCE: (CHANCE_MOVES, CHANCE_CARDS), COMMUNITY_CHEST: (COMMUNITY_CHEST_MOVES, COMMUNITY_CHEST_CARDS)}
+
+DICE_SUMS = [(d1 + d2, d1 == d2, 1 / 36) for d1 in range(1, 7) for d2 in range(1, 7)]
+
+
+def jail_state(turns_left):
+    return BOARD_SIZE + turns_left
+
+
+def resolve_landing(position) -> List[Tuple[int, float]]:
+    """The states a player who landed on position ends up in, once any card moves have been applied."""
+    square_type = SQUARE_TYPES[position]
+    if square_type == GO_TO_JAIL:
+        return [(jail_state(JAIL_TURNS), 1.0)]
+    if square_type not in CARD_DECKS:
+        return [(position, 1.0)]
+
+    (moves, cards) = CARD_DECKS[square_type]
+    outcomes = [(position, (cards - len(moves)) / cards)]
+    for move in moves.values():
+        if move == TO_JAIL:
+            outcomes.append((jail_state(JAIL_TURNS), 1 / cards))
+        elif move == BACK_THREE:
+            outcomes += [(state, p / cards) for (state, p) in resolve_landing((position - 3) % BOARD_SIZE)]
+        else:
+            # Moving forward to a square runs its landing rules too, but none of the targets draws a card.
+            outcomes.append((move, 1 / cards))
+    return outcomes
+
+
+@lru_cache(maxsize=1)
+def solve() -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the landing probability of every square per roll, and the mean dice sum of the rolls that land on
+    each square (what utility rent is based on).
+    """
+    transitions = np.zeros((STATE_COUNT, STATE_COUNT))
+    # Probability mass of landing on a square straight from the dice, weighted by the dice sum.
+    roll_weight = np.zeros((STATE_COUNT, BOARD_SIZE))
+
+    for position in range(BOARD_SIZE):
+        for (total, _, p) in DICE_SUMS:
+            target = (position + total) % BOARD_SIZE
+            for (state, q) in resolve_landing(target):
+                transitions[position, state] += p * q
+            roll_weight[position, target] += p * total
+
+    for turns_left in range(1, JAIL_TURNS + 1):
+        for (_, doubles, p) in DICE_SUMS:
+            if doubles:
+                transitions[jail_state(turns_left), JAIL_POSITION] += p
+            else:
+                transitions[jail_state(turns_left), jail_state(turns_left - 1)] += p
+    # With no turns left in jail the next roll moves the player normally.
+    transitions[jail_state(0)] = transitions[JAIL_POSITION]
+    roll_weight[jail_state(0)] = roll_weight[JAIL_POSITION]
+
+    # Solve pi = pi P together with sum(pi) = 1.
+    a = transitions.T - np.eye(STATE_COUNT)
+    a[-1] = 1.0
+    b = np.zeros(STATE_COUNT)
+    b[-1] = 1.0
+    stationary = np.linalg.solve(a, b)
+
+    landing = stationary[:BOARD_SIZE].copy()
+    landing[JAIL_POSITION] += stationary[BOARD_SIZE:].sum()
+
+    direct = stationary @ roll_weight
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_roll = np.where(landing > 0, direct / landing, 0.0)
+    return landing, mean_roll
+
+
+def landing_probabilities(board) -> np.ndarray:
+    """
+    Long-run probability of a roll ending on each square of board (e.g. Game.board). Every board has the layout
+    of monopoly.BOARD_LAYOUT, so the chain only needs solving once.
+    """
+    return solve()[0]
+
+
+def property_rent(game, property, roll_sum) -> float:
+    """The rent Game.enact_roll_result would charge for landing on property with the current ownership."""
+    owner = property.get_owner()
+    if owner is None or property.get_mortgaged():
+        return 0
+
+    if type(property) == Property:
+        rent = property.get_rent()
+        if owner.has_color_set(property.get_color()):
+            rent += property.get_base_rent()
+        return rent
+
+    count = owner.get_unmortgaged_count(property.get_type())
+    if property.get_type() == "Railroad":
+        return property.get_rent() * 2 ** (count - 1)
+    return (10 if count == 2 else 4) * roll_sum
+
+
+def expected_rents(game) -> Dict[str, float]:
+    """
+    Expected rent per roll for every property on the board, given the game's current owners, houses, hotels and
+    mortgages. Unowned and mortgaged properties earn nothing.
+    """
+    landing, mean_roll = solve()
+    rents = {}
+    for (position, square) in enumerate(game.board):
+        if isinstance(square, (Property, OtherProperty)):
+            rents[square.get_name()] = float(landing[position] * property_rent(game, square, mean_roll[position]))
+    return rents
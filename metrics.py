@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+import functools
+import threading
+import time
+
+PREFIX = "monopoly_"
+
+
+class Summary:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+
+class MetricsRegistry:
+    """
+    In-process counters and summaries (count and sum, with the max as a separate gauge named <summary>_max), keyed
+    by name and labels, rendered in Prometheus' text format.
+
+    While a command is being handled (see measure), time and counts added with note on the same thread are
+    collected for that command, e.g. the time spent in the game and in Telegram requests.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.summaries: Dict[Tuple[str, Tuple], Summary] = {}
+        self.local = threading.local()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary()
+            summary.observe(value)
+
+    def note(self, section, amount):
+        """Add to section of the command being handled on this thread, if any."""
+        sections = getattr(self.local, "sections", None)
+        if sections is not None:
+            sections[section] = sections.get(section, 0) + amount
+
+    def measure(self, command, func, *args):
+        """Call func, recording its wall time, errors and whatever was noted meanwhile under command."""
+        outer = getattr(self.local, "sections", None)
+        self.local.sections = sections = {}
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception:
+            self.inc("command_errors_total", command=command)
+            raise
+        finally:
+            self.observe("command_seconds", time.perf_counter() - start, command=command)
+            self.local.sections = outer
+            self.inc("commands_total", command=command)
+            for (section, amount) in sections.items():
+                if section.endswith("_seconds"):
+                    self.observe("command_" + section, amount, command=command)
+                else:
+                    self.inc("command_" + section + "_total", amount, command=command)
+
+    def render(self) -> str:
+        with self.lock:
+            counters = sorted(self.counters.items())
+            summaries = sorted((key, (s.count, s.total, s.max)) for (key, s) in self.summaries.items())
+
+        lines: List[str] = []
+        typed = set()
+        for ((name, labels), value) in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}{format_labels(labels)} {value:g}")
+        for ((name, labels), (count, total, _)) in summaries:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} summary")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {count}")
+            lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {total:.6f}")
+        for ((name, labels), (_, _, maximum)) in summaries:
+            if name + "_max" not in typed:
+                lines.append(f"# TYPE {PREFIX}{name}_max gauge")
+                typed.add(name + "_max")
+            lines.append(f"{PREFIX}{name}_max{format_labels(labels)} {maximum:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for (k, v) in labels) \
+        + "}"
+
+
+def time_methods(cls, names, section, registry):
+    """
+    Note the time spent in the listed methods of cls under section (e.g. "game_seconds"). Calls made from within
+    another of them are only counted once.
+    """
+    local = threading.local()
+
+    def timed(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(local, "depth", 0):
+                return func(*args, **kwargs)
+            local.depth = 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                local.depth = 0
+                registry.note(section, time.perf_counter() - start)
+        return wrapper
+
+    for name in names:
+        setattr(cls, name, timed(getattr(cls, name)))
+
+
+class TimedBot:
+    """
+    Passes everything through to bot, timing the requests that send something to a chat.
+
+    Every request is recorded under telegram_request_seconds. Only requests made while a command is being handled
+    on the same thread also count towards that command's send_seconds. Messages that go through a MessageOutbox are
+    sent on its own threads once the command is done, so their time isn't charged to any command.
+    """
+    SENDING = {"send_message", "send_photo"}
+
+    def __init__(self, bot, registry):
+        self.bot = bot
+        self.registry = registry
+
+    def __getattr__(self, name):
+        if name == "bot":
+            raise AttributeError(name)
+        attr = getattr(self.bot, name)
+        if name not in self.SENDING:
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                self.registry.inc("telegram_errors_total", method=name)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                self.registry.observe("telegram_request_seconds", elapsed, method=name)
+                self.registry.note("send_seconds", elapsed)
+        return timed
+
+
+class CountedOutbox:
+    """Passes everything through to outbox, counting the messages sent under "messages"."""
+    def __init__(self, outbox, registry):
+        self.outbox = outbox
+        self.registry = registry
+
+    def __getattr__(self, name):
+        if name == "outbox":
+            raise AttributeError(name)
+        return getattr(self.outbox, name)
+
+    def send_message(self, *args, **kwargs):
+        self.registry.note("messages", 1)
+        return self.outbox.send_message(*args, **kwargs)
+
+
+def serve(registry, port=9877, host="127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the metrics at http://host:port/metrics from a background thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+METRICS = MetricsRegistry()
@@ -2,22 +2,29 @@
 #!/usr/bin/env python3
 from __future__ import unicode_literals
 
+from collections import deque
 from typing import Dict, List, Optional, Tuple
+import functools
 import random
+import unicodedata
 
-from PIL import Image, ImageDraw  # type: ignore
 from colorhash import ColorHash  # type: ignore
-import prettytable  # type: ignore
 import telegram  # type: ignore
 from telegram.error import TelegramError  # type: ignore
 
+# When set, get_total_assets checks its running totals against the properties (see Player.check_assets). The
+# tests turn it on.
+CHECK_ASSETS = False
+
+
 class Dice:
-    def __init__(self, dice_count, sides):
+    def __init__(self, dice_count, sides, rng=random):
         self.dice_count = dice_count
         self.sides = sides
+        self.rng = rng
 
     def roll(self):
-        return [random.randint(1, self.sides) for _ in range(self.dice_count)]
+        return [self.rng.randint(1, self.sides) for _ in range(self.dice_count)]
 
     def check_doubles(self, roll):
         if len(roll) == 2:
@@ -27,6 +34,11 @@ class Dice:
 
 
 class Player:
+    # Slots instead of a __dict__ keep the many resident (and simulated) games small.
+    __slots__ = ("properties", "money", "get_out_free_cards", "turns_left_in_jail", "id", "name", "position",
+                 "user_id", "total_roll", "icon_color", "color_counts", "unmortgaged_type_counts", "names",
+                 "first_words", "names_stale", "version", "properties_str", "property_assets")
+
     def __init__(self, user_id, id, name, money):
         self.properties = []
         self.money = money
@@ -37,7 +49,23 @@ class Player:
         self.position = 0
         self.user_id = user_id
         self.total_roll = 0
-        self.icon_color = ColorHash(name).rgb
+        # Worked out on first use, since most games (simulations in particular) never draw the board.
+        self.icon_color: Optional[Tuple[int, int, int]] = None
+        # Kept up to date by add_property/remove_property (and OtherProperty.set_mortgaged), so that monopoly
+        # and railroad/utility checks don't have to go through all the properties.
+        self.color_counts: Dict[str, int] = {}
+        self.unmortgaged_type_counts: Dict[str, int] = {}
+        # Name lookups, keyed by full lower case name and by lower case first word, mapping to
+        # (index in properties, property). Rebuilt on the next lookup after the property list changes.
+        self.names: Dict[str, Tuple[int, "Property"]] = {}
+        self.first_words: Dict[str, Tuple[int, "Property"]] = {}
+        self.names_stale = False
+        # Bumped by every change to the properties or what's on them (see Property.changed), so that renderings of
+        # them can be cached. properties_str is (version, text).
+        self.version = 0
+        self.properties_str: Optional[Tuple[int, str]] = None
+        # What the properties add to get_total_assets, kept up to date like version.
+        self.property_assets = 0
 
     def __repr__(self):
         return f"Player: {self.name}[{self.id}] ${self.money} @{self.position}"
@@ -71,53 +99,72 @@ class Player:
 
     def add_property(self, property):
         self.properties.append(property)
+        self.update_counts(property, 1)
+        self.names_stale = True
+        self.version += 1
+        self.property_assets += property.get_asset_value()
 
     def remove_property(self, property):
         if property in self.properties:
             self.properties.remove(property)
+            self.update_counts(property, -1)
+            self.names_stale = True
+            self.version += 1
+            self.property_assets -= property.get_asset_value()
+
+    def update_counts(self, property, change):
+        if type(property) == Property:
+            color = property.get_color()
+            self.color_counts[color] = self.color_counts.get(color, 0) + change
+        elif not property.get_mortgaged():
+            prop_type = property.get_type()
+            self.unmortgaged_type_counts[prop_type] = self.unmortgaged_type_counts.get(prop_type, 0) + change
+
+    def rebuild_counts(self):
+        self.color_counts = {}
+        self.unmortgaged_type_counts = {}
+        for p in self.properties:
+            self.update_counts(p, 1)
+        self.names_stale = True
+        self.version += 1
+        self.property_assets = sum(p.get_asset_value() for p in self.properties)
+
+    def has_color_set(self, color):
+        return self.color_counts.get(color, 0) == COLOR_SET_SIZES.get(color)
+
+    def get_unmortgaged_count(self, prop_type):
+        return self.unmortgaged_type_counts.get(prop_type, 0)
 
     def get_property_by_id(self, id):
-        count = 0
-        for p in self.properties:
-            if count == id:
-                return p
-            count += 1
+        if 0 <= id < len(self.properties):
+            return self.properties[id]
         return None
 
+    def index_names(self):
+        self.names = {}
+        self.first_words = {}
+        for (id, p) in enumerate(self.properties):
+            self.names.setdefault(p.get_name().lower(), (id, p))
+            self.first_words.setdefault(p.get_name().split()[0].lower(), (id, p))
+        self.names_stale = False
+
     def get_property_by_name(self, name):
-        for p in self.properties:
-            # Check that either the full name was entered or the first word of the name.
-            if p.get_name().lower() == name.lower() or \
-               p.get_name().split()[0].lower() == name.split()[0].lower():
-                return p
+        if self.names_stale:
+            self.index_names()
 
-    def get_properties_str(self):
-        table = prettytable.PrettyTable()
-        table.field_names = ["id", "name", "color", "price", "mort", "#", "rent"]
-        for (id, p) in enumerate(self.properties):
-            is_mort = "Y" if p.get_mortgaged() else "N"
+        # Either the full name was entered or the first word of the name. If both match, the first in the list wins.
+        full_match = self.names.get(name.lower())
+        word_match = self.first_words.get(name.split()[0].lower())
+        if full_match is None or (word_match is not None and word_match[0] < full_match[0]):
+            full_match = word_match
+        return None if full_match is None else full_match[1]
 
-            if type(p) == Property:
-                table.add_row([
-                    id,
-                    p.get_name(),
-                    p.get_color(),
-                    p.cost,
-                    f"{is_mort} ({p.get_mortgage_value()})",
-                    "H" if p.get_hotels() > 0 else str(p.get_houses()),
-                    p.get_rent(),
-                ])
-            elif type(p) == OtherProperty:
-                table.add_row([
-                    id,
-                    p.get_name(),
-                    p.get_type(),
-                    p.cost,
-                    f"{is_mort} ({p.get_mortgage_value()})",
-                    '',
-                    p.get_rent(),
-                ])
-        return self.name + " properties:\n\n" + table.get_string()
+    def get_properties_str(self):
+        # Cached until something in the table changes (see version), since /aa renders every player at once.
+        if self.properties_str is None or self.properties_str[0] != self.version:
+            self.properties_str = (self.version, self.name + " properties:\n\n" + format_table(
+                PROPERTY_TABLE_FIELDS, [property_row(id, p) for (id, p) in enumerate(self.properties)]))
+        return self.properties_str[1]
 
     def get_position(self):
         return self.position
@@ -126,13 +173,16 @@ class Player:
         self.position = position
 
     def get_total_assets(self):
-        total = self.money
-        for p in self.properties:
-            if type(p) == Property:
-                total += p.mortgage_value + p.house_cost * p.houses + p.hotel_cost * p.hotels
-            elif type(p) == OtherProperty:
-                total += p.mortgage_value
-        return total
+        """Money plus what mortgaging every property and selling every building on them would raise."""
+        if CHECK_ASSETS:
+            self.check_assets()
+        return self.money + self.property_assets
+
+    def check_assets(self):
+        expected = sum(p.get_asset_value() for p in self.properties)
+        if self.property_assets != expected:
+            raise AssertionError(f"{self.name}'s property assets are {self.property_assets}, but add up to "
+                                 f"{expected}")
 
     def set_turns_left_in_jail(self, turns):
         self.turns_left_in_jail = turns
@@ -148,8 +198,12 @@ class Player:
 
     def sort_props_by_color(self):
         self.properties.sort(key=lambda p: p.get_color())
+        self.names_stale = True
+        self.version += 1
 
     def get_icon_color(self):
+        if self.icon_color is None:
+            self.icon_color = ColorHash(self.name).rgb
         return self.icon_color
 
     def is_bank(self) -> bool:
@@ -161,6 +215,51 @@ class Player:
         return False
 
 
+PROPERTY_TABLE_FIELDS = ("id", "name", "color", "price", "mort", "#", "rent")
+
+
+def property_row(id, p):
+    is_mort = "Y" if p.get_mortgaged() else "N"
+    if type(p) == Property:
+        return (str(id), p.get_name(), p.get_color(), str(p.cost), f"{is_mort} ({p.get_mortgage_value()})",
+                "H" if p.get_hotels() > 0 else str(p.get_houses()), str(p.get_rent()))
+    return (str(id), p.get_name(), p.get_type(), str(p.cost), f"{is_mort} ({p.get_mortgage_value()})", "",
+            str(p.get_rent()))
+
+
+@functools.lru_cache(maxsize=1024)
+def text_width(text) -> int:
+    """How many columns text takes up in a monospace font: emoji are two wide, variation selectors nothing."""
+    width = 0
+    for c in text:
+        if unicodedata.east_asian_width(c) in "WF":
+            width += 2
+        elif not unicodedata.combining(c) and unicodedata.category(c) not in ("Mn", "Me", "Cf"):
+            width += 1
+    return width
+
+
+def center(text, width) -> str:
+    padding = width - text_width(text)
+    # Rounded like str.center, which prettytable follows.
+    left = padding // 2 + (padding & width & 1)
+    return " " * left + text + " " * (padding - left)
+
+
+def format_table(fields, rows) -> str:
+    """A table with centered columns and ASCII borders, laid out like prettytable's default style."""
+    widths = [text_width(field) for field in fields]
+    for row in rows:
+        for (i, cell) in enumerate(row):
+            widths[i] = max(widths[i], text_width(cell))
+    rule = "+" + "+".join(["-" * (width + 2) for width in widths]) + "+"
+    lines = [rule, "| " + " | ".join([center(f, w) for (f, w) in zip(fields, widths)]) + " |", rule]
+    for row in rows:
+        lines.append("| " + " | ".join([center(cell, w) for (cell, w) in zip(row, widths)]) + " |")
+    lines.append(rule)
+    return "\n".join(lines)
+
+
 class Bank:
     """hack to support matching players to bank"""
     def __init__(self):
@@ -179,7 +278,16 @@ class Bank:
     def __eq__(self, other):
         return isinstance(other, Bank)
 
+class NullBot:
+    """Swallows messages, for games that are played without a chat (e.g. simulations)."""
+    def send_message(self, chat_id, text, **kwargs):
+        pass
+
+
 class Property:
+    __slots__ = ("name", "color", "houses", "hotels", "rents", "mortgage_value", "house_cost", "hotel_cost", "cost",
+                 "mortgaged", "owner")
+
     # Note: rents is [base_rent, one_house_rent, ..., four_houses_rent, hotel_rent]
     def __init__(self, name, color, cost, rents, mortgage_value, house_cost, hotel_cost):
         self.name = name
@@ -195,23 +303,36 @@ class Property:
         self.owner: Optional[Player] = None
 
 
+    # Lets the owner know that its cached renderings are out of date and by how much its assets changed.
+    def changed(self, asset_change=0):
+        if self.owner is not None:
+            self.owner.version += 1
+            self.owner.property_assets += asset_change
+
+    def get_asset_value(self):
+        return self.mortgage_value + self.house_cost * self.houses + self.hotel_cost * self.hotels
+
     def add_house(self):
         if self.houses < 4 and self.hotels == 0:
             self.houses += 1
+            self.changed(self.house_cost)
 
     def remove_house(self):
         if self.houses > 0:
             self.houses -= 1
+            self.changed(-self.house_cost)
 
     def add_hotel(self):
         if self.houses == 4:
             self.houses = 0
             self.hotels = 1
+            self.changed(self.hotel_cost - 4 * self.house_cost)
 
     def remove_hotel(self):
         if self.hotels > 0:
             self.hotels = 0
             self.houses = 4
+            self.changed(4 * self.house_cost - self.hotel_cost)
 
     def get_name(self):
         return self.name
@@ -245,6 +366,7 @@ class Property:
 
     def set_mortgaged(self, val):
         self.mortgaged = val
+        self.changed()
 
     def get_owner(self):
         return self.owner
@@ -256,13 +378,19 @@ class Property:
         return self.mortgage_value
 
     def set_houses(self, val):
+        change = (val - self.houses) * self.house_cost
         self.houses = val
+        self.changed(change)
 
     def set_hotels(self, val):
+        change = (val - self.hotels) * self.hotel_cost
         self.hotels = val
+        self.changed(change)
 
 
 class OtherProperty:
+    __slots__ = ("name", "cost", "rent", "mortgage_value", "mortgaged", "type", "owner")
+
     def __init__(self, name, cost, rent, mortgage_value, type):
         self.name = name
         self.cost = cost
@@ -272,6 +400,13 @@ class OtherProperty:
         self.type = type
         self.owner = None
 
+    def changed(self):
+        if self.owner is not None:
+            self.owner.version += 1
+
+    def get_asset_value(self):
+        return self.mortgage_value
+
     def get_name(self):
         return self.name
 
@@ -297,85 +432,602 @@ class OtherProperty:
         return self.mortgaged
 
     def set_mortgaged(self, val):
+        if self.owner is not None and self.mortgaged != val:
+            counts = self.owner.unmortgaged_type_counts
+            counts[self.type] = counts.get(self.type, 0) + (-1 if val else 1)
         self.mortgaged = val
+        self.changed()
 
     # Not technically accurate, but I need it for sorting.
     def get_color(self):
         return self.type
 
 
+def trade_line(p):
+    if type(p) == Property:
+        return p.get_name() + " : " + p.get_color() + \
+               " (" + str(p.get_houses()) + " houses " + "($" + str(p.get_house_cost()) + "), " + \
+               str(p.get_hotels()) + " hotels " + "($" + str(p.get_hotel_cost()) + "))" + \
+               " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
+               ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
+    return p.get_name() + " : " + p.get_type() + "\n" + \
+        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
+        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
+
+
+class Trade:
+    """
+    A pending trade between two players. Everything is kept per side: 0 for the player who set the trade up and 1
+    for the other one.
+
+    Changes are reported as the lines they add or remove (e.g. "+ Boardwalk from A") rather than the whole trade.
+    The line of every property in the trade is rendered once and reused by render until the property's houses,
+    hotels or mortgage change.
+    """
+    __slots__ = ("players", "money", "properties", "cards", "agreed", "lines")
+
+    def __init__(self, player_1, player_2, money=(0, 0), properties=((), ()), cards=(0, 0), agreed=(False, False)):
+        self.players = (player_1, player_2)
+        self.money = list(money)
+        self.properties = [list(properties[0]), list(properties[1])]
+        self.cards = list(cards)
+        self.agreed = list(agreed)
+        # property -> ((houses, hotels, mortgaged), rendered line)
+        self.lines: Dict[object, Tuple[Tuple, str]] = {}
+
+    def side(self, player) -> Optional[int]:
+        for (side, p) in enumerate(self.players):
+            if p == player:
+                return side
+        return None
+
+    def any_agreed(self) -> bool:
+        return self.agreed[0] or self.agreed[1]
+
+    def add(self, side, property, money, cards) -> List[str]:
+        """Add to one side, returning the changes as "+ ..." lines."""
+        self.money[side] += money
+        self.cards[side] += cards
+        if property is not None:
+            self.properties[side].append(property)
+        return self.changes("+", side, property, money, cards)
+
+    def remove(self, side, property, money, cards) -> List[str]:
+        """Take off one side (money and cards no lower than 0), returning the changes as "- ..." lines."""
+        money = min(money, self.money[side])
+        cards = min(cards, self.cards[side])
+        self.money[side] -= money
+        self.cards[side] -= cards
+        if property is not None:
+            self.properties[side].remove(property)
+            self.lines.pop(property, None)
+        return self.changes("-", side, property, money, cards)
+
+    def changes(self, sign, side, property, money, cards) -> List[str]:
+        name = self.players[side].get_name()
+        changes = []
+        if property is not None:
+            changes.append(f"{sign} {property.get_name()} from {name}")
+        if money > 0:
+            changes.append(f"{sign} ${money} from {name}")
+        if cards > 0:
+            changes.append(f"{sign} {cards} Get Out of Jail Free card{'s' if cards > 1 else ''} from {name}")
+        return changes
+
+    def line(self, p) -> str:
+        key = (getattr(p, "houses", 0), getattr(p, "hotels", 0), p.mortgaged)
+        cached = self.lines.get(p)
+        if cached is None or cached[0] != key:
+            cached = self.lines[p] = (key, trade_line(p))
+        return cached[1]
+
+    def render(self) -> str:
+        """The whole trade, side by side."""
+        parts = []
+        for side in (0, 1):
+            parts.append("From " + self.players[side].get_name() + ":\n\nMoney: $" + str(self.money[side]) +
+                         "\nGet Out of Jail Free cards: " + str(self.cards[side]) + "\nProperties:\n" +
+                         "".join([self.line(p) for p in self.properties[side]]))
+        return "\n".join(parts)
+
+    def snapshot(self):
+        return (self.players, tuple(self.money), (tuple(self.properties[0]), tuple(self.properties[1])),
+                tuple(self.cards), tuple(self.agreed))
+
+
+# Square types. SQUARE_TYPES gives the type of every position on the board.
+GO, PROPERTY, OTHER_PROPERTY, COMMUNITY_CHEST, CHANCE, INCOME_TAX, LUXURY_TAX, JAIL, FREE_PARKING, GO_TO_JAIL = \
+    range(10)
+
+# Properties are (PROPERTY, name, color, cost, rents, mortgage_value, house_cost, hotel_cost) and
+# (OTHER_PROPERTY, name, cost, rent, mortgage_value, type); every other square is (type, name).
+BOARD_LAYOUT = (
+    (GO, "Go"),
+    (PROPERTY, "Mediterranean Avenue", "Brown 🟫", 60, (2, 10, 30, 90, 160, 250), 30, 50, 50),
+    (COMMUNITY_CHEST, "Community Chest"),
+    (PROPERTY, "Baltic Avenue", "Brown 🟫", 60, (4, 20, 60, 180, 320, 450), 30, 50, 50),
+    (INCOME_TAX, "Income Tax"),
+    (OTHER_PROPERTY, "Reading Railroad", 200, 25, 100, "Railroad"),
+    (PROPERTY, "Oriental Avenue", "Light Blue ⬜️", 100, (6, 30, 90, 270, 400, 550), 50, 50, 50),
+    (CHANCE, "Chance"),
+    (PROPERTY, "Vermont Avenue", "Light Blue ⬜️", 100, (6, 30, 90, 270, 400, 550), 50, 50, 50),
+    (PROPERTY, "Connecticut Avenue", "Light Blue ⬜️", 120, (8, 40, 100, 300, 450, 600), 60, 50, 50),
+    (JAIL, "Jail"),
+    (PROPERTY, "St. Charles Place", "Pink 🟪", 140, (10, 50, 150, 450, 625, 750), 70, 100, 100),
+    (OTHER_PROPERTY, "Electric Company", 150, 1, 75, "Utility"),
+    (PROPERTY, "States Avenue", "Pink 🟪", 140, (10, 50, 150, 450, 625, 750), 70, 100, 100),
+    (PROPERTY, "Virginia Avenue", "Pink 🟪", 160, (12, 60, 180, 500, 700, 900), 80, 100, 100),
+    (OTHER_PROPERTY, "Pennsylvania Railroad", 200, 25, 100, "Railroad"),
+    (PROPERTY, "St. James Place", "Orange 🟧", 180, (14, 70, 200, 550, 750, 950), 90, 100, 100),
+    (COMMUNITY_CHEST, "Community Chest"),
+    (PROPERTY, "Tennessee Avenue", "Orange 🟧", 180, (14, 70, 200, 550, 750, 950), 90, 100, 100),
+    (PROPERTY, "New York Avenue", "Orange 🟧", 200, (16, 80, 220, 600, 800, 1000), 100, 100, 100),
+    (FREE_PARKING, "Free Parking"),
+    (PROPERTY, "Kentucky Avenue", "Red 🟥", 220, (18, 90, 250, 700, 875, 1050), 110, 150, 150),
+    (CHANCE, "Chance"),
+    (PROPERTY, "Indiana Avenue", "Red 🟥", 220, (18, 90, 250, 700, 875, 1050), 110, 150, 150),
+    (PROPERTY, "Illinois Avenue", "Red 🟥", 240, (20, 100, 300, 750, 925, 1100), 120, 150, 150),
+    (OTHER_PROPERTY, "B. & O. Railroad", 200, 25, 100, "Railroad"),
+    (PROPERTY, "Atlantic Avenue", "Yellow 🟨", 260, (22, 110, 330, 800, 975, 1150), 130, 150, 150),
+    (PROPERTY, "Ventnor Avenue", "Yellow 🟨", 260, (22, 110, 330, 800, 975, 1150), 130, 150, 150),
+    (OTHER_PROPERTY, "Water Works", 150, 1, 75, "Utility"),
+    (PROPERTY, "Marvin Gardens", "Yellow 🟨", 280, (24, 120, 360, 850, 1025, 1200), 140, 150, 150),
+    (GO_TO_JAIL, "Go To Jail"),
+    (PROPERTY, "Pacific Avenue", "Green 🟩", 300, (26, 130, 390, 900, 1100, 1275), 150, 200, 200),
+    (PROPERTY, "North Carolina Avenue", "Green 🟩", 300, (26, 130, 390, 900, 1100, 1275), 150, 200, 200),
+    (COMMUNITY_CHEST, "Community Chest"),
+    (PROPERTY, "Pennsylvania Avenue", "Green 🟩", 320, (28, 150, 450, 1000, 1200, 1400), 160, 200, 200),
+    (OTHER_PROPERTY, "Short Line", 200, 25, 100, "Railroad"),
+    (CHANCE, "Chance"),
+    (PROPERTY, "Park Place", "Blue 🟦", 350, (35, 175, 500, 1100, 1300, 1500), 175, 200, 200),
+    (LUXURY_TAX, "Luxury Tax"),
+    (PROPERTY, "Boardwalk", "Blue 🟦", 400, (50, 200, 600, 1400, 1700, 2000), 200, 200, 200),
+)
+SQUARE_TYPES = tuple(square[0] for square in BOARD_LAYOUT)
+# The board positions of each color group, and how many properties a player needs for a monopoly.
+COLOR_GROUPS: Dict[str, Tuple[int, ...]] = {}
+for (position, square) in enumerate(BOARD_LAYOUT):
+    if square[0] == PROPERTY:
+        COLOR_GROUPS[square[2]] = COLOR_GROUPS.get(square[2], ()) + (position,)
+COLOR_SET_SIZES = {color: len(positions) for (color, positions) in COLOR_GROUPS.items()}
+PROPERTY_POSITIONS = tuple(position for (position, square_type) in enumerate(SQUARE_TYPES)
+                           if square_type == PROPERTY or square_type == OTHER_PROPERTY)
+JAIL_POSITION = SQUARE_TYPES.index(JAIL)
+
+# The Chance and Community Chest cards that move the player, by card number. Each sends the player to a board
+# position, back three spaces (BACK_THREE) or straight to jail (TO_JAIL). See Game.move_by_card.
+BACK_THREE = -3
+TO_JAIL = -1
+CHANCE_CARDS = 13
+CHANCE_MOVES = {0: 0, 1: 24, 2: 11, 5: BACK_THREE, 6: TO_JAIL, 9: 5, 10: len(BOARD_LAYOUT) - 1}
+COMMUNITY_CHEST_CARDS = 15
+COMMUNITY_CHEST_MOVES = {0: 0, 5: TO_JAIL}
+
+
+def group_key(name) -> str:
+    """"All-Railroads", "light blue" and "Light Blue ⬜️" all become "railroads" and "lightblue"."""
+    key = "".join(c for c in name.lower() if c.isalpha())
+    return key[3:] if key.startswith("all") and key != "all" else key
+
+
+# Groups of properties that bulk commands take, by group_key: every color, railroads, utilities and all.
+PROPERTY_GROUPS: Dict[str, Tuple[int, ...]] = {group_key(color): positions
+                                              for (color, positions) in COLOR_GROUPS.items()}
+for (prop_type, names) in (("Railroad", ("railroads", "railroad")), ("Utility", ("utilities", "utility"))):
+    for name in names:
+        PROPERTY_GROUPS[name] = tuple(position for (position, square) in enumerate(BOARD_LAYOUT)
+                                      if square[0] == OTHER_PROPERTY and square[5] == prop_type)
+PROPERTY_GROUPS["all"] = PROPERTY_POSITIONS
+
+
+def new_square(square):
+    """The board entry for a square in BOARD_LAYOUT: a fresh property, or the square's name."""
+    if square[0] == PROPERTY:
+        return Property(*square[1:])
+    if square[0] == OTHER_PROPERTY:
+        return OtherProperty(*square[1:])
+    return square[1]
+
+
+# Bump whenever Game.get_state changes shape. Version 1 states had no event log.
+GAME_STATE_VERSION = 2
+
+# Game event types. Events are tuples starting with their type:
+#   (EVENT_START, chat_id, [[user_id, name], ...])
+#   (EVENT_COMMAND, command_name, *args) for every player command, see command
+#   (EVENT_DRAW, value) for every die rolled and card drawn
+#   (EVENT_STATE, state) in place of EVENT_START, once the older events were dropped, see Game.checkpoint
+EVENT_START, EVENT_COMMAND, EVENT_DRAW, EVENT_STATE = range(4)
+# A game's event log is cut back to a checkpoint before it grows longer than this.
+MAX_EVENTS = 2000
+# Names of the Game methods that are logged as commands.
+COMMANDS = set()
+
+
+def command(func):
+    """Logs calls of a player command to the game's event log. Commands called by other commands aren't logged."""
+    COMMANDS.add(func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(self, *args):
+        if self.events is None or self.in_command:
+            return func(self, *args)
+        if len(self.events) >= MAX_EVENTS:
+            self.checkpoint()
+        self.events.append((EVENT_COMMAND, func.__name__) + tuple(list(a) if isinstance(a, list) else a
+                                                                  for a in args))
+        self.in_command = True
+        try:
+            return func(self, *args)
+        finally:
+            self.in_command = False
+    return wrapper
+
+
+class LoggedRandom:
+    """
+    Hands out a game's dice rolls and card draws, adding each one to the game's event log. While a game is being
+    replayed, the draws come from the log instead of the RNG.
+    """
+    __slots__ = ("rng", "events", "replayed")
+
+    def __init__(self, rng, events=None):
+        self.rng = rng
+        self.events = events
+        self.replayed: Optional[deque] = None
+
+    def randint(self, a, b):
+        if self.replayed:
+            value = self.replayed.popleft()
+        else:
+            value = self.rng.randint(a, b)
+        if self.events is not None:
+            self.events.append((EVENT_DRAW, value))
+        return value
+
+
+def building_level(property) -> int:
+    """The houses on a property, or 5 for a hotel."""
+    return 5 if property.get_hotels() > 0 else property.get_houses()
+
+
+def describe_level(level) -> str:
+    if level == 5:
+        return "hotel"
+    return str(level) + (" house" if level == 1 else " houses")
+
+
+# Average roll of two dice, for what landing on a utility is worth.
+AVERAGE_ROLL = 7
+
+
+def property_rent(property, level, monopoly) -> int:
+    """What landing on a property with level buildings (5 for a hotel) costs, as in Game.land_on_property."""
+    return property.rents[level] + (property.rents[0] if monopoly else 0)
+
+
+def other_property_income(prop_type, rent, count) -> int:
+    """What landing once on each of count unmortgaged railroads or utilities costs, as in land_on_other_property."""
+    if count == 0:
+        return 0
+    if prop_type == "Railroad":
+        return count * rent * 2 ** (count - 1)
+    return count * (10 if count == 2 else 4) * AVERAGE_ROLL
+
+
+def liquidation_options(player):
+    """
+    The ways a player can raise cash, in groups of which at most one option can be taken. Options are
+    (cash, rent lost, actions), where actions are (command, property) pairs. A property's own group has selling
+    its buildings down to each level and mortgaging it. Railroads and utilities are grouped by type, since
+    mortgaging one lowers the rent of the others.
+    """
+    groups = []
+    others: Dict[str, List[OtherProperty]] = {}
+    for p in player.get_properties():
+        if p.get_mortgaged():
+            continue
+        if type(p) == OtherProperty:
+            others.setdefault(p.get_type(), []).append(p)
+            continue
+
+        monopoly = player.has_color_set(p.get_color())
+        level = building_level(p)
+        rent = property_rent(p, level, monopoly)
+        options = []
+        cash = 0
+        actions: Tuple = ()
+        # Buildings can only be sold from a full color set; mortgaging sells them either way.
+        for sold_to in range(level - 1, -1, -1):
+            if sold_to == 4:
+                cash += p.get_hotel_cost()
+                actions += (("sell_hotel", p),)
+            else:
+                cash += p.get_house_cost()
+                actions += (("sell_house", p),)
+            if monopoly:
+                options.append((cash, rent - property_rent(p, sold_to, monopoly), actions))
+        options.append((cash + p.get_mortgage_value(), rent, (("mortgage_property", p),)))
+        groups.append(options)
+
+    for (prop_type, props) in others.items():
+        income = other_property_income(prop_type, props[0].get_rent(), len(props))
+        groups.append([(sum(p.get_mortgage_value() for p in props[:k]),
+                        income - other_property_income(prop_type, props[0].get_rent(), len(props) - k),
+                        tuple(("mortgage_property", p) for p in props[:k]))
+                       for k in range(1, len(props) + 1)])
+    return groups
+
+
+def plan_liquidation(player, amount) -> Optional[List[Tuple[str, object]]]:
+    """
+    The cheapest way for player to have amount in cash by selling buildings and mortgaging properties, as a list
+    of (command, property). Both give back what was paid, so the cost is the rent lost; ties go to fewer actions.
+    None if it can't be done.
+
+    Works like a knapsack: the best plan for every amount raised so far (capped at what's missing) is extended by
+    one group of options at a time.
+    """
+    missing = amount - player.get_money()
+    if missing <= 0:
+        return []
+    best: Dict[int, Tuple[int, Tuple]] = {0: (0, ())}
+    for options in liquidation_options(player):
+        extended = dict(best)
+        for (raised, (lost, actions)) in best.items():
+            for (cash, rent, option_actions) in options:
+                key = min(missing, raised + cash)
+                plan = (lost + rent, actions + option_actions)
+                current = extended.get(key)
+                if current is None or (plan[0], len(plan[1])) < (current[0], len(current[1])):
+                    extended[key] = plan
+        best = extended
+    plan = best.get(missing)
+    return None if plan is None else list(plan[1])
+
+
 class Game:
-    def __init__(self, chat_id, players, bot):
+    # A quiet game doesn't send (or even format) any messages. Pass a seed to make the dice and cards reproducible.
+    # A recording game keeps a log of its events in events, which replay turns back into the same game.
+    def __init__(self, chat_id, players, bot=None, seed=None, quiet=False, record=False):
         self.players: Dict[int, Player] = {}
-        self.bot = bot
+        self.bot = bot if bot is not None else NullBot()
+        self.quiet = quiet
         self.chat_id = chat_id
         self.turn = 0
-        self.dice = Dice(2, 6)
+        self.rng = random.Random(seed)
+        self.events: Optional[List[Tuple]] = [(EVENT_START, chat_id, [[user_id, name] for (user_id, name) in
+                                                                      players.items()])] if record else None
+        # Events dropped from the front of the log by checkpoints.
+        self.events_dropped = 0
+        self.in_command = False
+        self.draws = LoggedRandom(self.rng, self.events)
+        self.dice = Dice(2, 6, self.draws)
         self.has_doubles = False
         # Make pending payments a list of tuples in the form (from, to, amount)
         self.pending_payments: List[Tuple[Player,Player,int]] = []
+        # Rent charged by the last roll, as (property name, amount), before it is paid. Only kept for statistics.
+        self.rent_charged: List[Tuple[str, int]] = []
         self.last_roll = [-1]
-        # (player_1, player_2, money_from_1, money_from_2, props_from_1,
-        # props_from_2, cards_from_1, cards_from_2, agreed_1, agreed_2)
-        self.pending_trade = None
+        self.pending_trade: Optional[Trade] = None
         self.ids = []
-        self.board = \
-        [
-            "Go",
-            Property("Mediterranean Avenue", "Brown 🟫", 60, [2, 10, 30, 90, 160, 250], 30, 50, 50),
-            "Community Chest",
-            Property("Baltic Avenue", "Brown 🟫", 60, [4, 20, 60, 180, 320, 450], 30, 50, 50),
-            "Income Tax",
-            OtherProperty("Reading Railroad", 200, 25, 100, "Railroad"),
-            Property("Oriental Avenue", "Light Blue ⬜️", 100, [6, 30, 90, 270, 400, 550], 50, 50, 50),
-            "Chance",
-            Property("Vermont Avenue", "Light Blue ⬜️", 100, [6, 30, 90, 270, 400, 550], 50, 50, 50),
-            Property("Connecticut Avenue", "Light Blue ⬜️", 120, [8, 40, 100, 300, 450, 600], 60, 50, 50),
-            "Jail",
-            Property("St. Charles Place", "Pink 🟪", 140, [10, 50, 150, 450, 625, 750], 70, 100, 100),
-            OtherProperty("Electric Company", 150, 1, 75, "Utility"),
-            Property("States Avenue", "Pink 🟪", 140, [10, 50, 150, 450, 625, 750], 70, 100, 100),
-            Property("Virginia Avenue", "Pink 🟪", 160, [12, 60, 180, 500, 700, 900], 80, 100, 100),
-            OtherProperty("Pennsylvania Railroad", 200, 25, 100, "Railroad"),
-            Property("St. James Place", "Orange 🟧", 180, [14, 70, 200, 550, 750, 950], 90, 100, 100),
-            "Community Chest",
-            Property("Tennessee Avenue", "Orange 🟧", 180, [14, 70, 200, 550, 750, 950], 90, 100, 100),
-            Property("New York Avenue", "Orange 🟧", 200, [16, 80, 220, 600, 800, 1000], 100, 100, 100),
-            "Free Parking",
-            Property("Kentucky Avenue", "Red 🟥", 220, [18, 90, 250, 700, 875, 1050], 110, 150, 150),
-            "Chance",
-            Property("Indiana Avenue", "Red 🟥", 220, [18, 90, 250, 700, 875, 1050], 110, 150, 150),
-            Property("Illinois Avenue", "Red 🟥", 240, [20, 100, 300, 750, 925, 1100], 120, 150, 150),
-            OtherProperty("B. & O. Railroad", 200, 25, 100, "Railroad"),
-            Property("Atlantic Avenue", "Yellow 🟨", 260, [22, 110, 330, 800, 975, 1150], 130, 150, 150),
-            Property("Ventnor Avenue", "Yellow 🟨", 260, [22, 110, 330, 800, 975, 1150], 130, 150, 150),
-            OtherProperty("Water Works", 150, 1, 75, "Utility"),
-            Property("Marvin Gardens", "Yellow 🟨", 280, [24, 120, 360, 850, 1025, 1200], 140, 150, 150),
-            "Go To Jail",
-            Property("Pacific Avenue", "Green 🟩", 300, [26, 130, 390, 900, 1100, 1275], 150, 200, 200),
-            Property("North Carolina Avenue", "Green 🟩", 300, [26, 130, 390, 900, 1100, 1275], 150, 200, 200),
-            "Community Chest",
-            Property("Pennsylvania Avenue", "Green 🟩", 320, [28, 150, 450, 1000, 1200, 1400], 160, 200, 200),
-            OtherProperty("Short Line", 200, 25, 100, "Railroad"),
-            "Chance",
-            Property("Park Place", "Blue 🟦", 350, [35, 175, 500, 1100, 1300, 1500], 175, 200, 200),
-            "Luxury Tax",
-            Property("Boardwalk", "Blue 🟦", 400, [50, 200, 600, 1400, 1700, 2000], 200, 200, 200)
-        ]
-        # Somewhat ugly, but I need the reference to the object not a copy.
-        self.available_properties = list(filter(lambda x: x is not None,
-                                           [p if type(p) == Property or type(p) == OtherProperty
-                                            else None for p in self.board]))
+        # Only the properties hold per-game state; the rest of the board is the shared static layout.
+        self.board = [new_square(square) for square in BOARD_LAYOUT]
+        self.available_properties = [self.board[position] for position in PROPERTY_POSITIONS]
+
+        # Lookups of players by local id and lower case name. See index_players.
+        self.players_by_id: Dict[int, Player] = {}
+        self.players_by_name: Dict[str, Player] = {}
 
         count = 0
         # Maybe randomize for fairness? It matters a bit in Monopoly.
         for user_id, name in players.items():
-            self.send_message("(" + str(count) + ") " + name + " has been added to the game.\n")
+            if not self.quiet:
+                self.send_message("(" + str(count) + ") " + name + " has been added to the game.\n")
             self.players[user_id] = Player(user_id, count, name, 1500)
             self.ids += [count]
             count += 1
+        self.index_players()
         self.send_message("The game of Monopoly has begun!")
 
+    def get_state(self, events=True):
+        """
+        The game as plain lists, numbers and strings (e.g. for JSON). Players are referred to by user id and
+        properties by board position. The dice and card RNG is not included. The event log of a recording game is,
+        unless events is False.
+        """
+        positions = {id(self.board[position]): position for position in PROPERTY_POSITIONS}
+
+        def player_id(player):
+            return None if player is None else player.get_user_id()
+
+        trade = None
+        if self.pending_trade is not None:
+            t = self.pending_trade
+            trade = [player_id(t.players[0]), player_id(t.players[1]), *t.money,
+                     [positions[id(p)] for p in t.properties[0]], [positions[id(p)] for p in t.properties[1]],
+                     *t.cards, *t.agreed]
+
+        return {
+            "v": GAME_STATE_VERSION,
+            "chat_id": self.chat_id,
+            "turn": self.turn,
+            "has_doubles": self.has_doubles,
+            "last_roll": list(self.last_roll),
+            "ids": list(self.ids),
+            "quiet": self.quiet,
+            "players": [[p.user_id, p.id, p.name, p.money, p.get_out_free_cards, p.turns_left_in_jail, p.position,
+                         p.total_roll, [positions[id(prop)] for prop in p.properties]]
+                        for p in self.players.values()],
+            "properties": [[position, getattr(self.board[position], "houses", 0),
+                            getattr(self.board[position], "hotels", 0), self.board[position].get_mortgaged()]
+                           for position in PROPERTY_POSITIONS],
+            "pending_payments": [[player_id(payer), player_id(payee), amount]
+                                 for (payer, payee, amount) in self.pending_payments],
+            "pending_trade": trade,
+            "events": list(self.events) if events and self.events is not None else None,
+        }
+
+    @classmethod
+    def from_state(cls, state, bot=None):
+        if state["v"] not in (1, GAME_STATE_VERSION):
+            raise ValueError("Unsupported game state version " + str(state["v"]))
+
+        game = cls(state["chat_id"], {}, bot, quiet=True)
+        game.quiet = state["quiet"]
+        game.turn = state["turn"]
+        game.has_doubles = state["has_doubles"]
+        game.last_roll = list(state["last_roll"])
+        game.ids = list(state["ids"])
+
+        for (position, houses, hotels, mortgaged) in state["properties"]:
+            property = game.board[position]
+            if type(property) == Property:
+                property.set_houses(houses)
+                property.set_hotels(hotels)
+            property.set_mortgaged(mortgaged)
+
+        for (user_id, local_id, name, money, cards, jail, position, total_roll, props) in state["players"]:
+            player = Player(user_id, local_id, name, money)
+            player.get_out_free_cards = cards
+            player.turns_left_in_jail = jail
+            player.position = position
+            player.total_roll = total_roll
+            for prop_position in props:
+                property = game.board[prop_position]
+                property.set_owner(player)
+                player.add_property(property)
+                if property in game.available_properties:
+                    game.available_properties.remove(property)
+            game.players[user_id] = player
+        game.index_players()
+
+        def player(user_id):
+            return None if user_id is None else game.players[user_id]
+
+        game.pending_payments = [(player(payer), player(payee), amount)
+                                 for (payer, payee, amount) in state["pending_payments"]]
+        t = state["pending_trade"]
+        if t is not None:
+            game.pending_trade = Trade(player(t[0]), player(t[1]), t[2:4], ([game.board[p] for p in t[4]],
+                                       [game.board[p] for p in t[5]]), t[6:8], t[8:10])
+        if state.get("events") is not None:
+            game.record([tuple(event) for event in state["events"]])
+        return game
+
+    def record(self, events):
+        """Log the game's events from now on, after events, the log that led up to the game as it is."""
+        self.events = events
+        self.draws.events = events
+
+    @property
+    def logged_events(self) -> int:
+        """How many events were logged, including the ones dropped by checkpoints."""
+        return self.events_dropped + len(self.events)
+
+    def checkpoint(self):
+        """Replace the event log with the game's current state, which replays to the same game."""
+        self.events_dropped += len(self.events) - 1
+        self.events[:] = [(EVENT_STATE, self.get_state(events=False))]
+
+    def snapshot(self, rng=True):
+        """
+        The mutable state of the game as tuples, referring to the game's own player and property objects. Cheap
+        enough to take before every command, or thousands of times when trying out moves. Snapshots compare equal
+        when the game is in the same state. Copying the dice and card RNG is about half the cost, so it can be left
+        out when the dice should come up differently after a restore anyway.
+        """
+        return (
+            self.turn,
+            self.has_doubles,
+            tuple(self.last_roll),
+            tuple(self.ids),
+            tuple(self.pending_payments),
+            None if self.pending_trade is None else self.pending_trade.snapshot(),
+            tuple(self.available_properties),
+            tuple((user_id, p, p.money, p.get_out_free_cards, p.turns_left_in_jail, p.position, p.total_roll,
+                   tuple(p.properties)) for (user_id, p) in self.players.items()),
+            tuple((p, getattr(p, "houses", 0), getattr(p, "hotels", 0), p.mortgaged, p.owner)
+                  for p in (self.board[position] for position in PROPERTY_POSITIONS)),
+            self.rng.getstate() if rng else None,
+        )
+
+    def restore(self, snapshot, log_length=None):
+        """
+        Put the game back in the state of a snapshot it took earlier. If log_length (logged_events when the
+        snapshot was taken) is given, the event log is cut back to it as well.
+        """
+        (self.turn, self.has_doubles, last_roll, ids, pending_payments, trade, available_properties, players,
+         properties, rng_state) = snapshot
+        self.last_roll = list(last_roll)
+        self.ids = list(ids)
+        self.pending_payments = list(pending_payments)
+        self.pending_trade = None if trade is None else Trade(*trade[0], *trade[1:])
+        self.available_properties = list(available_properties)
+
+        for (p, houses, hotels, mortgaged, owner) in properties:
+            if type(p) == Property:
+                p.houses = houses
+                p.hotels = hotels
+            p.mortgaged = mortgaged
+            p.owner = owner
+
+        self.players = {}
+        for (user_id, p, money, cards, jail, position, total_roll, props) in players:
+            p.money = money
+            p.get_out_free_cards = cards
+            p.turns_left_in_jail = jail
+            p.position = position
+            p.total_roll = total_roll
+            p.properties = list(props)
+            p.rebuild_counts()
+            self.players[user_id] = p
+        self.index_players()
+        if rng_state is not None:
+            self.rng.setstate(rng_state)
+        if log_length is not None and self.events is not None:
+            if log_length > self.events_dropped:
+                del self.events[log_length - self.events_dropped:]
+            else:
+                # The log was checkpointed since, so it starts over from here.
+                self.checkpoint()
+
+    @classmethod
+    def replay(cls, events, bot=None):
+        """
+        Rebuild a game from its event log (e.g. after a JSON round trip). Replaying is quiet and takes the dice and
+        cards from the log, so the game ends up exactly as it was. The returned game keeps recording.
+        """
+        if not events or events[0][0] not in (EVENT_START, EVENT_STATE):
+            raise ValueError("An event log has to begin with the start of the game or a checkpoint")
+        if events[0][0] == EVENT_START:
+            (_, chat_id, players) = events[0]
+            game = cls(chat_id, {user_id: name for (user_id, name) in players}, bot, quiet=True, record=True)
+        else:
+            game = cls.from_state(events[0][1], bot)
+            game.quiet = True
+            game.record([tuple(events[0])])
+        game.play_back(events[1:])
+        return game
+
+    def play_back(self, events):
+        """
+        Play the commands of events, logged by this game or one in the same state, on the game again. The dice and
+        cards come from the log, and nothing is sent.
+        """
+        quiet = self.quiet
+        self.quiet = True
+        self.draws.replayed = deque(event[1] for event in events if event[0] == EVENT_DRAW)
+        try:
+            for event in events:
+                if event[0] == EVENT_COMMAND:
+                    if event[1] not in COMMANDS:
+                        raise ValueError("Unknown command in event log: " + str(event[1]))
+                    getattr(self, event[1])(*event[2:])
+        finally:
+            self.draws.replayed = None
+            self.quiet = quiet
+
     def get_players(self):
         return self.players
 
@@ -383,6 +1035,8 @@ class Game:
         return self.pending_payments
 
     def send_message(self, text):
+        if self.quiet:
+            return
         try:
             self.bot.send_message(chat_id=self.chat_id, text=text)
         except TelegramError as e:
@@ -399,13 +1053,6 @@ class Game:
 
         return True
 
-    def update_image_gamestate(self):
-        img = Image.open("monopoly_board.jpg")
-        draw = ImageDraw.Draw(img)
-
-        for p in self.players.values():
-            draw.rectangle((1522, 88 + p.get_id() * 40), (1542, 108 + p.get_id() * 40), fill=p.get_icon_color())
-
     def check_pass_go(self, text, last_total_roll, current_total_roll, player):
         if player.get_position() == 0 and current_total_roll > 0:
             self.send_message("You landed on Go and collected $200!")
@@ -413,21 +1060,25 @@ class Game:
             return
 
         if last_total_roll // len(self.board) < current_total_roll // len(self.board):
-            self.send_message("You " + text + " Go and collected $200!")
+            if not self.quiet:
+                self.send_message("You " + text + " Go and collected $200!")
             player.add_money(200)
 
-    def get_player_by_local_id(self, id) -> Optional[Player]:
+    # Has to be called whenever players are added or removed.
+    def index_players(self):
+        self.players_by_id = {}
+        self.players_by_name = {}
         for p in self.players.values():
-            if p.get_id() == id:
-                return p
-        return None
+            self.players_by_id[p.get_id()] = p
+            self.players_by_name.setdefault(p.get_name().lower(), p)
+
+    def get_player_by_local_id(self, id) -> Optional[Player]:
+        return self.players_by_id.get(id)
 
     def get_player_by_name(self, name) -> Optional[Player]:
-        for p in self.players.values():
-            if p.get_name().lower() == name.lower():
-                return p
-        return None
+        return self.players_by_name.get(name.lower())
 
+    @command
     def pay_bail(self, id):
         player = self.players.get(id)
 
@@ -456,6 +1107,7 @@ class Game:
             self.send_message("You have enough in total assets to pay your bail, \
                               but you need to sell some houses or mortgage some properties.")
 
+    @command
     def use_get_out_of_jail_free_card(self, id):
         player = self.players.get(id)
 
@@ -475,6 +1127,7 @@ class Game:
         self.send_message("You have used a Get Out of Jail Free card to escape jail!")
 
     # This pay will be called using the pending pays list in the game.
+    @command
     def pay(self, from_id, to_id, amount):
         payer = self.players.get(from_id)
         if to_id is None or to_id == "bank":
@@ -489,30 +1142,96 @@ class Game:
             self.send_message("That transaction is not a pending payment!")
             return
 
-        if payee is None:
-            if payer.get_money() >= amount:
-                payer.add_money(-amount)
-                self.pending_payments.remove((payer, payee, amount))
+        if payer.get_money() < amount:
+            self.explain_shortfall(payer, payee, amount)
+        elif payee is None:
+            payer.add_money(-amount)
+            self.pending_payments.remove((payer, payee, amount))
+            if not self.quiet:
                 self.send_message("You paid the bank $" + str(amount) + "!")
-            elif payer.get_total_assets() < amount:
-                self.send_message("You do not have enough total assets to pay the bank!")
-                self.send_message("You can either go bankrupt or convince someone else to trade for what you need!")
-            else:
-                self.send_message("You have enough total assets to pay the bank, but need to sell some houses or "
-                                  "mortgage properties.")
         else:
-            if payer.get_money() >= amount:
-                payer.add_money(-amount)
-                payee.add_money(amount)
-                self.pending_payments.remove((payer, payee, amount))
+            payer.add_money(-amount)
+            payee.add_money(amount)
+            self.pending_payments.remove((payer, payee, amount))
+            if not self.quiet:
                 self.send_message("You paid " + payee.get_name() + " $" + str(amount) + "!")
-            elif payer.get_total_assets() < amount:
-                self.send_message("You do not have enough total assets to pay " + payee.get_name() + "!")
+
+    def explain_shortfall(self, payer, payee, amount):
+        """Tell a player who doesn't have amount in cash what they can do, going by what /autopay would manage."""
+        if self.quiet:
+            return
+        name = "the bank" if payee is None else payee.get_name()
+        if plan_liquidation(payer, amount) is None:
+            self.send_message("You do not have enough total assets to pay " + name + "!")
+            self.send_message("You can either go bankrupt or convince someone else to trade for what you need!")
+            return
+        text = "You have enough total assets to pay " + name + ", but need to sell some houses or mortgage properties."
+        # /autopay pays all of the player's debts at once.
+        owed = sum(debt for (debtor, _, debt) in self.pending_payments if debtor == payer)
+        if plan_liquidation(payer, owed) is not None:
+            text += " /autopay will do that for you."
+        self.send_message(text)
+
+    # Sells buildings and mortgages properties as needed to pay all of a player's pending payments in one go,
+    # losing as little rent as possible. Either everything goes through or nothing changes.
+    @command
+    def autopay(self, id):
+        player = self.players.get(id)
+
+        if player is None:
+            self.send_message("You don't seem to exist!")
+            return
+
+        debts = [debt for debt in self.pending_payments if debt[0] == player]
+        if not debts:
+            self.send_message("You don't have any pending payments!")
+            return
+
+        owed = sum(amount for (_, _, amount) in debts)
+        plan = plan_liquidation(player, owed)
+        if plan is None:
+            if not self.quiet:
+                self.send_message("You do not have enough total assets to pay the $" + str(owed) + " you owe!")
                 self.send_message("You can either go bankrupt or convince someone else to trade for what you need!")
-            else:
-                self.send_message("You have enough total assets to pay " + payee.get_name() + \
-                                  ", but need to sell some houses or mortgage properties.")
+            return
 
+        snapshot = self.snapshot(rng=False)
+        quiet = self.quiet
+        raised: Dict[Tuple[str, str], int] = {}
+        self.quiet = True
+        try:
+            for (name, property) in plan:
+                money = player.get_money()
+                getattr(self, name)(id, [str(player.get_properties().index(property))])
+                key = (name, property.get_name())
+                raised[key] = raised.get(key, 0) + player.get_money() - money
+            for (_, payee, amount) in debts:
+                self.pay(id, None if payee is None else str(payee.get_id()), amount)
+        except Exception:
+            self.restore(snapshot)
+            raise
+        finally:
+            self.quiet = quiet
+
+        if any(debt[0] == player for debt in self.pending_payments):
+            self.restore(snapshot)
+            self.send_message("Your payments couldn't all be made, so nothing has changed.")
+            return
+
+        if self.quiet:
+            return
+
+        verbs = {"sell_hotel": "Sold the hotel on ", "sell_house": "Sold houses on ",
+                 "mortgage_property": "Mortgaged "}
+        text = player.get_name() + " paid $" + str(owed) + " (" + \
+            ", ".join(("the bank" if payee is None else payee.get_name()) + " $" + str(amount)
+                      for (_, payee, amount) in debts) + ").\n"
+        for ((name, property_name), cash) in raised.items():
+            text += verbs[name] + property_name + " for $" + str(cash) + ".\n"
+        text += "Money left: $" + str(player.get_money())
+        self.send_message(text)
+
+    @command
     def end_turn(self, id):
         player = self.players.get(id)
 
@@ -542,6 +1261,9 @@ class Game:
         self.last_roll = [-1]
         self.has_doubles = False
 
+        if self.quiet:
+            return
+
         current_pos = self.board[self.get_player_by_local_id(self.turn).get_position()]
         if isinstance(current_pos, Property) or isinstance(current_pos, OtherProperty):
             current_pos = f"{current_pos.get_name()} [{current_pos.get_color()}]"
@@ -554,6 +1276,7 @@ class Game:
 
     # I need to be careful about making sure the objects aren't copied.
     # I need the original objects to be passed around.
+    @command
     def purchase_property(self, id):
         player = self.players.get(id)
         property = self.board[player.get_position()]
@@ -577,8 +1300,10 @@ class Game:
         player.add_property(property)
         player.sort_props_by_color()
 
-        self.send_message("You have purchased " + property.get_name() + " for $" + str(property_cost) + "!")
+        if not self.quiet:
+            self.send_message("You have purchased " + property.get_name() + " for $" + str(property_cost) + "!")
 
+    @command
     def mortgage_property(self, id, prop_ids):
         player = self.players.get(id)
 
@@ -600,21 +1325,26 @@ class Game:
                 self.send_message("You cannot mortgage a property that's already mortgaged!")
                 continue
 
-            # I'm going to have mortgage property autosell the houses and hotels on the property.
+            mortgage_value = self.mortgage(player, property)
+            if not self.quiet:
+                self.send_message("You have mortgaged " + property.get_name() + " for $" + str(mortgage_value) + "!")
 
-            mortgage_value = property.get_mortgage_value()
-            if type(property) == Property:
-                mortgage_value += property.get_houses() * property.get_house_cost()
-                mortgage_value += property.get_hotels() * property.get_hotel_cost() + \
-                                  property.get_hotels() * property.get_house_cost() * 4
-                property.set_houses(0)
-                property.set_hotels(0)
+    def mortgage(self, player, property) -> int:
+        # I'm going to have mortgage property autosell the houses and hotels on the property.
+        mortgage_value = property.get_mortgage_value()
+        if type(property) == Property:
+            mortgage_value += property.get_houses() * property.get_house_cost()
+            mortgage_value += property.get_hotels() * property.get_hotel_cost() + \
+                              property.get_hotels() * property.get_house_cost() * 4
+            property.set_houses(0)
+            property.set_hotels(0)
 
-            player.add_money(mortgage_value)
-            property.set_mortgaged(True)
-            self.send_message("You have mortgaged " + property.get_name() + " for $" + str(mortgage_value) + "!")
+        player.add_money(mortgage_value)
+        property.set_mortgaged(True)
+        return mortgage_value
 
 
+    @command
     def unmortgage_property(self, id, prop_ids):
         player = self.players.get(id)
 
@@ -628,26 +1358,33 @@ class Game:
                 property = player.get_property_by_name(prop_id)
 
             if property not in player.get_properties():
-                self.send_message("You cannot mortgage a property (" + str(prop_id) + ") that isn't yours!")
+                if not self.quiet:
+                    self.send_message("You cannot mortgage a property (" + str(prop_id) + ") that isn't yours!")
                 continue
 
             if not property.get_mortgaged():
-                self.send_message("You cannot unmortgage a property (" + str(prop_id) + ") that isn't mortgaged!")
+                if not self.quiet:
+                    self.send_message("You cannot unmortgage a property (" + str(prop_id) + ") that isn't mortgaged!")
                 continue
 
             unmortgage_cost = property.get_mortgage_value()
 
             if player.get_money() < unmortgage_cost:
-                self.send_message("You don't have enough in money to unmortgage that property (" + str(prop_id) + ")!")
+                if not self.quiet:
+                    self.send_message("You don't have enough in money to unmortgage that property (" + str(prop_id) +
+                                      ")!")
                 continue
 
             if player.get_total_assets() < unmortgage_cost:
-                self.send_message("You don't even have enough in total assets to unmortgage that property (" + str(prop_id) + ")!")
+                if not self.quiet:
+                    self.send_message("You don't even have enough in total assets to unmortgage that property (" +
+                                      str(prop_id) + ")!")
                 continue
 
             player.add_money(-unmortgage_cost)
             property.set_mortgaged(False)
-            self.send_message("You have unmortgaged " + property.get_name() + " for $" + str(unmortgage_cost) + "!")
+            if not self.quiet:
+                self.send_message("You have unmortgaged " + property.get_name() + " for $" + str(unmortgage_cost) + "!")
 
     # This will work as follows:
     # The current turn player will propose a trade -- if one is not in progress.
@@ -657,6 +1394,7 @@ class Game:
     # They also specify what they want from the other player.
     # The other player can also change these terms simultaneously.
     # Once both players agree to the trade, it will go through.
+    @command
     def setup_trade(self, id_1, id_2):
         player_1 = self.players.get(id_1)
         if str(id_2).isdigit():
@@ -671,9 +1409,12 @@ class Game:
             self.send_message("The second trader doesn't seem to exist!")
             return
 
-        self.pending_trade = [player_1, player_2, 0, 0, [], [], 0, 0, False, False]
-        self.send_message("A trade is now pending between " + player_1.get_name() + " and " + player_2.get_name() + "!")
+        self.pending_trade = Trade(player_1, player_2)
+        if not self.quiet:
+            self.send_message("A trade is now pending between " + player_1.get_name() + " and " +
+                              player_2.get_name() + "!")
 
+    @command
     def cancel_trade(self, id):
         player = self.players.get(id)
 
@@ -681,7 +1422,7 @@ class Game:
             self.send_message("There is no pending trade!")
             return
 
-        if player not in self.pending_trade:
+        if self.pending_trade.side(player) is None:
             self.send_message("You are not in this trade and therefore cannot cancel it.")
             return
 
@@ -690,18 +1431,21 @@ class Game:
 
     # Both players call this to add items to the trade. The agreement on what to add is
     # made in the chat.
+    @command
     def add_to_trade(self, id, prop, money, cards):
         player = self.players.get(id)
+        trade = self.pending_trade
 
-        if self.pending_trade is None:
+        if trade is None:
             self.send_message("There is no pending trade!")
             return
 
-        if player not in self.pending_trade:
+        side = trade.side(player)
+        if side is None:
             self.send_message("You are not in this trade and therefore cannot change its terms.")
             return
 
-        if self.pending_trade[8] or self.pending_trade[9]:
+        if trade.any_agreed():
             self.send_message("At least one person has agreed to the current trade. You cannot change its terms.")
             return
 
@@ -713,16 +1457,7 @@ class Game:
             self.send_message("You cannot trade negative quantities of cards.")
             return
 
-        if player == self.pending_trade[0]:
-            current_money = self.pending_trade[2]
-            current_props = self.pending_trade[4]
-            current_cards = self.pending_trade[6]
-        elif player == self.pending_trade[1]:
-            current_money = self.pending_trade[3]
-            current_props = self.pending_trade[5]
-            current_cards = self.pending_trade[7]
-
-        if money + current_money > player.get_money():
+        if money + trade.money[side] > player.get_money():
             self.send_message("You cannot trade more money than you have!")
             return
 
@@ -730,10 +1465,11 @@ class Game:
             self.send_message("That is not a property you own.")
             return
 
+        property = None
         if prop >= 0:
             property = player.get_property_by_id(prop)
 
-            if property in current_props:
+            if property in trade.properties[side]:
                 self.send_message("That property is already in the trade!")
                 return
 
@@ -741,197 +1477,117 @@ class Game:
                 self.send_message("You cannot trade a property with houses or hotels on it.")
                 return
 
-            color_count = 0
-            hh_count = 0
             prop_color = property.get_color()
-            for p in player.get_properties():
-                if type(p) == Property and p.get_color() == prop_color:
-                    color_count += 1
-                    hh_count += p.get_houses() + p.get_hotels()
-
-            if color_count == 2 and (prop_color == "Blue 🟦" or prop_color == "Brown 🟫") and hh_count > 0:
-                self.send_message("You cannot trade a property in a monopoly "
-                                  "if any other properties in the monopoly have houses or hotels!")
-                return
-            if color_count == 3 and not (prop_color == "Blue 🟦" or prop_color == "Brown 🟫") and hh_count > 0:
-                self.send_message("You cannot trade a property in a monopoly "
-                                  "if any other properties in the monopoly have houses or hotels!")
-                return
-
-        if cards + current_cards > player.get_get_out_free_cards():
+            if player.has_color_set(prop_color):
+                hh_count = 0
+                for position in COLOR_GROUPS[prop_color]:
+                    hh_count += self.board[position].get_houses() + self.board[position].get_hotels()
+                if hh_count > 0:
+                    self.send_message("You cannot trade a property in a monopoly "
+                                      "if any other properties in the monopoly have houses or hotels!")
+                    return
+
+        if cards + trade.cards[side] > player.get_get_out_free_cards():
             self.send_message("You do not have that many Get Out of Jail Free cards to trade!")
             return
 
-        if player == self.pending_trade[0]:
-            self.pending_trade[2] += money
-            if prop >= 0: self.pending_trade[4].append(property)
-            self.pending_trade[6] += cards
-        elif player == self.pending_trade[1]:
-            self.pending_trade[3] += money
-            if prop >= 0: self.pending_trade[5].append(property)
-            self.pending_trade[7] += cards
-
-        text = "The following is now in the trade. \n\n From " + self.pending_trade[0].get_name() + ":\n\n" + \
-                          "Money: $" + str(self.pending_trade[2]) + "\n" + "Get Out of Jail Free cards: " + \
-                          str(self.pending_trade[6]) + "\n" + "Properties:\n"
-
-        for p in self.pending_trade[4]:
-            if type(p) == Property:
-                text += p.get_name() + " : " + p.get_color() + \
-                        " (" + str(p.get_houses()) + " houses " + "($" + str(p.get_house_cost()) + "), " + \
-                        str(p.get_hotels()) + " hotels " + "($" + str(p.get_hotel_cost()) + "))" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
-            elif type(p) == OtherProperty:
-                text += p.get_name() + " : " + p.get_type() + "\n" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
-
-        text += "\nFrom " + self.pending_trade[1].get_name() + ":\n\n" + \
-                          "Money: $" + str(self.pending_trade[3]) + "\n" + "Get Out of Jail Free cards: " + \
-                          str(self.pending_trade[7]) + "\n" + "Properties:\n"
-        for p in self.pending_trade[5]:
-            if type(p) == Property:
-                text += p.get_name() + " : " + p.get_color() + \
-                        " (" + str(p.get_houses()) + " houses " + "($" + str(p.get_house_cost()) + "), " + \
-                        str(p.get_hotels()) + " hotels " + "($" + str(p.get_hotel_cost()) + "))" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
-            elif type(p) == OtherProperty:
-                text += p.get_name() + " : " + p.get_type() + "\n" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
-
-        self.send_message(text)
+        self.send_trade_changes(trade.add(side, property, money, cards))
 
+    @command
     def remove_from_trade(self, id, prop, money, cards):
         player = self.players.get(id)
+        trade = self.pending_trade
 
-        if self.pending_trade is None:
+        if trade is None:
             self.send_message("There is no pending trade!")
             return
 
-        if player not in self.pending_trade:
+        side = trade.side(player)
+        if side is None:
             self.send_message("You are not in this trade and therefore cannot change its terms.")
             return
 
-        if self.pending_trade[8] or self.pending_trade[9]:
+        if trade.any_agreed():
             self.send_message("At least one person has agreed to the current trade. You cannot change its terms.")
             return
 
-        if player == self.pending_trade[0]:
-            current_money = self.pending_trade[2]
-            current_props = self.pending_trade[4]
-            current_cards = self.pending_trade[6]
-        elif player == self.pending_trade[1]:
-            current_money = self.pending_trade[3]
-            current_props = self.pending_trade[5]
-            current_cards = self.pending_trade[7]
-
         if prop >= len(player.get_properties()):
             self.send_message("That is not a property you own.")
             return
 
+        property = None
         if prop >= 0:
             property = player.get_property_by_id(prop)
 
-            if property not in current_props:
+            if property not in trade.properties[side]:
                 self.send_message("That property is not in the trade!")
                 return
 
         # Money and cards when removed are thresholded to 0 if lower than 0.
-        if player == self.pending_trade[0]:
-            self.pending_trade[2] = 0 if current_money - money <= 0 else self.pending_trade[2] - money
-            if prop >= 0: self.pending_trade[4].remove(property)
-            self.pending_trade[6] = 0 if current_cards - cards <= 0 else self.pending_trade[6] - cards
-        elif player == self.pending_trade[1]:
-            self.pending_trade[3] = 0 if current_money - money <= 0 else self.pending_trade[2] - money
-            if prop >= 0: self.pending_trade[5].remove(property)
-            self.pending_trade[7] = 0 if current_cards - cards <= 0 else self.pending_trade[6] - cards
-
-        text = "The following is now in the trade. \n\n From " + self.pending_trade[0].get_name() + ":\n\n" + \
-                          "Money: $" + str(self.pending_trade[2]) + "\n" + "Get Out of Jail Free cards: " + \
-                          str(self.pending_trade[6]) + "\n" + "Properties:\n"
-        for p in self.pending_trade[4]:
-            if type(p) == Property:
-                text += p.get_name() + " : " + p.get_color() + \
-                        " (" + str(p.get_houses()) + " houses " + "($" + str(p.get_house_cost()) + "), " + \
-                        str(p.get_hotels()) + " hotels " + "($" + str(p.get_hotel_cost()) + "))" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
-            elif type(p) == OtherProperty:
-                text += p.get_name() + " : " + p.get_type() + "\n" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
-
-        text += "\nFrom " + self.pending_trade[1].get_name() + ":\n\n" + \
-                          "Money: $" + str(self.pending_trade[3]) + "\n" + "Get Out of Jail Free cards: " + \
-                          str(self.pending_trade[7]) + "\n" + "Properties:\n"
-        for p in self.pending_trade[5]:
-            if type(p) == Property:
-                text += p.get_name() + " : " + p.get_color() + \
-                        " (" + str(p.get_houses()) + " houses " + "($" + str(p.get_house_cost()) + "), " + \
-                        str(p.get_hotels()) + " hotels " + "($" + str(p.get_hotel_cost()) + "))" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
-            elif type(p) == OtherProperty:
-                text += p.get_name() + " : " + p.get_type() + "\n" + \
-                        " [Mortgage Value: " + str(p.get_mortgage_value()) + "] " + \
-                        ("[[Mortgaged]]\n" if p.get_mortgaged() else "\n")
+        self.send_trade_changes(trade.remove(side, property, max(0, money), max(0, cards)))
 
-        self.send_message(text)
+    def send_trade_changes(self, changes):
+        if not changes:
+            self.send_message("Nothing in the trade has changed. /showtrade will show the whole trade.")
+            return
+        if not self.quiet:
+            self.send_message("The trade has changed:\n" + "\n".join(changes) +
+                              "\n\n/showtrade will show the whole trade.")
+
+    def show_trade(self):
+        if self.pending_trade is None:
+            self.send_message("There is no pending trade!")
+            return
+        if not self.quiet:
+            self.send_message("The following is now in the trade.\n\n" + self.pending_trade.render())
 
+    @command
     def agree_to_trade(self, id):
         player = self.players.get(id)
+        trade = self.pending_trade
 
-        if self.pending_trade is None:
+        if trade is None:
             self.send_message("There is no pending trade!")
             return
 
-        if player not in self.pending_trade:
+        side = trade.side(player)
+        if side is None:
             self.send_message("You are not in this trade and therefore cannot agree to have it.")
             return
 
-        if player == self.pending_trade[0]:
-            self.pending_trade[8] = True
-        elif player == self.pending_trade[1]:
-            self.pending_trade[9] = True
-
-        self.send_message(player.get_name() + " has agreed to the trade!")
+        trade.agreed[side] = True
+        if not self.quiet:
+            self.send_message(player.get_name() + " has agreed to the trade!")
 
+    @command
     def disagree_to_trade(self, id):
         player = self.players.get(id)
+        trade = self.pending_trade
 
-        if self.pending_trade is None:
+        if trade is None:
             self.send_message("There is no pending trade!")
             return
 
-        if player not in self.pending_trade:
+        side = trade.side(player)
+        if side is None:
             self.send_message("You are not in this trade and therefore cannot agree to have it.")
             return
 
-        if player == self.pending_trade[0]:
-            self.pending_trade[8] = False
-        elif player == self.pending_trade[1]:
-            self.pending_trade[9] = False
-
-        self.send_message(player.get_name() + " has disagreed to the trade!")
+        trade.agreed[side] = False
+        if not self.quiet:
+            self.send_message(player.get_name() + " has disagreed to the trade!")
 
+    @command
     def trade(self, bankrupt=False):
         if self.pending_trade is None:
             self.send_message("There is no pending trade!")
             return
 
-        player_1 = self.pending_trade[0]
-        player_2 = self.pending_trade[1]
-        money_from_1 = self.pending_trade[2]
-        money_from_2 = self.pending_trade[3]
-        props_from_1 = self.pending_trade[4]
-        props_from_2 = self.pending_trade[5]
-        cards_from_1 = self.pending_trade[6]
-        cards_from_2 = self.pending_trade[7]
-        agreed_1 = self.pending_trade[8]
-        agreed_2 = self.pending_trade[9]
+        (player_1, player_2) = self.pending_trade.players
+        (money_from_1, money_from_2) = self.pending_trade.money
+        (props_from_1, props_from_2) = self.pending_trade.properties
+        (cards_from_1, cards_from_2) = self.pending_trade.cards
+        (agreed_1, agreed_2) = self.pending_trade.agreed
 
         if not agreed_1 or not agreed_2:
             self.send_message("At least one of the players has not consented to this trade.")
@@ -953,29 +1609,21 @@ class Game:
             self.send_message("You cannot trade more Get Out of Jail free cards than you have!")
             return
 
-        text = ""
-
         if not bankrupt:
             player_1.add_money(-money_from_1)
             player_1.add_money(money_from_2)
-            text += player_2.get_name() + " has traded $" + str(money_from_2) + \
-                              " to " + player_1.get_name() + "!\n"
         player_2.add_money(-money_from_2)
         player_2.add_money(money_from_1)
-        text += player_1.get_name() + " has traded $" + str(money_from_1) + \
-                          " to " + player_2.get_name() + "!\n"
 
         if not bankrupt:
             for p in props_from_2:
                 player_2.remove_property(p)
                 p.set_owner(player_1)
                 player_1.add_property(p)
-                text += player_2.get_name() + " has traded " + p.get_name() + " to " + player_1.get_name() + "!\n"
         for p in props_from_1:
             player_1.remove_property(p)
             p.set_owner(player_2)
             player_2.add_property(p)
-            text += player_1.get_name() + " has traded " + p.get_name() + " to " + player_2.get_name() + "!\n"
 
         if not bankrupt:
             for i in range(cards_from_2):
@@ -983,18 +1631,32 @@ class Game:
         for i in range(cards_from_1):
             player_2.add_out_free_card()
 
-        if not bankrupt:
-            text += player_2.get_name() + " has traded " + str(cards_from_2) + " cards to " + player_1.get_name() + "!\n"
-        text += player_1.get_name() + " has traded " + str(cards_from_1) + " cards to " + player_2.get_name() + "!\n"
-
         player_1.sort_props_by_color()
         player_2.sort_props_by_color()
 
+        if self.quiet:
+            return
+
+        text = ""
+        if not bankrupt:
+            text += player_2.get_name() + " has traded $" + str(money_from_2) + \
+                              " to " + player_1.get_name() + "!\n"
+        text += player_1.get_name() + " has traded $" + str(money_from_1) + \
+                          " to " + player_2.get_name() + "!\n"
+        if not bankrupt:
+            for p in props_from_2:
+                text += player_2.get_name() + " has traded " + p.get_name() + " to " + player_1.get_name() + "!\n"
+        for p in props_from_1:
+            text += player_1.get_name() + " has traded " + p.get_name() + " to " + player_2.get_name() + "!\n"
+        if not bankrupt:
+            text += player_2.get_name() + " has traded " + str(cards_from_2) + " cards to " + player_1.get_name() + "!\n"
+        text += player_1.get_name() + " has traded " + str(cards_from_1) + " cards to " + player_2.get_name() + "!\n"
         if not bankrupt:
             text += "\nThe trade has completed!\n"
 
         self.send_message(text)
 
+    @command
     def purchase_house(self, id, property_ids):
         player = self.players.get(id)
 
@@ -1008,7 +1670,9 @@ class Game:
                 property = player.get_property_by_name(property_id)
 
             if property not in player.get_properties():
-                self.send_message("You cannot buy a house on a property (" + str(property_id) + ") that isn't yours!")
+                if not self.quiet:
+                    self.send_message("You cannot buy a house on a property (" + str(property_id) +
+                                      ") that isn't yours!")
                 continue
 
             if type(property) == OtherProperty:
@@ -1016,30 +1680,26 @@ class Game:
                 continue
 
             if property.get_houses() == 4 or property.get_hotels() == 1:
-                self.send_message(property.get_name() + " has the maximium number of houses already!")
+                if not self.quiet:
+                    self.send_message(property.get_name() + " has the maximium number of houses already!")
                 continue
 
-            color_count = 0
-            prop_color = property.get_color()
-            for p in player.get_properties():
-                if type(p) == Property and p.get_color() == prop_color:
-                    color_count += 1
-
-            if color_count < 2 and (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
-                continue
-            if color_count < 3 and not (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
+            if not player.has_color_set(property.get_color()):
+                if not self.quiet:
+                    self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
                 continue
 
             if player.get_money() < property.get_house_cost():
-                self.send_message("You do not have enough money to afford a house on " + property.get_name() + "!")
+                if not self.quiet:
+                    self.send_message("You do not have enough money to afford a house on " + property.get_name() + "!")
                 continue
 
             player.add_money(-property.get_house_cost())
             property.add_house()
-            self.send_message("You have added a house to " + property.get_name() + "!")
+            if not self.quiet:
+                self.send_message("You have added a house to " + property.get_name() + "!")
 
+    @command
     def purchase_hotel(self, id, property_ids):
         player = self.players.get(id)
 
@@ -1053,7 +1713,9 @@ class Game:
                 property = player.get_property_by_name(property_id)
 
             if property not in player.get_properties():
-                self.send_message("You cannot buy a hotel on a property (" + str(property_id) + ") that isn't yours!")
+                if not self.quiet:
+                    self.send_message("You cannot buy a hotel on a property (" + str(property_id) +
+                                      ") that isn't yours!")
                 continue
 
             if type(property) == OtherProperty:
@@ -1061,17 +1723,21 @@ class Game:
                 continue
 
             if property.get_houses() < 4 or property.get_hotels() == 1:
-                self.send_message(property.get_name() + " has too few houses or already has a hotel!")
+                if not self.quiet:
+                    self.send_message(property.get_name() + " has too few houses or already has a hotel!")
                 continue
 
             if player.get_money() < property.get_hotel_cost():
-                self.send_message("You do not have enough money to afford a hotel on " + property.get_name() + "!")
+                if not self.quiet:
+                    self.send_message("You do not have enough money to afford a hotel on " + property.get_name() + "!")
                 continue
 
             player.add_money(-property.get_hotel_cost())
             property.add_hotel()
-            self.send_message("You have added a hotel to " + property.get_name() + "!")
+            if not self.quiet:
+                self.send_message("You have added a hotel to " + property.get_name() + "!")
 
+    @command
     def sell_house(self, id, property_ids):
         player = self.players.get(id)
 
@@ -1086,7 +1752,9 @@ class Game:
                 property = player.get_property_by_name(property_id)
 
             if property not in player.get_properties():
-                self.send_message("You cannot sell a house on a property (" + str(property_id) + ") that isn't yours!")
+                if not self.quiet:
+                    self.send_message("You cannot sell a house on a property (" + str(property_id) +
+                                      ") that isn't yours!")
                 continue
 
             if type(property) == OtherProperty:
@@ -1094,26 +1762,21 @@ class Game:
                 continue
 
             if property.get_houses() == 0:
-                self.send_message(property.get_name() + " has no houses!")
+                if not self.quiet:
+                    self.send_message(property.get_name() + " has no houses!")
                 continue
 
-            color_count = 0
-            prop_color = property.get_color()
-            for p in player.get_properties():
-                if type(p) == Property and p.get_color() == prop_color:
-                    color_count += 1
-
-            if color_count < 2 and (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
-                continue
-            if color_count < 3 and not (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
+            if not player.has_color_set(property.get_color()):
+                if not self.quiet:
+                    self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
                 continue
 
             player.add_money(property.get_house_cost())
             property.remove_house()
-            self.send_message("You have removed a house from " + property.get_name() + "!")
+            if not self.quiet:
+                self.send_message("You have removed a house from " + property.get_name() + "!")
 
+    @command
     def sell_hotel(self, id, property_ids):
         player = self.players.get(id)
 
@@ -1128,7 +1791,9 @@ class Game:
                 property = player.get_property_by_name(property_id)
 
             if property not in player.get_properties():
-                self.send_message("You cannot sell a hotel on a property (" + str(property_id) + ") that isn't yours!")
+                if not self.quiet:
+                    self.send_message("You cannot sell a hotel on a property (" + str(property_id) +
+                                      ") that isn't yours!")
                 continue
 
             if type(property) == OtherProperty:
@@ -1136,63 +1801,241 @@ class Game:
                 continue
 
             if property.get_hotels() == 0:
-                self.send_message(property.get_name() + " does not have a hotel!")
+                if not self.quiet:
+                    self.send_message(property.get_name() + " does not have a hotel!")
                 continue
 
-            color_count = 0
-            prop_color = property.get_color()
-            for p in player.get_properties():
-                if type(p) == Property and p.get_color() == prop_color:
-                    color_count += 1
-
-            if color_count < 2 and (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
-                continue
-            if color_count < 3 and not (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
+            if not player.has_color_set(property.get_color()):
+                if not self.quiet:
+                    self.send_message("You do not own the full set of this color property (" + str(property_id) + ")!")
                 continue
 
             player.add_money(property.get_hotel_cost())
             property.remove_hotel()
-            self.send_message("You have removed a hotel from " + property.get_name() + "!")
+            if not self.quiet:
+                self.send_message("You have removed a hotel from " + property.get_name() + "!")
+
+    # Bulk versions of the building and mortgage commands, for a whole group of properties at once (see
+    # PROPERTY_GROUPS). Each checks the whole batch up front, makes every change or none, and sends one summary.
+
+    def get_group(self, player, group) -> Optional[List[Property]]:
+        positions = PROPERTY_GROUPS.get(group_key(group))
+        if positions is None:
+            if not self.quiet:
+                self.send_message("\"" + group + "\" is not a color, railroads, utilities or all!")
+            return None
+        return [self.board[position] for position in positions if self.board[position].get_owner() == player]
+
+    def get_color_set(self, player, group) -> Optional[List[Property]]:
+        props = self.get_group(player, group)
+        if props is None:
+            return None
+        if not props or type(props[0]) != Property or not player.has_color_set(props[0].get_color()):
+            if not self.quiet:
+                self.send_message("You do not own the full set of " + group + "!")
+            return None
+        return props
+
+    def apply_steps(self, player, steps, direction):
+        """Build (direction 1) or sell (direction -1) one building on each property of steps, in order."""
+        for p in steps:
+            hotel = building_level(p) == (4 if direction > 0 else 5)
+            price = p.get_hotel_cost() if hotel else p.get_house_cost()
+            player.add_money(-direction * price)
+            if direction > 0:
+                p.add_hotel() if hotel else p.add_house()
+            else:
+                p.remove_hotel() if hotel else p.remove_house()
+
+    def send_batch_summary(self, player, verb, changes, money):
+        if self.quiet:
+            return
+        text = player.get_name() + " " + verb + " for $" + str(abs(money)) + ":\n"
+        for (property, change) in changes.items():
+            text += property.get_name() + ": " + change + "\n"
+        text += "Money left: $" + str(player.get_money())
+        self.send_message(text)
+
+    @command
+    def build_houses(self, id, group, level):
+        """Build every property of a color set up to level houses (5 for a hotel), evenly."""
+        player = self.players.get(id)
+        if not self.check_player_existence_and_turn(player):
+            return
+
+        props = self.get_color_set(player, group)
+        if props is None:
+            return
+        if not 0 < level <= 5:
+            self.send_message("You can build from 1 to 4 houses, or 5 for a hotel!")
+            return
+
+        # Always build on the property with the fewest buildings, like the rules ask for.
+        steps = []
+        cost = 0
+        levels = {p: building_level(p) for p in props}
+        while True:
+            p = min(props, key=lambda p: levels[p])
+            if levels[p] >= level:
+                break
+            steps.append(p)
+            cost += p.get_hotel_cost() if levels[p] == 4 else p.get_house_cost()
+            levels[p] += 1
+        if not steps:
+            self.send_message("Every property in the set already has that many buildings!")
+            return
+        if cost > player.get_money():
+            if not self.quiet:
+                self.send_message("Building that costs $" + str(cost) + ", but you only have $" +
+                                  str(player.get_money()) + "!")
+            return
+
+        self.apply_steps(player, steps, 1)
+        self.send_batch_summary(player, "built on " + props[0].get_color(),
+                                {p: describe_level(building_level(p)) for p in props}, cost)
+
+    @command
+    def sell_houses(self, id, group, level):
+        """Sell the buildings on every property of a color set down to level houses, evenly."""
+        player = self.players.get(id)
+        if player is None:
+            self.send_message("You don't seem to exist!")
+            return
+
+        props = self.get_color_set(player, group)
+        if props is None:
+            return
+        if not 0 <= level < 5:
+            self.send_message("You can sell down to from 0 to 4 houses!")
+            return
+
+        steps = []
+        levels = {p: building_level(p) for p in props}
+        while True:
+            p = max(props, key=lambda p: levels[p])
+            if levels[p] <= level:
+                break
+            steps.append(p)
+            levels[p] -= 1
+        if not steps:
+            self.send_message("No property in the set has more buildings than that!")
+            return
+
+        money = player.get_money()
+        self.apply_steps(player, steps, -1)
+        self.send_batch_summary(player, "sold on " + props[0].get_color(),
+                                {p: describe_level(building_level(p)) for p in props}, player.get_money() - money)
+
+    @command
+    def build_max(self, id, floor=0):
+        """
+        Spend everything above floor on houses and hotels, building evenly within every color set the player can
+        build on. Every next building is the one that adds the most rent for its price.
+        """
+        player = self.players.get(id)
+        if not self.check_player_existence_and_turn(player):
+            return
+
+        sets = [[self.board[position] for position in positions] for (color, positions) in COLOR_GROUPS.items()
+                if player.has_color_set(color)]
+        # Buildings on a mortgaged set wouldn't earn anything.
+        sets = [props for props in sets if not any(p.get_mortgaged() for p in props)]
+        levels = {p: building_level(p) for props in sets for p in props}
+        budget = player.get_money() - floor
+        steps = []
+        while True:
+            candidates = []
+            for props in sets:
+                lowest = min(levels[p] for p in props)
+                for p in props:
+                    if levels[p] == lowest < 5:
+                        price = p.get_hotel_cost() if lowest == 4 else p.get_house_cost()
+                        if price <= budget:
+                            gain = property_rent(p, lowest + 1, True) - property_rent(p, lowest, True)
+                            candidates.append((gain / price, price, p))
+            if not candidates:
+                break
+            (_, price, p) = max(candidates, key=lambda c: c[0])
+            steps.append(p)
+            levels[p] += 1
+            budget -= price
+
+        if not steps:
+            if not self.quiet:
+                self.send_message("There is nothing you can afford to build while keeping $" + str(floor) + "!")
+            return
+
+        money = player.get_money()
+        self.apply_steps(player, steps, 1)
+        self.send_batch_summary(player, "built", {p: describe_level(building_level(p)) for p in steps},
+                                money - player.get_money())
+
+    @command
+    def mortgage_properties(self, id, group):
+        """Mortgage every unmortgaged property of a group, selling the buildings on them."""
+        player = self.players.get(id)
+        if player is None:
+            self.send_message("You don't seem to exist!")
+            return
+
+        props = self.get_group(player, group)
+        if props is None:
+            return
+        props = [p for p in props if not p.get_mortgaged()]
+        if not props:
+            if not self.quiet:
+                self.send_message("You have nothing in " + group + " left to mortgage!")
+            return
+
+        changes = {}
+        raised = 0
+        for p in props:
+            value = self.mortgage(player, p)
+            raised += value
+            changes[p] = "mortgaged for $" + str(value)
+        self.send_batch_summary(player, "mortgaged " + group, changes, raised)
+
+    @command
+    def unmortgage_properties(self, id, group):
+        """Pay back the mortgage on every mortgaged property of a group."""
+        player = self.players.get(id)
+        if not self.check_player_existence_and_turn(player):
+            return
+
+        props = self.get_group(player, group)
+        if props is None:
+            return
+        props = [p for p in props if p.get_mortgaged()]
+        if not props:
+            if not self.quiet:
+                self.send_message("You have nothing mortgaged in " + group + "!")
+            return
+        cost = sum(p.get_mortgage_value() for p in props)
+        if cost > player.get_money():
+            if not self.quiet:
+                self.send_message("Unmortgaging those costs $" + str(cost) + ", but you only have $" +
+                                  str(player.get_money()) + "!")
+            return
+
+        for p in props:
+            player.add_money(-p.get_mortgage_value())
+            p.set_mortgaged(False)
+        self.send_batch_summary(player, "unmortgaged " + group,
+                                {p: "unmortgaged for $" + str(p.get_mortgage_value()) for p in props}, cost)
 
     def chance_result(self, player):
         # Due to the difficulty of implementation, I've skipped implementing
         # the chance card that say "Advance to the nearest..."
-        card = random.randint(0, 12)
+        card = self.draws.randint(0, CHANCE_CARDS - 1)
         if card == 0:
             self.send_message("Chance Card: Advance to Go! Collect $200!")
-            pos = player.get_position()
-            player.set_position(0)
-
-            last_total_roll = player.get_total_roll()
-            player.add_to_total_roll(0 - pos)
-            current_total_roll = player.get_total_roll()
-            self.check_pass_go("passed", last_total_roll, current_total_roll, player)
-
-            self.enact_roll_result(player)
+            self.move_by_card(player, CHANCE_MOVES[card])
         elif card == 1:
             self.send_message("Chance Card: Advance to Illinois Avenue!")
-            pos = player.get_position()
-            player.set_position(24)
-
-            last_total_roll = player.get_total_roll()
-            player.add_to_total_roll(24 - pos)
-            current_total_roll = player.get_total_roll()
-            self.check_pass_go("passed", last_total_roll, current_total_roll, player)
-
-            self.enact_roll_result(player)
+            self.move_by_card(player, CHANCE_MOVES[card])
         elif card == 2:
             self.send_message("Chance Card: Advance to St. Charles Place!")
-            pos = player.get_position()
-            player.set_position(11)
-
-            last_total_roll = player.get_total_roll()
-            player.add_to_total_roll(11 - pos)
-            current_total_roll = player.get_total_roll()
-            self.check_pass_go("passed", last_total_roll, current_total_roll, player)
-
-            self.enact_roll_result(player)
+            self.move_by_card(player, CHANCE_MOVES[card])
         elif card == 3:
             self.send_message("Chance Card: Band pays you a dividend of $50.")
             player.add_money(50)
@@ -1201,19 +2044,10 @@ class Game:
             player.add_out_free_card()
         elif card == 5:
             self.send_message("Chance Card: Go back three spaces!")
-
-            player.set_position((player.get_position() - 3) % len(self.board))
-            player.add_to_total_roll(-3)
-
-            self.enact_roll_result(player)
+            self.move_by_card(player, CHANCE_MOVES[card])
         elif card == 6:
             self.send_message("Chance Card: Go directly to jail!")
-            pos = player.get_position()
-            player.set_position(10)
-
-            player.add_to_total_roll(10 - pos)
-
-            player.set_turns_left_in_jail(3)
+            self.move_by_card(player, CHANCE_MOVES[card])
         elif card == 7:
             self.send_message("Chance Card: Make general repairs on all your property! For each house pay $25, "
                               "for each hotel pay $100!")
@@ -1221,7 +2055,8 @@ class Game:
             for p in player.get_properties():
                 if type(p) == Property:
                     owed += p.get_houses() * 25 + p.get_hotels() * 100
-            self.send_message("You owe $" + str(owed) + " in total.")
+            if not self.quiet:
+                self.send_message("You owe $" + str(owed) + " in total.")
             if owed > 0:
                 self.pending_payments.append((player, None, owed))
         elif card == 8:
@@ -1229,26 +2064,10 @@ class Game:
             self.pending_payments.append((player, None, 15))
         elif card == 9:
             self.send_message("Chance Card: Take a trip to Reading Railroad!")
-            pos = player.get_position()
-            player.set_position(5)
-
-            last_total_roll = player.get_total_roll()
-            player.add_to_total_roll(5 - pos)
-            current_total_roll = player.get_total_roll()
-            self.check_pass_go("passed", last_total_roll, current_total_roll, player)
-
-            self.enact_roll_result(player)
+            self.move_by_card(player, CHANCE_MOVES[card])
         elif card == 10:
             self.send_message("Chance Card: Take a walk on the Boardwalk!")
-            pos = player.get_position()
-            player.set_position(len(self.board) - 1)
-
-            last_total_roll = player.get_total_roll()
-            player.add_to_total_roll((len(self.board) - 1) - pos)
-            current_total_roll = player.get_total_roll()
-            self.check_pass_go("passed", last_total_roll, current_total_roll, player)
-
-            self.enact_roll_result(player)
+            self.move_by_card(player, CHANCE_MOVES[card])
         elif card == 11:
             self.send_message("Chance Card: You've been elected chairman of the board! Pay each player $50.")
             for id in self.players.keys():
@@ -1259,18 +2078,10 @@ class Game:
             player.add_money(150)
 
     def cc_result(self, player):
-        card = random.randint(0, 14)
+        card = self.draws.randint(0, COMMUNITY_CHEST_CARDS - 1)
         if card == 0:
             self.send_message("Community Chest Card: Advance to Go! Collect $200!")
-            pos = player.get_position()
-            player.set_position(0)
-
-            last_total_roll = player.get_total_roll()
-            player.add_to_total_roll(0 - pos)
-            current_total_roll = player.get_total_roll()
-            self.check_pass_go("passed", last_total_roll, current_total_roll, player)
-
-            self.enact_roll_result(player)
+            self.move_by_card(player, COMMUNITY_CHEST_MOVES[card])
         elif card == 1:
             self.send_message("Community Chest Card: Bank error in your favor! Collect $200!")
             player.add_money(200)
@@ -1285,12 +2096,7 @@ class Game:
             player.add_out_free_card()
         elif card == 5:
             self.send_message("Community Chest Card: Go directly to jail!")
-            pos = player.get_position()
-            player.set_position(10)
-
-            player.add_to_total_roll(10 - pos)
-
-            player.set_turns_left_in_jail(3)
+            self.move_by_card(player, COMMUNITY_CHEST_MOVES[card])
         elif card == 6:
             self.send_message("Community Chest Card: Holiday fund matures. Collect $100!")
             player.add_money(100)
@@ -1318,7 +2124,8 @@ class Game:
             for p in player.get_properties():
                 if type(p) == Property:
                     owed += p.get_houses() * 40 + p.get_hotels() * 115
-            self.send_message("You owe $" + str(owed) + " in total.")
+            if not self.quiet:
+                self.send_message("You owe $" + str(owed) + " in total.")
             if owed > 0:
                 self.pending_payments.append((player, None, owed))
         elif card == 13:
@@ -1328,127 +2135,139 @@ class Game:
             self.send_message("Community Chest Card: You inherit $100!")
             player.add_money(100)
 
+    def move_by_card(self, player, move):
+        pos = player.get_position()
+        if move == TO_JAIL:
+            player.set_position(JAIL_POSITION)
+            player.add_to_total_roll(JAIL_POSITION - pos)
+            player.set_turns_left_in_jail(3)
+            return
+
+        if move == BACK_THREE:
+            player.set_position((pos - 3) % len(self.board))
+            player.add_to_total_roll(-3)
+        else:
+            player.set_position(move)
+
+            last_total_roll = player.get_total_roll()
+            player.add_to_total_roll(move - pos)
+            current_total_roll = player.get_total_roll()
+            self.check_pass_go("passed", last_total_roll, current_total_roll, player)
+
+        self.enact_roll_result(player)
+
     def enact_roll_result(self, player):
         position = player.get_position()
         if position > len(self.board):
             self.send_message("You have somehow managed to get to a position not on the board!")
             return
 
-        if self.board[position] == "Go":
-            #self.check_pass_go("landed on", 0, player.get_total_roll(), player)
-            return
+        LANDING_HANDLERS[position](self, player, position)
 
-        if self.board[position] == "Go To Jail":
-            self.send_message("You landed on Go To Jail! As you might expect, you're going to jail. "
-                              "You can pay your $50 bail now using /bail if you wish.")
-            pos = player.get_position()
-            player.set_position(10)
+    def land_on_go(self, player, position):
+        #self.check_pass_go("landed on", 0, player.get_total_roll(), player)
+        return
 
-            player.add_to_total_roll(10 - pos)
+    def land_on_go_to_jail(self, player, position):
+        self.send_message("You landed on Go To Jail! As you might expect, you're going to jail. "
+                          "You can pay your $50 bail now using /bail if you wish.")
+        player.set_position(10)
 
-            player.set_turns_left_in_jail(3)
-            return
+        player.add_to_total_roll(10 - position)
 
-        if self.board[position] == "Free Parking":
-            self.send_message("You landed on Free Parking!")
-            return
+        player.set_turns_left_in_jail(3)
 
-        if self.board[position] == "Jail" and player.get_turns_left_in_jail() != -1:
+    def land_on_free_parking(self, player, position):
+        self.send_message("You landed on Free Parking!")
+
+    def land_on_jail(self, player, position):
+        if player.get_turns_left_in_jail() != -1:
             self.send_message("You are currently in jail! Escape by rolling doubles, a Get Out of Jail Free card, "
                               "or paying your $50 bail.")
-            return
-
-        if self.board[position] == "Jail" and player.get_turns_left_in_jail() == -1:
+        else:
             self.send_message("You are currently visiting jail.")
-            return
 
-        if self.board[position] == "Chance":
-            self.chance_result(player)
-            return
+    def land_on_chance(self, player, position):
+        self.chance_result(player)
 
-        if self.board[position] == "Community Chest":
-            self.cc_result(player)
-            return
+    def land_on_community_chest(self, player, position):
+        self.cc_result(player)
 
-        if self.board[position] == "Luxury Tax":
-            self.send_message("You landed on Luxury Tax! Pay $100.")
-            self.pending_payments.append((player, None, 100))
-            return
+    def land_on_luxury_tax(self, player, position):
+        self.send_message("You landed on Luxury Tax! Pay $100.")
+        self.pending_payments.append((player, None, 100))
 
-        if self.board[position] == "Income Tax":
-            self.send_message("You landed on Income Tax! Pay $200.")
-            self.pending_payments.append((player, None, 200))
-            return
+    def land_on_income_tax(self, player, position):
+        self.send_message("You landed on Income Tax! Pay $200.")
+        self.pending_payments.append((player, None, 200))
+
+    def charge_rent(self, player, owner, property, rent):
+        self.pending_payments.append((player, owner, rent))
+        self.rent_charged.append((property.get_name(), rent))
 
-        if type(self.board[position]) == Property:
-            property = self.board[position]
+    def land_on_property(self, player, position):
+        property = self.board[position]
+        if not self.quiet:
             self.send_message("You landed on " + property.get_name() + "!")
 
-            if property in self.available_properties:
+        if property in self.available_properties:
+            if not self.quiet:
                 self.send_message("This property is available! You can buy " + \
                                   str(property.get_name()) + " (" + str(property.get_color()) + ") for $" + \
                                   str(property.get_cost()) + ".")
-                return
-            else:
-                if property not in player.get_properties():
-                    owner = property.get_owner()
-                    rent = property.get_rent()
-
-                    color_count = 0
-                    prop_color = property.get_color()
-                    for p in owner.get_properties():
-                        if type(p) == Property and p.get_color() == prop_color:
-                            color_count += 1
-
-                    if color_count == 2 and (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                        rent += property.get_base_rent()
-                    if color_count == 3 and not (prop_color == "Blue 🟦" or prop_color == "Brown 🟫"):
-                        rent += property.get_base_rent()
-
-                    if not property.get_mortgaged():
+            return
+        else:
+            if property not in player.get_properties():
+                owner = property.get_owner()
+                rent = property.get_rent()
+
+                if owner.has_color_set(property.get_color()):
+                    rent += property.get_base_rent()
+
+                if not property.get_mortgaged():
+                    if not self.quiet:
                         self.send_message("You owe " + owner.get_name() + " $" + str(rent) + ".")
-                        self.pending_payments.append((player, owner, rent))
-                    else:
-                        self.send_message("This property is mortgaged!")
+                    self.charge_rent(player, owner, property, rent)
                 else:
-                    self.send_message("You own this property!")
+                    self.send_message("This property is mortgaged!")
+            else:
+                self.send_message("You own this property!")
 
-        if type(self.board[position]) == OtherProperty:
-            property = self.board[position]
+    def land_on_other_property(self, player, position):
+        property = self.board[position]
+        if not self.quiet:
             self.send_message("You landed on " + property.get_name() + "!")
-            if property.mortgaged:
-                self.send_message("This property is mortgaged!")
-                return
+        if property.mortgaged:
+            self.send_message("This property is mortgaged!")
+            return
 
-            if property in self.available_properties:
+        if property in self.available_properties:
+            if not self.quiet:
                 self.send_message("This property is available! You can buy " + \
                                   str(property.get_name()) + " for $" + str(property.get_cost()) + ".")
-                return
-            else:
-                if property not in player.get_properties():
-                    owner = property.get_owner()
-                    rent = property.get_rent()
-                    if property.get_type() == "Railroad":
-                        num_railroads = 0
-                        for p in owner.get_properties():
-                            if type(p) == OtherProperty and p.get_type() == "Railroad" and not p.mortgaged:
-                                num_railroads += 1
-                        final_rent = rent * 2 ** (num_railroads - 1)
+            return
+        else:
+            if property not in player.get_properties():
+                owner = property.get_owner()
+                rent = property.get_rent()
+                if property.get_type() == "Railroad":
+                    num_railroads = owner.get_unmortgaged_count("Railroad")
+                    final_rent = rent * 2 ** (num_railroads - 1)
+                    if not self.quiet:
                         self.send_message("You owe " + owner.get_name() + " $" + str(final_rent) + ".")
-                        self.pending_payments.append((player, owner, final_rent))
-                    elif property.get_type() == "Utility":
-                        num_utils = 0
-                        for p in owner.get_properties():
-                            if type(p) == OtherProperty and p.get_type() == "Utility" and not p.mortgaged:
-                                num_utils += 1
-                        rent = 10 * sum(self.last_roll) if num_utils == 2 else 4 * sum(self.last_roll)
+                    self.charge_rent(player, owner, property, final_rent)
+                elif property.get_type() == "Utility":
+                    num_utils = owner.get_unmortgaged_count("Utility")
+                    rent = 10 * sum(self.last_roll) if num_utils == 2 else 4 * sum(self.last_roll)
+                    if not self.quiet:
                         self.send_message("You owe " + owner.get_name() + " $" + str(rent) + ".")
-                        self.pending_payments.append((player, owner, rent))
-                    else:
-                        self.send_message("This is not a valid property type!")
+                    self.charge_rent(player, owner, property, rent)
                 else:
-                    self.send_message("You own this property!")
+                    self.send_message("This is not a valid property type!")
+            else:
+                self.send_message("You own this property!")
 
+    @command
     def bankrupt(self, id_1, id_2):
         # Player 1 bankrupts to Player 2.
         player_1 = self.players.get(id_1)
@@ -1479,7 +2298,9 @@ class Game:
                 who = Bank()
 
             if player_2 != who:
-                self.send_message(f"You still have a payment of {amount} pending to {who.name}, you can only bankrupt to them")
+                if not self.quiet:
+                    self.send_message(f"You still have a payment of {amount} pending to {who.name}, you can "
+                                      f"only bankrupt to them")
                 return
 
         msg = ""
@@ -1488,23 +2309,26 @@ class Game:
                 prop.set_owner(None)
                 self.available_properties.append(prop)
         else:
-            msg = f"transferring: ${player_1.get_money()} and #{player_1.get_get_out_free_cards()} cards\n"
+            if not self.quiet:
+                msg = f"transferring: ${player_1.get_money()} and #{player_1.get_get_out_free_cards()} cards\n"
+                msg += "".join(f"property: {prop.get_name()}\n" for prop in player_1.get_properties())
 
             player_2.add_money(max(0, player_1.get_money()))
 
             for prop in player_1.get_properties():
                 prop.set_owner(player_2)
                 player_2.add_property(prop)
-                msg += f"property: {prop.get_name()}\n"
 
             for card in range(0, player_1.get_get_out_free_cards()):
                 player_2.add_out_free_card()
 
-        self.send_message(player_1.get_name() + " has bankrupted to " + player_2.get_name() + "!")
-        self.send_message(msg)
+        if not self.quiet:
+            self.send_message(player_1.get_name() + " has bankrupted to " + player_2.get_name() + "!")
+            self.send_message(msg)
 
         self.ids.remove(self.players[id_1].get_id())
         self.players.pop(id_1)
+        self.index_players()
         self.turn = self.ids[self.turn % len(self.players.keys())]
 
         self.pending_trade = None
@@ -1512,8 +2336,18 @@ class Game:
         self.has_doubles = False
         self.last_roll = [-1]
 
-        self.send_message("The current player's turn is: " + self.get_player_by_local_id(self.turn).get_name())
+        if not self.quiet:
+            self.send_message("The current player's turn is: " + self.get_player_by_local_id(self.turn).get_name())
 
+    @command
+    def write_off_payments(self, id):
+        """Drop every payment player id owes. Simulated players use it when they can neither pay nor go bankrupt."""
+        player = self.players.get(id)
+        if player is None:
+            return
+        self.pending_payments[:] = [debt for debt in self.pending_payments if debt[0] != player]
+
+    @command
     def roll_dice(self, id):
         player = self.players.get(id)
 
@@ -1526,14 +2360,16 @@ class Game:
 
         roll = self.dice.roll()
         self.has_doubles = self.dice.check_doubles(roll)
+        self.rent_charged = []
 
-        text = "You rolled a ["
-        for n in roll:
-            text += str(n) + ","
-        text = text[:-1]
-        text += "]!"
+        if not self.quiet:
+            text = "You rolled a ["
+            for n in roll:
+                text += str(n) + ","
+            text = text[:-1]
+            text += "]!"
 
-        self.send_message(text)
+            self.send_message(text)
 
         if self.has_doubles:
             self.send_message("You rolled doubles! You'll get an extra turn after this.")
@@ -1575,6 +2411,21 @@ class Game:
 
 
 
+# Indexed by board position, built once from the square types.
+LANDING_HANDLERS = tuple({
+    GO: Game.land_on_go,
+    PROPERTY: Game.land_on_property,
+    OTHER_PROPERTY: Game.land_on_other_property,
+    COMMUNITY_CHEST: Game.land_on_community_chest,
+    CHANCE: Game.land_on_chance,
+    INCOME_TAX: Game.land_on_income_tax,
+    LUXURY_TAX: Game.land_on_luxury_tax,
+    JAIL: Game.land_on_jail,
+    FREE_PARKING: Game.land_on_free_parking,
+    GO_TO_JAIL: Game.land_on_go_to_jail,
+}[square_type] for square_type in SQUARE_TYPES)
+
+
 def create_bot():
     with open("api_key.txt", 'r', encoding="utf-8") as f:
         TOKEN = f.read().rstrip()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from collections import deque
+from io import BytesIO
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+import logging
+import threading
+import time
+
+from telegram.error import BadRequest, RetryAfter, TelegramError, Unauthorized  # type: ignore
+
+LOGGER = logging.getLogger("outbox")
+
+# Telegram allows roughly one message a second in a private chat, twenty a minute in a group
+# and thirty a second overall.
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+GLOBAL_RATE = 30
+MAX_MESSAGE_LENGTH = 4096
+# Messages that fail for any other reason than being refused (e.g. a timeout) are retried this many times, waiting
+# twice as long each time.
+MAX_ATTEMPTS = 5
+FIRST_BACKOFF = 1.0
+
+
+def split_message(text, max_length=MAX_MESSAGE_LENGTH):
+    """Split text into chunks Telegram accepts, breaking on newlines where possible."""
+    chunks = []
+    while len(text) > max_length:
+        cut = text.rfind("\n", 0, max_length)
+        if cut <= 0:
+            cut = max_length
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+class MessageOutbox:
+    """
+    Stands in for the bot when sending messages.
+
+    Plain text messages are buffered per chat until flush(chat_id) is called, usually once a command has been
+    handled, and are then sent as a single message. Sending happens on background worker threads that respect
+    Telegram's per-chat and global rate limits, so handlers never wait on the network. Photos queued with
+    send_photo go out the same way, after the chat's earlier messages. Anything else is passed straight through to
+    the wrapped bot.
+    """
+    def __init__(self, bot, workers=4, global_rate=GLOBAL_RATE, start=True):
+        self.bot = bot
+        self.global_interval = 1.0 / global_rate
+        self.buffers: Dict[int, List[str]] = {}
+        # (chat_id, bot method, arguments) of every message waiting to be sent.
+        self.queue: Deque[Tuple[int, str, Dict]] = deque()
+        self.busy: Set[int] = set()
+        # When each chat may be sent to again. Entries whose time has passed mean the same as no entry, and are
+        # dropped now and then so that chats the bot no longer hears from don't pile up.
+        self.next_send_at: Dict[int, float] = {}
+        self.next_sweep_at = 0.0
+        # How often the first queued message of a chat has failed so far.
+        self.failures: Dict[int, int] = {}
+        self.next_global_at = 0.0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.threads = [threading.Thread(target=self._run, name="outbox-%d" % i, daemon=True)
+                        for i in range(workers)]
+        if start:
+            for t in self.threads:
+                t.start()
+
+    def __getattr__(self, name):
+        if name == "bot":
+            raise AttributeError(name)
+        return getattr(self.bot, name)
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self.cond:
+            if kwargs:
+                # Formatted messages can't be merged with plain ones, so they keep their place in line.
+                self._flush_locked(chat_id)
+                self.queue.append((chat_id, "send_message", dict(kwargs, text=text)))
+                self.cond.notify()
+            else:
+                self.buffers.setdefault(chat_id, []).append(text)
+
+    def send_photo(self, chat_id, photo, on_sent: Optional[Callable] = None, **kwargs):
+        """
+        Queue a photo, given as JPEG bytes or a Telegram file_id. on_sent is called from the sending thread with
+        the sent message, or with None if Telegram refused it.
+        """
+        with self.cond:
+            self._flush_locked(chat_id)
+            self.queue.append((chat_id, "send_photo", dict(kwargs, photo=photo, on_sent=on_sent)))
+            self.cond.notify()
+
+    def flush(self, chat_id=None):
+        with self.cond:
+            if chat_id is None:
+                for c in list(self.buffers):
+                    self._flush_locked(c)
+            else:
+                self._flush_locked(chat_id)
+            self.cond.notify_all()
+
+    def _flush_locked(self, chat_id):
+        texts = self.buffers.pop(chat_id, None)
+        if not texts:
+            return
+        for chunk in split_message("\n".join(t for t in texts if t)):
+            if chunk:
+                self.queue.append((chat_id, "send_message", {"text": chunk}))
+
+    def pending(self):
+        with self.cond:
+            return len(self.queue) + len(self.busy)
+
+    def wait_until_empty(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.queue or self.busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        self.flush()
+        self.wait_until_empty(timeout)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def chat_interval(self, chat_id):
+        return GROUP_CHAT_INTERVAL if chat_id < 0 else PRIVATE_CHAT_INTERVAL
+
+    def _take(self) -> Tuple[Optional[Tuple[int, str, Dict]], Optional[float]]:
+        """Pop the first message whose chat may be sent to now, or return how long to wait for one."""
+        now = time.monotonic()
+        if now >= self.next_sweep_at:
+            self.sweep(now)
+        if now < self.next_global_at:
+            return None, self.next_global_at - now
+
+        wait = None
+        seen = set()
+        for i, item in enumerate(self.queue):
+            chat_id = item[0]
+            if chat_id in seen or chat_id in self.busy:
+                seen.add(chat_id)
+                continue
+            seen.add(chat_id)
+            ready_at = self.next_send_at.get(chat_id, 0.0)
+            if ready_at <= now:
+                del self.queue[i]
+                self.busy.add(chat_id)
+                self.next_global_at = now + self.global_interval
+                self.next_send_at[chat_id] = now + self.chat_interval(chat_id)
+                return item, None
+            wait = ready_at - now if wait is None else min(wait, ready_at - now)
+        return None, wait
+
+    def sweep(self, now):
+        self.next_send_at = {chat_id: ready_at for (chat_id, ready_at) in self.next_send_at.items()
+                             if ready_at > now}
+        self.next_sweep_at = now + GROUP_CHAT_INTERVAL
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.closed:
+                        return
+                    item, wait = self._take()
+                    if item is not None:
+                        break
+                    self.cond.wait(wait)
+
+            chat_id, method, kwargs = item
+            kwargs = dict(kwargs)
+            on_sent = kwargs.pop("on_sent", None)
+            if isinstance(kwargs.get("photo"), bytes):
+                # Wrapped afresh on every attempt, since a failed upload may have read part of it.
+                kwargs["photo"] = BytesIO(kwargs["photo"])
+            retry_after = None
+            message = None
+            try:
+                message = getattr(self.bot, method)(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                LOGGER.warning("Flood control in chat %s, retrying in %s seconds", chat_id, e.retry_after)
+                retry_after = e.retry_after
+            except (BadRequest, Unauthorized) as e:
+                # Sending it again wouldn't change Telegram's mind.
+                LOGGER.warning("Dropping message to chat %s: %s", chat_id, e)
+            except TelegramError as e:
+                with self.cond:
+                    failures = self.failures.get(chat_id, 0) + 1
+                    self.failures[chat_id] = failures
+                if failures < MAX_ATTEMPTS:
+                    retry_after = FIRST_BACKOFF * 2 ** (failures - 1)
+                    LOGGER.warning("Sending to chat %s failed (%s), retrying in %s seconds", chat_id, e, retry_after)
+                else:
+                    LOGGER.warning("Dropping message to chat %s after %d attempts: %s", chat_id, failures, e)
+            if on_sent is not None and retry_after is None:
+                try:
+                    on_sent(message)
+                except Exception:
+                    LOGGER.exception("Callback for a message to chat %s failed", chat_id)
+
+            with self.cond:
+                self.busy.discard(chat_id)
+                if retry_after is not None:
+                    self.queue.appendleft(item)
+                    self.next_send_at[chat_id] = time.monotonic() + retry_after
+                else:
+                    self.failures.pop(chat_id, None)
+                self.cond.notify_all()
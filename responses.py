@@ -82,28 +82,38 @@ static_responses = {
                 /listplayers will list all players in the current game.
                 /join [nickname] will add the sender to the game under an optional name or their username as a default, if a game is pending.
                 /leave will remove the sender from the game, if a game is pending.
+                /addbot [easy|medium|hard] will add a computer player to the game, if a game is pending.
                 /help displays a list of these commands.
                 /endgame will end the current game, if it exists.
                 /blame will @ the current player's turn.
                 /roll will roll the dice to determine where you land.
                 /bankrupt [player_id] will bankrupt you to the player with that ID.
                 /buyhouse [property_id] will purchase a house on that property for $200.
+                /buyhouse [color] [houses] will build every property of that color up to that many houses (5 or hotel for a hotel), evenly.
+                /build max [money_to_keep] will spend everything above money_to_keep on houses and hotels, building evenly where they earn the most rent.
                 /buyhotel [property_id] will purchase a hotel on that property for $200, if you have 4 houses.
                 /sellhouse [property_id] will sell a house on that property.
+                /sellhouse [color] [houses] will sell the buildings on every property of that color down to that many houses.
                 /sellhotel [property_id] will sell a hotel on that property.
                 /buyproperty will purchase the property at your position.
                 /endturn will end your turn.
                 /pay [player_id or "bank"] [amount] will pay the respective person or the bank the specified amount.
+                /autopay will sell houses and mortgage properties as needed to pay everything you owe, losing as little rent as possible.
                 /freeme will play a Get Out of Jail Free card if you have one.
                 /bail will pay your jail bail.
                 /mortgage [property_id] will mortgage your property with that ID.
+                /mortgage [color, all-railroads, all-utilities or all] will mortgage all of your properties in that group.
                 /unmortgage [property_id] will pay back mortgage on your property with that ID.
+                /unmortgage [color, all-railroads, all-utilities or all] will pay back the mortgages on all of them.
+                /undo will take back your last /buyhouse, /buyhotel, /sellhouse, /sellhotel, /build, /mortgage or /unmortgage, if nothing has happened since.
                 /canceltrade will cancel a pending trade.
                 /addtrade [property_id] [money] [num_cards] will add no property (if -1), else the property with that ID, the money, and number of Get Out of Jail Free Cards specified.
                 /agree will cause you to agree to the pending trade.
                 /disagree will cause you to disagree to the pending trade.
                 /trade will commence the pending trade if both players have agreed.
                 /setuptrade [player_id] will begin a trade between you and the player with that ID.
+                /showtrade will show everything in the pending trade.
+                /evaltrade will estimate how the pending trade changes both players' chances and net worth.
                 /assets will send you your current money, properties, and cards.
                 /aa will display everyone's assets in the chat.""",
         'invalid_nickname': "That is not a valid nickname.",
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from collections import Counter
+from multiprocessing import Pool
+from typing import List, Optional
+import os
+import time
+
+from monopoly import Game, NullBot, Property
+
+
+class Policy:
+    """
+    Decides what a simulated player does with their turn. The default buys whatever it lands on and builds on
+    its monopolies as long as it keeps a cash reserve.
+    """
+    def __init__(self, reserve=200):
+        self.reserve = reserve
+
+    def should_buy(self, game, player, property) -> bool:
+        return player.get_money() - property.get_cost() >= self.reserve
+
+    def houses_to_buy(self, game, player) -> List[str]:
+        budget = player.get_money() - self.reserve
+        ids = []
+        for (id, p) in enumerate(player.get_properties()):
+            if type(p) != Property or p.get_houses() == 4 or p.get_hotels() == 1 or p.get_mortgaged():
+                continue
+            if not player.has_color_set(p.get_color()):
+                continue
+            if budget < p.get_house_cost():
+                break
+            budget -= p.get_house_cost()
+            ids.append(str(id))
+        return ids
+
+    def should_pay_bail(self, game, player) -> bool:
+        return player.get_money() - 50 >= self.reserve
+
+
+class PassivePolicy(Policy):
+    """Never buys or builds anything. Useful as a baseline."""
+    def should_buy(self, game, player, property) -> bool:
+        return False
+
+    def houses_to_buy(self, game, player) -> List[str]:
+        return []
+
+    def should_pay_bail(self, game, player) -> bool:
+        return False
+
+
+class GameResult:
+    def __init__(self, winner: Optional[int], turns: int):
+        self.winner = winner
+        self.turns = turns
+
+
+class SimulationResult:
+    """
+    Statistics gathered over a number of simulated games. Results from separate runs (e.g. worker processes) can be
+    combined with merge.
+    """
+    def __init__(self, board_size=40):
+        self.games = 0
+        self.turns = 0
+        self.finished = 0
+        # Wins per seat, i.e. per local player id.
+        self.wins: Counter = Counter()
+        # How often a roll ended on each board index, after any card moves.
+        self.landings = [0] * board_size
+        # Rent charged per property name.
+        self.rent: Counter = Counter()
+        # Number of games per game length in turns.
+        self.game_lengths: Counter = Counter()
+        self.elapsed = 0.0
+
+    def add_game(self, result):
+        self.games += 1
+        self.turns += result.turns
+        self.game_lengths[result.turns] += 1
+        if result.winner is not None:
+            self.finished += 1
+            self.wins[result.winner] += 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.turns += other.turns
+        self.finished += other.finished
+        self.wins.update(other.wins)
+        for (i, count) in enumerate(other.landings):
+            self.landings[i] += count
+        self.rent.update(other.rent)
+        self.game_lengths.update(other.game_lengths)
+
+    def landing_frequencies(self):
+        total = sum(self.landings)
+        return [count / total if total else 0.0 for count in self.landings]
+
+    @property
+    def games_per_second(self):
+        return self.games / self.elapsed if self.elapsed > 0 else float("inf")
+
+    def __repr__(self):
+        return (f"SimulationResult: {self.games} games ({self.finished} finished), {self.turns} turns, "
+                f"{self.games_per_second:.0f} games/s")
+
+
+def raise_cash(game, player, amount):
+    """Sell buildings, then mortgage, until the player has amount in cash. Returns whether that worked."""
+    user_id = player.get_user_id()
+    for (id, p) in reversed(list(enumerate(player.get_properties()))):
+        if player.get_money() >= amount:
+            return True
+        if type(p) == Property:
+            if p.get_hotels() > 0:
+                game.sell_hotel(user_id, [str(id)])
+            while p.get_houses() > 0 and player.get_money() < amount:
+                game.sell_house(user_id, [str(id)])
+    for (id, p) in reversed(list(enumerate(player.get_properties()))):
+        if player.get_money() >= amount:
+            return True
+        if not p.get_mortgaged():
+            game.mortgage_property(user_id, [str(id)])
+    return player.get_money() >= amount
+
+
+def settle_payments(game, payers=None):
+    """
+    Pay every pending payment (only those owed by the user ids in payers, if given), making whoever can't cover
+    their debt go bankrupt to their creditor.
+    """
+    while game.pending_payments:
+        if payers is None:
+            debt = game.pending_payments[0]
+        else:
+            debt = next((d for d in game.pending_payments if d[0].get_user_id() in payers), None)
+            if debt is None:
+                return
+        payer, payee, amount = debt
+        to_id = None if payee is None else str(payee.get_id())
+
+        if payer.get_money() >= amount or (payer.get_total_assets() >= amount and raise_cash(game, payer, amount)):
+            game.pay(payer.get_user_id(), to_id, amount)
+            continue
+
+        # Game.bankrupt only lets a player with a single debt go bankrupt to a player, otherwise it's to the bank.
+        # Going through Game.bankrupt as it is (rather than trimming the debts) keeps recorded games replayable.
+        creditor = "bank" if payee is None or len(game.pending_payments) > 1 else to_id
+        game.bankrupt(payer.get_user_id(), creditor)
+        if payer.get_user_id() in game.players:
+            # The bankruptcy was refused, so there's nothing more the payer can do. Writing the debts off is a
+            # command too, so that recorded games still replay the same way.
+            game.write_off_payments(payer.get_user_id())
+
+
+def record_roll(game, player, stats):
+    stats.landings[player.get_position()] += 1
+    # Read what the roll charged, since roll_dice pays whatever it can straight away.
+    for (name, amount) in game.rent_charged:
+        stats.rent[name] += amount
+
+
+def play_turn(game, policy, stats=None, payers=None):
+    player = game.get_player_by_local_id(game.turn)
+    user_id = player.get_user_id()
+
+    if player.get_turns_left_in_jail() > 0 and policy.should_pay_bail(game, player):
+        game.pay_bail(user_id)
+
+    # Escaping jail by rolling doubles doesn't use up the roll.
+    while sum(game.last_roll) == -1 and user_id in game.players:
+        game.roll_dice(user_id)
+        if stats is not None:
+            record_roll(game, player, stats)
+        settle_payments(game, payers)
+
+    if user_id not in game.players:
+        return
+
+    property = game.board[player.get_position()]
+    if property in game.available_properties and policy.should_buy(game, player, property):
+        game.purchase_property(user_id)
+
+    house_ids = policy.houses_to_buy(game, player)
+    if house_ids:
+        game.purchase_house(user_id, house_ids)
+
+    game.end_turn(user_id)
+
+
+def play_game(game, policy, max_turns=1000, stats=None) -> GameResult:
+    turns = 0
+    while len(game.players) > 1 and turns < max_turns:
+        play_turn(game, policy, stats)
+        turns += 1
+
+    winner = None
+    if len(game.players) == 1:
+        winner = next(iter(game.players.values())).get_id()
+    return GameResult(winner, turns)
+
+
+def new_game(n_players, seed):
+    players = {user_id: "sim_" + str(user_id) for user_id in range(n_players)}
+    return Game(seed, players, NullBot(), seed=seed, quiet=True)
+
+
+def simulate(n_games, policy=None, seed=0, n_players=4, max_turns=1000) -> SimulationResult:
+    """
+    Play n_games complete games without a chat. Game i uses seed + i for its dice and cards, so a run can be
+    reproduced exactly.
+    """
+    if policy is None:
+        policy = Policy()
+
+    stats = SimulationResult()
+    start = time.perf_counter()
+    for i in range(n_games):
+        stats.add_game(play_game(new_game(n_players, seed + i), policy, max_turns, stats))
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def simulate_shard(args):
+    first_seed, n_games, policy, n_players, max_turns = args
+    return simulate(n_games, policy, first_seed, n_players, max_turns)
+
+
+def batch_simulate(n_games, policy=None, seed=0, n_players=4, max_turns=1000, processes=None,
+                   chunk_size=None) -> SimulationResult:
+    """
+    Like simulate, but spread over a pool of worker processes. Every chunk of games gets its own contiguous range
+    of seeds, so the merged result is the same as a single simulate call with the same seed. Workers only send
+    back their statistics, never the games themselves.
+    """
+    if policy is None:
+        policy = Policy()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if chunk_size is None:
+        # A few chunks per worker evens out games of very different lengths.
+        chunk_size = max(1, n_games // (processes * 4))
+
+    shards = [(seed + first, min(chunk_size, n_games - first), policy, n_players, max_turns)
+              for first in range(0, n_games, chunk_size)]
+
+    stats = SimulationResult()
+    start = time.perf_counter()
+    with Pool(processes) as pool:
+        for part in pool.imap_unordered(simulate_shard, shards):
+            stats.merge(part)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+if __name__ == "__main__":
+    print(simulate(200))
@@ -3,20 +3,30 @@
 from __future__ import unicode_literals
 
 import telegram
-from telegram.ext import Updater, CommandHandler, PicklePersistence
+from telegram.ext import Updater, CommandHandler
 from telegram.error import Unauthorized
 import logging
 
+import argparse
+import secrets
+import signal
 import sys
+import threading
 import traceback
 import logging
 import inspect
+from urllib.parse import urlsplit
 
+import ai
 import monopoly
+from board_image import BoardImage, BoardRenderer
+from chat_executor import ChatExecutor
+from game_registry import GameRegistry
+from game_store import GameStore
+from metrics import METRICS, CountedOutbox, TimedBot, serve, time_methods
+from outbox import MessageOutbox
 from responses import static_responses
-
-with open("api_key.txt", 'r', encoding="utf-8") as f:
-    TOKEN = f.read().rstrip()
+from webhook import WebhookServer
 
 MIN_PLAYERS = 2
 
@@ -31,10 +41,6 @@ def setup_logger(name, log_file, level=logging.INFO):
 
     return logger
 
-ERROR_LOGGER = setup_logger("error_logger", "error_logs.log")
-INFO_LOGGER = setup_logger("info_logger", "info_logs.log")
-
-bot = telegram.Bot(token=TOKEN)
 
 def send_static_response(chat_id, resp_id):
     if not resp_id in static_responses:
@@ -42,17 +48,22 @@ def send_static_response(chat_id, resp_id):
         ERROR_LOGGER.warning('No static response for resp_id: %s', resp_id)
     else:
         response = inspect.cleandoc(static_responses[resp_id])
-    bot.send_message(chat_id=chat_id, text=response)
+    outbox.send_message(chat_id=chat_id, text=response)
 
 def static_handler(command):
-    return CommandHandler(command,
-        lambda update, context: send_static_response(chat_id=update.message.chat.id, resp_id=command))
+    return CommandHandler(command, in_chat_order(instrumented(command,
+        flushing(lambda update, context: send_static_response(chat_id=update.message.chat.id, resp_id=command)))))
+
 
+def get_chat_data(context, chat_id):
+    return registry.get(chat_id)
 
-def reset_chat_data(context):
-    context.bot_data["is_game_pending"] = False
-    context.bot_data["pending_players"] = {}
-    context.bot_data["game_obj"] = None
+
+def reset_chat_data(chat_data):
+    chat_data["is_game_pending"] = False
+    chat_data["pending_players"] = {}
+    chat_data["bots"] = {}
+    chat_data["game_obj"] = None
 
 
 def check_game_existence(chat_id, game):
@@ -62,14 +73,14 @@ def check_game_existence(chat_id, game):
     return True
 
 
-def send_info(bot, chat_id, game, user_id, send_id):
+def send_info(outbox, chat_id, game, user_id, send_id):
     player = game.players.get(user_id)
     props = f"```\n{player.get_properties_str()}\n```"
     props = props + "Note: Table doesn't account for Monop, railroad & utility scaling\n"
     money = player.get_money()
     cards = player.get_get_out_free_cards()
     total_assets = player.get_total_assets()
-    bot.send_message(chat_id=send_id,
+    outbox.send_message(chat_id=send_id,
                      parse_mode=telegram.ParseMode.MARKDOWN,
                      text=props + "\n\n" + player.get_name() + " money: $" + str(money) +
                                   "\n\n" + player.get_name() + " cards: " + str(cards) +
@@ -79,20 +90,22 @@ def send_info(bot, chat_id, game, user_id, send_id):
 
 def send_infos(bot, chat_id, game, players):
     for user_id, nickname in players.items():
-        send_info(bot, chat_id, game, user_id, user_id)
+        if not ai.is_bot(user_id):
+            send_info(outbox, chat_id, game, user_id, user_id)
 
 
 def newgame_handler(update, context):
-    game = context.bot_data.get("game_obj")
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
 
-    if game is None and not context.bot_data.get("is_game_pending", False):
-        reset_chat_data(context)
-        context.bot_data["is_game_pending"] = True
+    if game is None and not chat_data.get("is_game_pending", False):
+        reset_chat_data(chat_data)
+        chat_data["is_game_pending"] = True
         resp_id = 'new_game'
     elif game is not None:
         resp_id = 'game_ongoing'
-    elif context.bot_data.get("is_game_pending", False):
+    elif chat_data.get("is_game_pending", False):
         resp_id = 'game_pending'
     else:
         resp_id = 'unexpected_error'
@@ -109,9 +122,10 @@ def is_nickname_valid(name, user_id, context):
 
 def join_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
 
-    if not context.bot_data.get("is_game_pending", False):
+    if not chat_data.get("is_game_pending", False):
         send_static_response(chat_id=chat_id, resp_id='join_game_not_pending')
         return
 
@@ -120,46 +134,71 @@ def join_handler(update, context):
     else:
         nickname = update.message.from_user.first_name
 
-    if is_nickname_valid(nickname, user_id, context.bot_data):
-        context.bot_data["pending_players"][user_id] = nickname
-        bot.send_message(chat_id=update.message.chat_id,
+    if is_nickname_valid(nickname, user_id, chat_data):
+        chat_data["pending_players"][user_id] = nickname
+        outbox.send_message(chat_id=update.message.chat_id,
                          text="Joined with nickname %s!" % nickname)
-        bot.send_message(chat_id=update.message.chat_id,
-                         text="Current player count: %d" % len(context.bot_data.get("pending_players", {})))
+        outbox.send_message(chat_id=update.message.chat_id,
+                         text="Current player count: %d" % len(chat_data.get("pending_players", {})))
     else:
         send_static_response(chat_id=chat_id, resp_id='invalid_nickname')
 
 
+def addbot_handler(update, context):
+    chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
+
+    if not chat_data.get("is_game_pending", False):
+        send_static_response(chat_id=chat_id, resp_id='join_game_not_pending')
+        return
+
+    difficulty = context.args[0].lower() if context.args else ai.DEFAULT_DIFFICULTY
+    if difficulty not in ai.DIFFICULTIES:
+        outbox.send_message(chat_id=chat_id, text="Usage: /addbot [" + "|".join(ai.DIFFICULTIES) + "]")
+        return
+
+    bots = chat_data.setdefault("bots", {})
+    user_id = -(len(bots) + 1)
+    nickname = "Bot %d (%s)" % (len(bots) + 1, difficulty)
+    bots[user_id] = difficulty
+    chat_data["pending_players"][user_id] = nickname
+    outbox.send_message(chat_id=chat_id, text="Added %s!" % nickname)
+    outbox.send_message(chat_id=chat_id,
+                        text="Current player count: %d" % len(chat_data.get("pending_players", {})))
+
+
 def leave_handler(update, context):
     chat_id = update.message.chat_id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
 
-    if not context.bot_data.get("is_game_pending", False):
+    if not chat_data.get("is_game_pending", False):
         resp_id = 'leave_game_not_pending_failure'
-    elif user_id not in context.bot_data.get("pending_players", {}):
+    elif user_id not in chat_data.get("pending_players", {}):
         resp_id = 'leave_id_missing_failure'
     else:
         resp_id = 'leave_game'
-        del context.bot_data["pending_players"][update.message.from_user.id]
+        del chat_data["pending_players"][update.message.from_user.id]
 
     send_static_response(chat_id=chat_id, resp_id=resp_id)
 
 
 def listplayers_handler(update, context):
     chat_id = update.message.chat_id
+    chat_data = get_chat_data(context, chat_id)
     text = "List of players: \n"
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
-    if context.bot_data.get("is_game_pending", False):
-        for user_id, name in context.bot_data.get("pending_players", {}).items():
+    if chat_data.get("is_game_pending", False):
+        for user_id, name in chat_data.get("pending_players", {}).items():
             text += name + "\n"
     elif game is not None:
-        for user_id, name in context.bot_data.get("pending_players", {}).items():
+        for user_id, name in chat_data.get("pending_players", {}).items():
             text += "(" + str(game.get_players()[user_id].get_id()) + ") " + name + "\n"
     else:
         text = static_responses['listplayers_failure']
 
-    bot.send_message(chat_id=chat_id, text=text)
+    outbox.send_message(chat_id=chat_id, text=text)
 
 
 # Thanks Amrita!
@@ -175,21 +214,22 @@ def feedback_handler(update, context):
         feedback.write(str(update.message.from_user.id) + "): ")
         feedback.write(" ".join(context.args) + "\n")
         feedback.close()
-        bot.send_message(chat_id=update.message.chat_id, text="Thanks for the feedback!")
+        outbox.send_message(chat_id=update.message.chat_id, text="Thanks for the feedback!")
     else:
-        bot.send_message(chat_id=update.message.chat_id, text="Format: /feedback [feedback]")
+        outbox.send_message(chat_id=update.message.chat_id, text="Format: /feedback [feedback]")
 
 
 def startgame_handler(update, context):
     chat_id = update.message.chat_id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    pending_players = context.bot_data.get("pending_players", {})
+    pending_players = chat_data.get("pending_players", {})
 
-    if not context.bot_data.get("is_game_pending", False):
+    if not chat_data.get("is_game_pending", False):
         send_static_response(chat_id=chat_id, resp_id='start_game_not_pending')
         return
 
-    if user_id not in context.bot_data.get("pending_players", {}):
+    if user_id not in chat_data.get("pending_players", {}):
         send_static_response(chat_id=chat_id, resp_id='start_game_id_missing_failure')
         return
 
@@ -199,24 +239,28 @@ def startgame_handler(update, context):
 
     try:
         for user_id, nickname in pending_players.items():
+            if ai.is_bot(user_id):
+                continue
+            # This has to go out immediately, since it checks that the players can be messaged.
             bot.send_message(chat_id=user_id, text="Trying to start game!")
     except Unauthorized as u:
         send_static_response(chat_id=chat_id, resp_id='start_game_failure')
         return
 
-    context.bot_data["is_game_pending"] = False
-    context.bot_data["game_obj"] = monopoly.Game(chat_id, pending_players, bot)
-    game = context.bot_data.get("game_obj")
-    send_infos(bot, chat_id, game, pending_players)
+    chat_data["is_game_pending"] = False
+    chat_data["game_obj"] = monopoly.Game(chat_id, pending_players, outbox, record=True)
+    game = chat_data.get("game_obj")
+    send_infos(outbox, chat_id, game, pending_players)
 
 
 def endgame_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
-    if context.bot_data.get("is_game_pending", False):
-        context.bot_data["is_game_pending"] = False
+    if chat_data.get("is_game_pending", False):
+        chat_data["is_game_pending"] = False
         send_static_response(chat_id=chat_id, resp_id='end_game')
         return
 
@@ -227,14 +271,15 @@ def endgame_handler(update, context):
         send_static_response(chat_id=chat_id, resp_id='end_game_id_missing_failure')
         return
 
-    reset_chat_data(context)
+    reset_chat_data(chat_data)
     send_static_response(chat_id=chat_id, resp_id='end_game')
 
 
 def roll_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -242,7 +287,7 @@ def roll_handler(update, context):
     players = game.get_players()
     if len(players) == 1:
         winner = list(players.values())[0]
-        bot.send_message(chat_id=chat_id, text=winner.get_name() + " has won!")
+        outbox.send_message(chat_id=chat_id, text=winner.get_name() + " has won!")
         endgame_handler(update, context)
         return
 
@@ -251,11 +296,12 @@ def roll_handler(update, context):
 
 def bankrupt_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /bankrupt player_id")
+        outbox.send_message(chat_id=chat_id, text="Usage: /bankrupt player_id")
         return
 
     if not check_game_existence(chat_id, game):
@@ -266,33 +312,39 @@ def bankrupt_handler(update, context):
     players = game.get_players()
     if len(players) == 1:
         winner = list(players.values())[0]
-        bot.send_message(chat_id=chat_id, text=winner.get_name() + " has won!")
+        outbox.send_message(chat_id=chat_id, text=winner.get_name() + " has won!")
         endgame_handler(update, context)
         return
 
 
 def purchase_house_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
-    if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /buyhouse property_id")
+    level = parse_level(context.args[-1]) if len(context.args) >= 2 else None
+    if len(context.args) != 1 and level is None:
+        outbox.send_message(chat_id=chat_id, text="Usage: /buyhouse property_id, or /buyhouse color houses")
         return
 
     if not check_game_existence(chat_id, game):
         return
 
-    game.purchase_house(user_id, context.args)
+    if level is None:
+        game.purchase_house(user_id, context.args)
+    else:
+        game.build_houses(user_id, " ".join(context.args[:-1]), level)
 
 
 def purchase_hotel_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /buyhotel property_id")
+        outbox.send_message(chat_id=chat_id, text="Usage: /buyhotel property_id")
         return
 
     if not check_game_existence(chat_id, game):
@@ -303,26 +355,32 @@ def purchase_hotel_handler(update, context):
 
 def sell_house_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
-    if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /sellhouse property_id")
+    level = parse_level(context.args[-1]) if len(context.args) >= 2 else None
+    if len(context.args) != 1 and level is None:
+        outbox.send_message(chat_id=chat_id, text="Usage: /sellhouse property_id, or /sellhouse color houses_left")
         return
 
     if not check_game_existence(chat_id, game):
         return
 
-    game.sell_house(user_id, context.args)
+    if level is None:
+        game.sell_house(user_id, context.args)
+    else:
+        game.sell_houses(user_id, " ".join(context.args[:-1]), level)
 
 
 def sell_hotel_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /sellhotel property_id")
+        outbox.send_message(chat_id=chat_id, text="Usage: /sellhotel property_id")
         return
 
     if not check_game_existence(chat_id, game):
@@ -333,8 +391,9 @@ def sell_hotel_handler(update, context):
 
 def purchase_property_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -344,8 +403,9 @@ def purchase_property_handler(update, context):
 
 def end_turn_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -356,11 +416,12 @@ def end_turn_handler(update, context):
 
 def pay_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if len(context.args) != 2:
-        bot.send_message(chat_id=chat_id, text="Usage: /pay to_person_id amount")
+        outbox.send_message(chat_id=chat_id, text="Usage: /pay to_person_id amount")
         return
 
     if not check_game_existence(chat_id, game):
@@ -369,10 +430,23 @@ def pay_handler(update, context):
     game.pay(user_id, context.args[0], int(context.args[1]))
 
 
+def autopay_handler(update, context):
+    chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
+    user_id = update.message.from_user.id
+    game = chat_data.get("game_obj")
+
+    if not check_game_existence(chat_id, game):
+        return
+
+    game.autopay(user_id)
+
+
 def get_out_of_jail_free_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -382,8 +456,9 @@ def get_out_of_jail_free_handler(update, context):
 
 def bail_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -393,48 +468,90 @@ def bail_handler(update, context):
 
 def money_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
     player = game.players.get(user_id)
     playername=player.get_name()
     money = player.get_money()
-    bot.send_message(chat_id=chat_id, text="{playername}\'s current funds: ${money}".format(playername=playername, money=money))
+    outbox.send_message(chat_id=chat_id, text="{playername}\'s current funds: ${money}".format(playername=playername, money=money))
 
 
 def mortgage_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
-    if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /mortgage property_id")
+    group = " ".join(context.args)
+    if len(context.args) != 1 and not is_group(group):
+        outbox.send_message(chat_id=chat_id, text="Usage: /mortgage property_id, or /mortgage color, all-railroads, "
+                                                  "all-utilities or all")
         return
 
     if not check_game_existence(chat_id, game):
         return
 
-    game.mortgage_property(user_id, context.args)
+    if is_group(group):
+        game.mortgage_properties(user_id, group)
+    else:
+        game.mortgage_property(user_id, context.args)
 
 
 def unmortgage_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
-    if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /unmortgage property_id")
+    group = " ".join(context.args)
+    if len(context.args) != 1 and not is_group(group):
+        outbox.send_message(chat_id=chat_id, text="Usage: /unmortgage property_id, or /unmortgage color, "
+                                                  "all-railroads, all-utilities or all")
+        return
+
+    if not check_game_existence(chat_id, game):
+        return
+
+    if is_group(group):
+        game.unmortgage_properties(user_id, group)
+    else:
+        game.unmortgage_property(user_id, context.args)
+
+
+def build_handler(update, context):
+    chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
+    user_id = update.message.from_user.id
+    game = chat_data.get("game_obj")
+
+    if not context.args or context.args[0] != "max" or len(context.args) > 2 or \
+            (len(context.args) == 2 and not context.args[1].isdigit()):
+        outbox.send_message(chat_id=chat_id, text="Usage: /build max [money_to_keep]")
         return
 
     if not check_game_existence(chat_id, game):
         return
 
-    game.unmortgage_property(user_id, context.args)
+    game.build_max(user_id, int(context.args[1]) if len(context.args) == 2 else 0)
+
+
+def parse_level(text):
+    """The number of houses in a bulk building command (5 for "hotel"), or None."""
+    if text.isdigit():
+        return int(text)
+    return 5 if text.lower() == "hotel" else None
+
+
+def is_group(text):
+    return monopoly.group_key(text) in monopoly.PROPERTY_GROUPS
 
 
 def cancel_trade_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -444,11 +561,12 @@ def cancel_trade_handler(update, context):
 
 def add_to_trade_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if len(context.args) != 3:
-        bot.send_message(chat_id=chat_id, text="Usage: /addtrade {property_id or -1} money num_get_out_free_cards")
+        outbox.send_message(chat_id=chat_id, text="Usage: /addtrade {property_id or -1} money num_get_out_free_cards")
         return
 
     if not check_game_existence(chat_id, game):
@@ -459,11 +577,12 @@ def add_to_trade_handler(update, context):
 
 def remove_from_trade_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if len(context.args) != 3:
-        bot.send_message(chat_id=chat_id, text="Usage: /removetrade {property_id or -1} money num_get_out_free_cards")
+        outbox.send_message(chat_id=chat_id, text="Usage: /removetrade {property_id or -1} money num_get_out_free_cards")
         return
 
     if not check_game_existence(chat_id, game):
@@ -474,8 +593,9 @@ def remove_from_trade_handler(update, context):
 
 def agree_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -485,8 +605,9 @@ def agree_handler(update, context):
 
 def disagree_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -496,7 +617,8 @@ def disagree_handler(update, context):
 
 def trade_handler(update, context):
     chat_id = update.message.chat.id
-    game = context.bot_data.get("game_obj")
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
@@ -504,13 +626,40 @@ def trade_handler(update, context):
     game.trade()
 
 
+def show_trade_handler(update, context):
+    chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
+
+    if not check_game_existence(chat_id, game):
+        return
+
+    game.show_trade()
+
+
+def evaltrade_handler(update, context):
+    chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
+
+    if not check_game_existence(chat_id, game):
+        return
+
+    if game.pending_trade is None:
+        outbox.send_message(chat_id=chat_id, text="There is no pending trade!")
+        return
+
+    outbox.send_message(chat_id=chat_id, text=ai.evaluate_trade(game, trade_pool).summary())
+
+
 def setup_trade_handler(update, context):
     chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
     user_id = update.message.from_user.id
-    game = context.bot_data.get("game_obj")
+    game = chat_data.get("game_obj")
 
     if len(context.args) != 1:
-        bot.send_message(chat_id=chat_id, text="Usage: /setuptrade player_id")
+        outbox.send_message(chat_id=chat_id, text="Usage: /setuptrade player_id")
         return
 
     if not check_game_existence(chat_id, game):
@@ -522,14 +671,15 @@ def setup_trade_handler(update, context):
 def assets_handler(update, context):
     user_id = update.message.from_user.id
     chat_id = update.message.chat.id
-    game = context.bot_data.get("game_obj")
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
 
     if game is None:
         resp_id = 'game_dne_failure'
     elif user_id not in game.get_players():
         resp_id = 'leave_id_missing_failure'
     else:
-        send_info(bot, chat_id, game, user_id, user_id)
+        send_info(outbox, chat_id, game, user_id, user_id)
         return
 
     send_static_response(chat_id=chat_id, resp_id=resp_id)
@@ -537,19 +687,22 @@ def assets_handler(update, context):
 
 def blame_handler(update, context):
     chat_id = update.message.chat_id
-    game = context.bot_data.get("game_obj")
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
 
     for user_id, player in game.get_players().items():
+        if ai.is_bot(user_id):
+            continue
         if game.get_player_by_local_id(game.turn).get_user_id() == user_id:
             for (payer, payee, amount) in game.get_pending_payments():
-                bot.send_message(chat_id=chat_id, text="[{}](tg://user?id={})".format(payer.get_name(),
+                outbox.send_message(chat_id=chat_id, text="[{}](tg://user?id={})".format(payer.get_name(),
                                                                                       payer.get_user_id()),
                                  parse_mode=telegram.ParseMode.MARKDOWN)
                 return
-            bot.send_message(chat_id=chat_id, text="[{}](tg://user?id={})".format(player.get_name(),
+            outbox.send_message(chat_id=chat_id, text="[{}](tg://user?id={})".format(player.get_name(),
                                                                                   user_id),
                              parse_mode=telegram.ParseMode.MARKDOWN)
             return
@@ -557,19 +710,152 @@ def blame_handler(update, context):
 
 def all_assets_handler(update, context):
     chat_id = update.message.chat_id
-    game = context.bot_data.get("game_obj")
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
 
     if not check_game_existence(chat_id, game):
         return
 
     for user_id, player in game.get_players().items():
-        send_info(bot, chat_id, game, user_id, chat_id)
+        send_info(outbox, chat_id, game, user_id, chat_id)
 
 
 def board_handler(update, context):
     chat_id = update.message.chat_id
+    chat_data = get_chat_data(context, chat_id)
+    game = chat_data.get("game_obj")
+
+    if game is None:
+        board_image.send(bot, chat_id)
+    else:
+        board_renderer.send(outbox, game)
+
+
+def undo_handler(update, context):
+    chat_id = update.message.chat.id
+    chat_data = get_chat_data(context, chat_id)
+    user_id = update.message.from_user.id
+    game = chat_data.get("game_obj")
 
-    bot.send_photo(chat_id=chat_id, photo=open("monopoly_board_org.jpg", "rb"))
+    if not check_game_existence(chat_id, game):
+        return
+
+    undo = chat_data.get("undo")
+    if undo is None or undo[1] is not game:
+        outbox.send_message(chat_id=chat_id, text="There is nothing to undo!")
+        return
+
+    undo_user_id, _, before, after, log_length = undo
+    if undo_user_id != user_id:
+        outbox.send_message(chat_id=chat_id, text="Only the player who made the last change can undo it!")
+        return
+    if game.snapshot() != after:
+        outbox.send_message(chat_id=chat_id, text="The game has moved on since, so that can't be undone!")
+        return
+
+    # Whatever was logged since only ever changed nothing, so it's cut from the log with the undone command.
+    game.restore(before, log_length)
+    chat_data.pop("undo")
+    outbox.send_message(chat_id=chat_id, text="Undone!")
+
+
+# Commands that can be taken back with /undo.
+UNDOABLE_COMMANDS = {"purchase_house", "purchase_hotel", "sell_house", "sell_hotel", "mortgage", "unmortgage",
+                     "build"}
+
+
+def undoable(func):
+    """Remember the game from before the command, so the player who sent it can /undo it."""
+    def wrapper(update, context):
+        chat_data = get_chat_data(context, update.message.chat.id)
+        game = chat_data.get("game_obj")
+        before = None if game is None else game.snapshot()
+        log_length = None if game is None or game.events is None else game.logged_events
+        result = func(update, context)
+        if game is not None:
+            after = game.snapshot()
+            if after != before:
+                chat_data["undo"] = (update.message.from_user.id, game, before, after, log_length)
+        return result
+    return wrapper
+
+
+def let_bots_act(chat_id):
+    """Once a command has been handled, the computer players in the chat get to do whatever is up to them."""
+    chat_data = registry.get(chat_id)
+    game = chat_data.get("game_obj")
+    bots = chat_data.get("bots")
+    if game is None or not bots:
+        return
+
+    player_count = len(game.get_players())
+    ai.act(game, bots)
+    players = game.get_players()
+    # A game that was already over is dealt with by the command itself.
+    if len(players) == 1 and player_count > 1:
+        winner = list(players.values())[0]
+        outbox.send_message(chat_id=chat_id, text=winner.get_name() + " has won!")
+        reset_chat_data(chat_data)
+        send_static_response(chat_id=chat_id, resp_id='end_game')
+    elif len(players) > 1 and not ai.humans_left(game):
+        # There's no one left to play for, so the bots don't play it out.
+        leader = max(players.values(), key=ai.net_worth)
+        outbox.send_message(chat_id=chat_id, text="Only computer players are left, so the game is over! " +
+                                                  leader.get_name() + " was ahead.")
+        reset_chat_data(chat_data)
+        send_static_response(chat_id=chat_id, resp_id='end_game')
+    elif ai.bot_to_move(game, bots):
+        # The bots ran out of time. They carry on once the chats waiting behind this one have had their turn.
+        executor.submit(chat_id, continue_bots, chat_id)
+
+
+def continue_bots(chat_id):
+    with registry.in_use(chat_id):
+        try:
+            let_bots_act(chat_id)
+        finally:
+            registry.save(chat_id)
+            outbox.flush(chat_id)
+
+
+def flushing(func):
+    """Save the chat and send everything a command said once it has been handled."""
+    def wrapper(update, context):
+        try:
+            result = func(update, context)
+            let_bots_act(update.message.chat_id)
+            return result
+        finally:
+            registry.save(update.message.chat_id)
+            outbox.flush(update.message.chat_id)
+    return wrapper
+
+
+def handle_task_error(chat_id, e):
+    trace = "".join(traceback.format_tb(e.__traceback__))
+    ERROR_LOGGER.warning("Error in chat %s! %s caused by %s", chat_id, trace, repr(e))
+
+
+
+
+def in_chat_order(func):
+    """Hand the update over to the executor, which handles it after the chat's earlier updates."""
+    def wrapper(update, context):
+        chat_id = update.message.chat_id
+
+        def task():
+            with registry.in_use(chat_id):
+                func(update, context)
+        executor.submit(chat_id, task)
+    return wrapper
+
+
+def instrumented(name, func):
+    """Log the command and record its latency, errors and message count in METRICS."""
+    def wrapper(update, context):
+        log_action(update, name)
+        return METRICS.measure(name, func, update, context)
+    return wrapper
 
 
 def log_action(update, func_name):
@@ -585,9 +871,51 @@ def handle_error(update, context):
 
 
 if __name__ == "__main__":
+    # Everything that opens files, connects or starts threads happens here rather than on import, so that the
+    # trade evaluation workers can import this module (as their main module) without side effects.
+    parser = argparse.ArgumentParser(description="Run the Monopoly bot.")
+    parser.add_argument("mode", nargs="?", choices=["polling", "webhook"], default="polling",
+                        help="poll Telegram for updates (the default), or have it post them to a webhook")
+    parser.add_argument("url", nargs="?", help="the webhook's public URL")
+    parser.add_argument("port", nargs="?", type=int, default=8443, help="local port the webhook is served on")
+    parser.add_argument("--workers", type=int, default=8, help="threads handling chats in parallel")
+    parser.add_argument("--max-pending", type=int, default=10000,
+                        help="updates waiting for a worker before new ones are held back")
+    parser.add_argument("--max-queue", type=int, default=1000,
+                        help="updates the webhook queues before answering 503")
+    parser.add_argument("--max-connections", type=int, default=40,
+                        help="connections Telegram opens to the webhook at once")
+    args = parser.parse_args()
+    if args.mode == "webhook" and not args.url:
+        parser.error("webhook mode needs the webhook's URL")
+
+    # The processes /evaltrade plays out trades on, kept for as long as the bot runs. Started before any other
+    # threads exist.
+    trade_pool = ai.new_trade_pool()
+
+    with open("api_key.txt", 'r', encoding="utf-8") as f:
+        TOKEN = f.read().rstrip()
+
+    ERROR_LOGGER = setup_logger("error_logger", "error_logs.log")
+    INFO_LOGGER = setup_logger("info_logger", "info_logs.log")
+
+    bot = TimedBot(telegram.Bot(token=TOKEN), METRICS)
+    # Everything the handlers and games say goes through the outbox, which batches it per command.
+    outbox = CountedOutbox(MessageOutbox(bot), METRICS)
+    # Time spent in the game is recorded per command, apart from time spent waiting on Telegram.
+    time_methods(monopoly.Game, sorted(monopoly.COMMANDS), "game_seconds", METRICS)
+    board_image = BoardImage()
+    # Draws the games onto the board picture for /board. Shared by every chat, so they all use the same decoded
+    # board.
+    board_renderer = BoardRenderer()
+    time_methods(BoardRenderer, ["render_states"], "game_seconds", METRICS)
+    # Chats are saved to an append-only log after every command, instead of pickling the whole bot state.
+    registry = GameRegistry(outbox, GameStore("games.log"))
+    # Updates for different chats are handled in parallel, but a chat's own updates are handled one at a time.
+    executor = ChatExecutor(workers=args.workers, max_pending=args.max_pending, on_error=handle_task_error)
+
     # Set up the bot
-    persistence = PicklePersistence(filename='persistent_bot_state.pkl')
-    updater = Updater(token=TOKEN, persistence=persistence)
+    updater = Updater(token=TOKEN)
     dispatcher = updater.dispatcher
 
     # Static command handlers
@@ -599,6 +927,7 @@ if __name__ == "__main__":
     # Main command handlers
 
     join_aliases = ["join"]
+    addbot_aliases = ["addbot"]
     leave_aliases = ["leave", "unjoin"]
     listplayers_aliases = ["listplayers", "list"]
     feedback_aliases = ["feedback"]
@@ -612,6 +941,7 @@ if __name__ == "__main__":
     purchase_property_aliases = ["purchaseproperty", "buyproperty", "buyprop", "purchaseprop", "bp"]
     end_turn_aliases = ["end", "endturn", "endme", "ednme", "edna"]
     pay_aliases = ["pay", "p"]
+    autopay_aliases = ["autopay", "ap"]
     get_out_aliases = ["out", "freeme", "usecard", "goofg"]
     bail_aliases = ["bail", "paybail"]
     money_aliases=["showmethemoney","money","funds"]
@@ -624,16 +954,21 @@ if __name__ == "__main__":
     disagree_aliases = ["disagree", "no"]
     trade_aliases = ["trade"]
     setup_trade_aliases = ["setuptrade", "st"]
+    show_trade_aliases = ["showtrade", "viewtrade"]
+    evaltrade_aliases = ["evaltrade", "et"]
     assets_aliases = ["assets", "mystuff"]
     blame_aliases = ["blame", "blam"]
     sell_house_aliases = ["sellhouse", "sh"]
     sell_hotel_aliases = ["sellhotel", "shh"]
+    build_aliases = ["build"]
     all_assets_aliases = ["allassets", "aa"]
     board_aliases = ["board", "gameboard", "monopolyboard", "whatdoesitlooklikeagain"]
+    undo_aliases = ["undo"]
 
     commands = [("feedback", feedback_aliases),
                 ("newgame", newgame_aliases),
                 ("join", join_aliases),
+                ("addbot", addbot_aliases),
                 ("leave", leave_aliases),
                 ("listplayers", listplayers_aliases),
                 ("startgame", startgame_aliases),
@@ -645,6 +980,7 @@ if __name__ == "__main__":
                 ("purchase_property", purchase_property_aliases),
                 ("end_turn", end_turn_aliases),
                 ("pay", pay_aliases),
+                ("autopay", autopay_aliases),
                 ("get_out_of_jail_free", get_out_aliases),
                 ("bail", bail_aliases),
                 ("money",money_aliases),
@@ -657,18 +993,48 @@ if __name__ == "__main__":
                 ("disagree", disagree_aliases),
                 ("trade", trade_aliases),
                 ("setup_trade", setup_trade_aliases),
+                ("show_trade", show_trade_aliases),
+                ("evaltrade", evaltrade_aliases),
                 ("assets", assets_aliases),
                 ("blame", blame_aliases),
                 ("sell_house", sell_house_aliases),
                 ("sell_hotel", sell_hotel_aliases),
+                ("build", build_aliases),
                 ("all_assets", all_assets_aliases),
-                ("board", board_aliases)]
+                ("board", board_aliases),
+                ("undo", undo_aliases)]
     for base_name, aliases in commands:
         func = locals()[base_name + "_handler"]
-        dispatcher.add_handler(CommandHandler(aliases, func))
+        if base_name in UNDOABLE_COMMANDS:
+            func = undoable(func)
+        dispatcher.add_handler(CommandHandler(aliases, in_chat_order(instrumented(base_name, flushing(func)))))
 
     # Error handlers
     dispatcher.add_error_handler(handle_error)
 
-    updater.start_polling()
-    updater.idle()
+    # Prometheus can scrape http://127.0.0.1:9877/metrics.
+    serve(METRICS)
+
+    if args.mode == "webhook":
+        # python telegram_interaction.py webhook https://example.com/telegram [port]
+        # Telegram posts updates to the URL, which a reverse proxy (doing TLS) forwards to the local server.
+        secret_token = secrets.token_urlsafe(32)
+        webhook = WebhookServer(lambda data: dispatcher.process_update(telegram.Update.de_json(data, updater.bot)),
+                                port=args.port, path=urlsplit(args.url).path or "/", secret_token=secret_token,
+                                max_queue=args.max_queue)
+        webhook.start()
+        updater.bot.set_webhook(args.url, max_connections=args.max_connections, api_kwargs={"secret_token": secret_token})
+        # The updater isn't running, so its idle() would exit without cleaning up.
+        stopping = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stopping.set())
+        while not stopping.wait(1):
+            pass
+        webhook.stop()
+    else:
+        updater.start_polling()
+        updater.idle()
+    executor.close()
+    trade_pool.close()
+    outbox.close()
+    registry.store.close()
@@ -0,0 +1,8 @@
+import pytest
+
+import monopoly
+
+
+@pytest.fixture(autouse=True)
+def check_assets(monkeypatch):
+    monkeypatch.setattr(monopoly, "CHECK_ASSETS", True)
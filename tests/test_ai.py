@@ -0,0 +1,151 @@
+from collections import deque
+import time
+
+import ai
+from monopoly import Game, NullBot
+from simulation import Policy
+
+
+class RecordingBot(NullBot):
+    def __init__(self):
+        self.texts = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.texts.append(text)
+
+
+def bot_game(seed=1):
+    return Game("ai", {1: "human", -1: "bot 1", -2: "bot 2"}, None, seed=seed, quiet=True, record=True)
+
+
+def test_compare_respects_budget():
+    game = bot_game()
+    start = time.perf_counter()
+    scores = ai.compare(game, -1, [lambda g: None, lambda g: g.players[-1].add_money(1000)], budget=0.05)
+    assert time.perf_counter() - start < 0.5
+    assert scores[1] > scores[0]
+    # The live game is never touched.
+    assert game.players[-1].get_money() == 1500
+
+
+def test_rollout_policy_buys_with_cash_to_spare():
+    game = bot_game()
+    bot = game.players[-1]
+    bot.set_position(39)
+    game.turn = bot.get_id()
+    policy = ai.RolloutPolicy(budget=0.02, horizon=10)
+    assert policy.should_buy(game, bot, game.board[39])
+    bot.add_money(-1450)
+    assert not policy.should_buy(game, bot, game.board[39])
+
+
+def test_bots_play_until_a_human_is_up():
+    game = bot_game()
+    bots = {-1: "easy", -2: "medium"}
+    for _ in range(20):
+        turns = ai.act(game, bots)
+        if len(game.players) < 2:
+            break
+        current = game.get_player_by_local_id(game.turn)
+        assert current.get_user_id() == 1
+        assert turns >= 1 or game.turn == 0
+        # The human just ends their turn, and pays whatever they owe.
+        while game.pending_payments:
+            payer, payee, amount = game.pending_payments[0]
+            if payer.get_user_id() != 1 or payer.get_money() < amount:
+                break
+            game.pay(1, None if payee is None else str(payee.get_id()), amount)
+        game.end_turn(1)
+
+    # Everything the bots did went through the game's commands, so the game can be replayed.
+    replayed = Game.replay(game.events)
+    assert replayed.get_state()["players"] == game.get_state()["players"]
+
+
+def test_bot_answers_trade():
+    game = bot_game()
+    human = game.players[1]
+    bot = game.players[-1]
+    bot.set_position(39)
+    game.turn = bot.get_id()
+    game.purchase_property(-1)
+    game.turn = human.get_id()
+
+    # Offering $1 for Boardwalk gets the trade cancelled.
+    game.setup_trade(1, str(bot.get_id()))
+    game.add_to_trade(1, -1, 1, 0)
+    game.add_to_trade(-1, 0, 0, 0)
+    game.agree_to_trade(1)
+    ai.answer_trade(game, {-1: "hard"})
+    assert game.pending_trade is None
+    assert game.board[39].get_owner() is bot
+
+
+def test_evaluate_trade():
+    game = bot_game()
+    bot = game.players[-1]
+    for position in [37, 39]:
+        bot.set_position(position)
+        game.turn = bot.get_id()
+        game.purchase_property(-1)
+    game.turn = game.players[1].get_id()
+
+    # Giving away a whole monopoly for $1 is clearly bad for the bot.
+    game.setup_trade(1, str(bot.get_id()))
+    game.add_to_trade(1, -1, 1, 0)
+    game.add_to_trade(-1, 0, 0, 0)
+    game.add_to_trade(-1, 1, 0, 0)
+    before = game.get_state()
+
+    start = time.perf_counter()
+    pool = ai.new_trade_pool(2)
+    try:
+        evaluation = ai.evaluate_trade(game, pool, rollouts=200, horizon=20, budget=5)
+    finally:
+        pool.close()
+    assert time.perf_counter() - start < 10
+    assert evaluation.rollouts == 200
+    assert evaluation.win_change(1) < 0 < evaluation.win_change(0)
+    assert evaluation.worth_change(1) < 0
+    assert "human: win chance +" in evaluation.summary()
+    assert game.get_state() == before
+
+
+def test_bots_wait_for_human_debts():
+    bot = RecordingBot()
+    game = Game("ai", {-1: "bot", 1: "human 1", 2: "human 2"}, bot, seed=1)
+    # The bot rolls doubles onto Community Chest and draws "It's your birthday!", so the humans owe it $10.
+    # roll_dice pays some of that straight away, but not all of it.
+    game.draws.replayed = deque([1, 1, 8])
+    assert ai.act(game, {-1: "easy"}) == 1
+    assert [p.get_user_id() for (p, _, _) in game.pending_payments] == [2]
+    assert sum("You cannot end the turn!" in text for text in bot.texts) == 1
+
+
+def test_clones_are_quiet():
+    bot = RecordingBot()
+    game = Game("ai", {1: "human", -1: "bot"}, bot, seed=1)
+    sent = len(bot.texts)
+    scores = ai.compare(game, -1, [lambda g: None, lambda g: g.purchase_property(-1)], budget=0.01, horizon=5)
+    assert len(scores) == 2
+    assert ai.clone(game).quiet
+    assert len(bot.texts) == sent
+    assert not game.quiet
+
+
+def test_act_stops_when_no_humans_are_left():
+    game = Game("ai", {-1: "bot 1", -2: "bot 2"}, None, seed=1, quiet=True)
+    bots = {-1: "hard", -2: "hard"}
+    assert ai.act(game, bots) == 0
+    assert not ai.humans_left(game)
+    assert not ai.bot_to_move(game, bots)
+
+
+def test_act_respects_budget():
+    game = bot_game()
+    game.turn = game.players[-1].get_id()
+    bots = {-1: "easy", -2: "easy"}
+    assert ai.act(game, bots, budget=0) == 0
+    assert ai.bot_to_move(game, bots)
+    assert ai.act(game, bots) >= 1
+    assert not ai.bot_to_move(game, bots)
@@ -0,0 +1,13 @@
+from benchmarks import bench
+
+
+def test_benchmarks_run():
+    results = bench.run(number=2, repeat=1)
+    assert len(results["results"]) == len(bench.BENCHMARKS) * len(bench.PLAYER_COUNTS) * len(bench.PHASES)
+    assert all(r["ns_per_op"] > 0 for r in results["results"].values())
+
+
+def test_compare_reports_regressions():
+    baseline = {"results": {"a": {"ns_per_op": 100}, "b": {"ns_per_op": 100}, "gone": {"ns_per_op": 1}}}
+    results = {"results": {"a": {"ns_per_op": 115}, "b": {"ns_per_op": 130}, "new": {"ns_per_op": 1}}}
+    assert bench.compare(results, baseline, threshold=0.2) == [("b", 100, 130)]
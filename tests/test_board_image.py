@@ -0,0 +1,112 @@
+from io import BytesIO
+
+from PIL import Image
+from telegram.error import BadRequest
+
+from board_image import BoardImage, BoardRenderer
+
+
+class PhotoSize:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class Message:
+    def __init__(self, file_id):
+        self.photo = [PhotoSize("small"), PhotoSize(file_id)]
+
+
+class PhotoBot:
+    def __init__(self, reject=()):
+        self.sent = []
+        self.reject = reject
+
+    def send_photo(self, chat_id, photo):
+        if photo in self.reject:
+            raise BadRequest("wrong file identifier")
+        self.sent.append(photo)
+        return Message("uploaded-%d" % len(self.sent))
+
+
+def test_uploads_once_then_reuses_file_id(tmp_path):
+    file_id_path = str(tmp_path / "file_id.txt")
+    board = BoardImage(file_id_path=file_id_path, max_size=256)
+    bot = PhotoBot()
+
+    board.send(bot, 1)
+    board.send(bot, 2)
+
+    upload = bot.sent[0]
+    assert isinstance(upload, BytesIO)
+    assert max(Image.open(upload).size) <= 256
+    assert bot.sent[1] == "uploaded-1"
+
+    # The file_id survives a restart.
+    assert BoardImage(file_id_path=file_id_path).file_id == "uploaded-1"
+
+
+def test_rejected_file_id_is_uploaded_again(tmp_path):
+    file_id_path = tmp_path / "file_id.txt"
+    file_id_path.write_text("stale")
+    board = BoardImage(file_id_path=str(file_id_path), max_size=256)
+    bot = PhotoBot(reject=("stale",))
+
+    board.send(bot, 1)
+    assert isinstance(bot.sent[0], BytesIO)
+    assert board.file_id == "uploaded-1"
+
+
+def test_renderer_only_redraws_changed_tiles():
+    from monopoly import Game
+
+    renderer = BoardRenderer(max_size=300)
+    game = Game("render", {0: "a", 1: "b"}, quiet=True)
+    drawn = []
+    draw_tile = renderer.draw_tile
+    renderer.draw_tile = lambda canvas, draw, position, state: (drawn.append(position),
+                                                               draw_tile(canvas, draw, position, state))
+
+    first = renderer.render(game)
+    assert len(drawn) == 41
+    assert renderer.render(game) is first
+
+    drawn.clear()
+    game.players[0].set_position(1)
+    game.purchase_property(0)
+    image = renderer.render(game)
+    # Go (token left), Mediterranean Avenue (token and owner) and the legend (money).
+    assert sorted(drawn) == [0, 1, 40]
+    assert Image.open(BytesIO(image)).size == (300, 300)
+
+
+def test_renderer_sends_each_state_once():
+    from monopoly import Game
+    from outbox import MessageOutbox
+
+    renderer = BoardRenderer(max_size=300)
+    game = Game(1, {0: "a", 1: "b"}, quiet=True)
+    bot = PhotoBot(reject=("uploaded-1",))
+    outbox = MessageOutbox(bot, global_rate=1000)
+    outbox.chat_interval = lambda chat_id: 0
+
+    renderer.send(outbox, game)
+    assert outbox.wait_until_empty(timeout=5)
+    assert isinstance(bot.sent[0], BytesIO)
+
+    # Telegram refuses the file_id, which is forgotten, so the board is uploaded again next time.
+    renderer.send(outbox, game)
+    assert outbox.wait_until_empty(timeout=5)
+    assert len(bot.sent) == 1
+    renderer.send(outbox, game)
+    assert outbox.wait_until_empty(timeout=5)
+    assert isinstance(bot.sent[1], BytesIO)
+
+    renderer.send(outbox, game)
+    assert outbox.wait_until_empty(timeout=5)
+    assert bot.sent[2] == "uploaded-2"
+
+    game.players[0].set_position(1)
+    renderer.send(outbox, game)
+    assert outbox.wait_until_empty(timeout=5)
+    assert isinstance(bot.sent[3], BytesIO)
+    outbox.close()
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from chat_executor import ChatExecutor
+
+
+def test_chat_tasks_run_in_order():
+    executor = ChatExecutor(workers=4)
+    seen = {chat_id: [] for chat_id in range(3)}
+    for i in range(50):
+        for chat_id in seen:
+            executor.submit(chat_id, seen[chat_id].append, i)
+    assert executor.wait_until_idle(5)
+    assert all(order == list(range(50)) for order in seen.values())
+    executor.close()
+
+
+def test_chats_run_in_parallel_but_not_within_a_chat():
+    executor = ChatExecutor(workers=4)
+    active = {}
+    overlaps = []
+    lock = threading.Lock()
+
+    def task(chat_id):
+        with lock:
+            if active.get(chat_id):
+                overlaps.append(chat_id)
+            active[chat_id] = True
+        time.sleep(0.05)
+        with lock:
+            active[chat_id] = False
+
+    start = time.perf_counter()
+    for _ in range(4):
+        for chat_id in range(4):
+            executor.submit(chat_id, task, chat_id)
+    assert executor.wait_until_idle(5)
+    # Four chats of four 50ms tasks each take about 200ms on four workers, not 800ms.
+    assert time.perf_counter() - start < 0.6
+    assert overlaps == []
+    executor.close()
+
+
+def test_errors_are_reported_and_the_chat_continues():
+    errors = []
+    executor = ChatExecutor(workers=1, on_error=lambda chat_id, e: errors.append((chat_id, type(e))))
+    done = []
+    executor.submit(7, lambda: 1 / 0)
+    executor.submit(7, done.append, 1)
+    assert executor.wait_until_idle(5)
+    assert errors == [(7, ZeroDivisionError)]
+    assert done == [1]
+    executor.close()
+
+
+def test_submit_blocks_when_full():
+    executor = ChatExecutor(workers=1, max_pending=1)
+    release = threading.Event()
+    executor.submit(1, release.wait)
+    # Wait for the worker to pick up the blocking task, then fill the queue.
+    while executor.running == 0:
+        time.sleep(0.001)
+    executor.submit(2, lambda: None)
+
+    submitted = threading.Event()
+    threading.Thread(target=lambda: (executor.submit(3, lambda: None), submitted.set()), daemon=True).start()
+    assert not submitted.wait(0.1)
+    release.set()
+    assert submitted.wait(2)
+    assert executor.wait_until_idle(5)
+    executor.close()
@@ -0,0 +1,148 @@
+from game_registry import new_chat_data
+from game_store import GameStore
+from monopoly import Game
+from simulation import settle_payments
+
+
+def chat_with_game(chat_id):
+    chat_data = new_chat_data()
+    chat_data["game_obj"] = Game(chat_id, {1: "a", 2: "b", 3: "c"}, None, seed=chat_id, quiet=True)
+    return chat_data
+
+
+def test_state_round_trip():
+    game = Game(7, {1: "a", 2: "b"}, None, seed=7, quiet=True)
+    player = game.players[1]
+    for _ in range(6):
+        game.roll_dice(game.get_player_by_local_id(game.turn).get_user_id())
+        current = game.get_player_by_local_id(game.turn)
+        if game.board[current.get_position()] in game.available_properties:
+            game.purchase_property(current.get_user_id())
+        game.pending_payments.clear()
+        game.end_turn(current.get_user_id())
+    player.add_money(-300)
+
+    restored = Game.from_state(game.get_state())
+    assert restored.get_state() == game.get_state()
+    assert restored.players[1].get_money() == player.get_money()
+    for (a, b) in zip(restored.players[1].get_properties(), player.get_properties()):
+        assert a.get_name() == b.get_name()
+        assert a.get_owner() is restored.players[1]
+    assert len(restored.available_properties) == len(game.available_properties)
+
+
+def test_latest_save_wins_after_reopening(tmp_path):
+    path = str(tmp_path / "games.log")
+    store = GameStore(path)
+    chat_data = chat_with_game(100)
+    store.save(100, chat_data)
+    chat_data["game_obj"].players[2].add_money(55)
+    store.save(100, chat_data)
+    store.save(200, chat_with_game(200))
+    store.close()
+
+    store = GameStore(path)
+    assert len(store) == 2
+    assert store.load(100)["game_obj"].players[2].get_money() == 1555
+    assert store.load(300) is None
+    store.close()
+
+
+def test_unchanged_chat_is_not_appended(tmp_path):
+    path = tmp_path / "games.log"
+    store = GameStore(str(path))
+    chat_data = chat_with_game(100)
+    store.save(100, chat_data)
+    size = path.stat().st_size
+    store.save(100, chat_data)
+    assert path.stat().st_size == size
+    store.close()
+
+
+def test_partial_record_is_ignored(tmp_path):
+    path = tmp_path / "games.log"
+    store = GameStore(str(path))
+    store.save(100, chat_with_game(100))
+    store.close()
+    with open(path, "ab") as f:
+        f.write(b"200\t{\"is_game")
+
+    store = GameStore(str(path))
+    assert 100 in store
+    assert 200 not in store
+    store.close()
+
+
+def test_compaction_keeps_latest_states(tmp_path):
+    path = tmp_path / "games.log"
+    store = GameStore(str(path), compact_ratio=2, min_compact_size=0)
+    chat_data = chat_with_game(100)
+    for i in range(10):
+        chat_data["game_obj"].players[1].add_money(1)
+        store.save(100, chat_data)
+        store.save(200, chat_with_game(200))
+        if store.compaction_thread is not None:
+            store.compaction_thread.join()
+    ended = new_chat_data()
+    store.save(300, chat_with_game(300))
+    store.save(300, ended)
+    store.compact()
+
+    assert path.stat().st_size == store.live_size
+    assert 300 not in store
+    assert store.load(100)["game_obj"].players[1].get_money() == 1510
+    store.close()
+
+
+def play_turn(game):
+    user_id = game.get_player_by_local_id(game.turn).get_user_id()
+    game.roll_dice(user_id)
+    if game.board[game.players[user_id].get_position()] in game.available_properties:
+        game.purchase_property(user_id)
+    # Through the game's commands, so that the events say what happened.
+    settle_payments(game)
+    game.end_turn(user_id)
+
+
+def test_only_new_events_are_appended(tmp_path):
+    path = tmp_path / "games.log"
+    store = GameStore(str(path))
+    chat_data = new_chat_data()
+    game = chat_data["game_obj"] = Game(100, {1: "a", 2: "b"}, None, seed=5, quiet=True, record=True)
+    store.save(100, chat_data)
+    for _ in range(6):
+        play_turn(game)
+        store.save(100, chat_data)
+    store.close()
+
+    lines = path.read_bytes().splitlines()
+    assert len(lines) == 7
+    assert all(line.startswith(b"100\t+[") for line in lines[1:])
+
+    store = GameStore(str(path))
+    loaded = store.load(100)["game_obj"]
+    assert loaded.get_state() == game.get_state()
+    chat_data["game_obj"] = loaded
+    play_turn(loaded)
+    store.save(100, chat_data)
+    assert path.read_bytes().splitlines()[-1].startswith(b"100\t+[")
+    store.close()
+
+
+def test_cut_event_log_is_saved_in_full(tmp_path):
+    path = tmp_path / "games.log"
+    store = GameStore(str(path))
+    chat_data = new_chat_data()
+    game = chat_data["game_obj"] = Game(100, {1: "a", 2: "b"}, None, seed=5, quiet=True, record=True)
+    play_turn(game)
+    before = game.snapshot()
+    log_length = game.logged_events
+    store.save(100, chat_data)
+    play_turn(game)
+    store.save(100, chat_data)
+    game.restore(before, log_length)
+    store.save(100, chat_data)
+
+    assert not path.read_bytes().splitlines()[-1].startswith(b"100\t+")
+    assert store.load(100)["game_obj"].get_state() == game.get_state()
+    store.close()
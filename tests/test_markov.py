@@ -0,0 +1,55 @@
+import pytest
+
+import markov
+from monopoly import Game
+
+
+@pytest.fixture
+def game():
+    return Game("markov", {0: "a", 1: "b"}, quiet=True, seed=1)
+
+
+def test_landing_probabilities(game):
+    p = markov.landing_probabilities(game.board)
+
+    assert p.sum() == pytest.approx(1)
+    assert p[30] == pytest.approx(0)  # Go To Jail always moves you on.
+    assert p.argmax() == 10
+
+
+def test_matches_rolling_the_dice(game):
+    p = markov.landing_probabilities(game.board)
+    player = game.players[0]
+    counts = [0] * 40
+    rolls = 50000
+    for _ in range(rolls):
+        game.last_roll = [-1]
+        game.roll_dice(0)
+        game.pending_payments.clear()
+        counts[player.get_position()] += 1
+
+    assert max(abs(p[i] - counts[i] / rolls) for i in range(40)) < 0.01
+
+
+def test_expected_rents(game):
+    assert all(rent == 0 for rent in markov.expected_rents(game).values())
+
+    player = game.players[0]
+    for position in (37, 39):
+        player.set_position(position)
+        game.purchase_property(0)
+    monopoly_rent = markov.expected_rents(game)["Boardwalk"]
+    p = markov.landing_probabilities(game.board)
+    assert monopoly_rent == pytest.approx(p[39] * 100)
+
+    game.board[39].add_house()
+    assert markov.expected_rents(game)["Boardwalk"] == pytest.approx(p[39] * 250)
+
+
+def test_card_squares_resolve_to_a_distribution():
+    for position in (2, 7, 22, 36):
+        outcomes = markov.resolve_landing(position)
+        assert sum(p for (_, p) in outcomes) == pytest.approx(1)
+    # Going back three from the last Chance lands on Community Chest, which can send the player to jail too.
+    to_jail = sum(p for (state, p) in markov.resolve_landing(36) if state == markov.jail_state(markov.JAIL_TURNS))
+    assert to_jail == pytest.approx(1 / 13 + 1 / 13 * 1 / 15)
@@ -0,0 +1,65 @@
+import urllib.request
+
+import pytest
+
+from metrics import CountedOutbox, MetricsRegistry, TimedBot, serve, time_methods
+
+
+class FakeBot:
+    def __init__(self):
+        self.msgs = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.msgs.append((chat_id, text))
+
+    def get_me(self):
+        return "me"
+
+
+class Engine:
+    def outer(self):
+        return self.inner() + 1
+
+    def inner(self):
+        return 1
+
+
+def test_command_breakdown():
+    registry = MetricsRegistry()
+    time_methods(Engine, ["outer", "inner"], "game_seconds", registry)
+    bot = TimedBot(FakeBot(), registry)
+    outbox = CountedOutbox(bot, registry)
+
+    def handler():
+        Engine().outer()
+        outbox.send_message(chat_id=1, text="a")
+        outbox.send_message(chat_id=1, text="b")
+        assert outbox.get_me() == "me"
+
+    registry.measure("roll", handler)
+    with pytest.raises(ZeroDivisionError):
+        registry.measure("roll", lambda: 1 / 0)
+
+    text = registry.render()
+    assert 'monopoly_commands_total{command="roll"} 2' in text
+    assert 'monopoly_command_errors_total{command="roll"} 1' in text
+    assert 'monopoly_command_messages_total{command="roll"} 2' in text
+    # The nested call is only counted once.
+    assert 'monopoly_command_game_seconds_count{command="roll"} 1' in text
+    assert 'monopoly_command_send_seconds_count{command="roll"} 1' in text
+    assert 'monopoly_telegram_request_seconds_count{method="send_message"} 2' in text
+    assert "# TYPE monopoly_command_seconds summary" in text
+    assert "# TYPE monopoly_command_seconds_max gauge" in text
+    assert 'monopoly_command_seconds_max{command="roll"}' in text
+
+
+def test_endpoint():
+    registry = MetricsRegistry()
+    registry.inc("commands_total", command="board")
+    server = serve(registry, port=0)
+    try:
+        url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+        with urllib.request.urlopen(url) as response:
+            assert 'monopoly_commands_total{command="board"} 1' in response.read().decode("utf-8")
+    finally:
+        server.shutdown()
@@ -1,3 +1,5 @@
+import json
+import prettytable  # type: ignore
 import pytest
 import re
 
@@ -180,3 +182,427 @@ def test_asset_printer(game, capsys):
         print(ps)
 
 
+
+
+def test_properties_str_cache(game):
+    p0 = game.get_players()[0]
+    for pos in [1, 3, 5, 6, 8, 9, 15]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+
+    text = p0.get_properties_str()
+    assert p0.get_properties_str() is text
+    table = prettytable.PrettyTable()
+    table.field_names = list(PROPERTY_TABLE_FIELDS)
+    for (id, p) in enumerate(p0.get_properties()):
+        table.add_row(list(property_row(id, p)))
+    assert text == "testplayer_0 properties:\n\n" + table.get_string()
+
+    for change in [lambda: game.board[1].add_house(), lambda: game.board[5].set_mortgaged(True),
+                   lambda: game.mortgage_property(p0.id, ["baltic"]), lambda: p0.remove_property(game.board[15])]:
+        change()
+        assert p0.get_properties_str() != text
+        text = p0.get_properties_str()
+
+    # Money isn't in the table, so it doesn't throw the table away.
+    p0.add_money(100)
+    assert p0.get_properties_str() is text
+
+
+def test_total_assets_tracking(game):
+    p0 = game.get_players()[0]
+    p1 = game.get_players()[1]
+    p0.add_money(5000)
+    for pos in [1, 3, 5]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    snapshot = game.snapshot()
+    assert p0.get_total_assets() == p0.get_money() + 30 + 30 + 100
+
+    for ids in [["0"], ["1"]] * 4:
+        game.purchase_house(p0.id, ids)
+    game.purchase_hotel(p0.id, ["0"])
+    game.sell_house(p0.id, ["1"])
+    game.mortgage_property(p0.id, ["reading"])
+    assert p0.get_total_assets() == p0.get_money() + 30 + 30 + 100 + 50 + 3 * 50
+
+    game.board[1].set_hotels(0)
+    game.board[1].set_houses(2)
+    assert p0.property_assets == 30 + 30 + 100 + 2 * 50 + 3 * 50
+    game.pending_trade = Trade(p0, p1, properties=([game.board[5]], []), agreed=(True, True))
+    game.trade()
+    assert p1.get_total_assets() == p1.get_money() + 100
+
+    state_game = Game.from_state(game.get_state())
+    assert state_game.players[p0.id].property_assets == p0.property_assets
+    game.restore(snapshot)
+    assert p0.property_assets == 160
+    assert p1.property_assets == 0
+
+    p0.property_assets += 1
+    with pytest.raises(AssertionError):
+        p0.get_total_assets()
+
+
+def test_plan_liquidation(game):
+    p0 = game.get_players()[0]
+    for pos in [1, 3, 5, 39]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    game.board[1].set_houses(2)
+    game.board[3].set_houses(2)
+    p0.money = 0
+
+    def plan(amount):
+        return sorted((name, p.get_name()) for (name, p) in plan_liquidation(p0, amount))
+
+    # Mortgaging Reading Railroad loses $25 of rent, less than Mediterranean's two houses ($20 + $8).
+    assert plan(100) == [("mortgage_property", "Reading Railroad")]
+    # Boardwalk loses $50, less than the railroad and two houses together.
+    assert plan(200) == [("mortgage_property", "Boardwalk")]
+    assert plan(250) == [("mortgage_property", "Boardwalk"), ("sell_house", "Mediterranean Avenue")]
+    assert plan(300) == [("mortgage_property", "Boardwalk"), ("mortgage_property", "Reading Railroad")]
+    assert plan_liquidation(p0, 0) == []
+    assert plan_liquidation(p0, 30 + 30 + 200 + 100 + 4 * 50 + 1) is None
+
+
+def test_autopay():
+    bot = FakeBot()
+    game = Game("aaa", {0: "testplayer_0", 1: "testplayer_1"}, bot)
+    p0 = game.players[0]
+    p1 = game.players[1]
+    for pos in [1, 3, 5]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    game.board[1].set_houses(4)
+    game.board[1].add_hotel()
+    p0.money = 10
+    p1.money = 0
+    game.pending_payments.append((p0, p1, 150))
+    game.pending_payments.append((p0, None, 100))
+    bot.msgs.clear()
+
+    game.autopay(p0.id)
+    assert len(bot.msgs) == 1
+    assert bot.msgs[0].startswith("testplayer_0 paid $250 (testplayer_1 $150, the bank $100).\n")
+    assert game.pending_payments == []
+    assert p1.get_money() == 150
+    # Selling the hotel and two houses ($150) and mortgaging the railroad ($100) loses the least rent.
+    assert p0.get_money() == 10 + 150 + 100 - 250
+    assert game.board[1].get_houses() == 2 and game.board[1].get_hotels() == 0
+    assert game.board[5].get_mortgaged() and not game.board[3].get_mortgaged()
+
+    # Nothing changes when the assets don't cover the debt.
+    game.pending_payments.append((p0, p1, 10000))
+    snapshot = game.snapshot()
+    game.autopay(p0.id)
+    assert game.snapshot() == snapshot
+    assert "not have enough total assets" in bot.msgs[1]
+
+
+def test_pay_only_suggests_autopay_when_it_would_work():
+    bot = FakeBot()
+    game = Game("aaa", {0: "testplayer_0", 1: "testplayer_1"}, bot)
+    p0 = game.players[0]
+    p0.set_position(1)
+    game.purchase_property(p0.id)
+    game.mortgage_property(p0.id, ["0"])
+    # The mortgaged property still counts towards the total assets, but can't raise anything.
+    p0.money = 1530
+    game.pending_payments.append((p0, None, 1540))
+    bot.msgs.clear()
+
+    game.pay(p0.id, None, 1540)
+    assert "not have enough total assets" in bot.msgs[0]
+    game.autopay(p0.id)
+    assert "not have enough total assets" in bot.msgs[2]
+
+    # With something left to mortgage, both agree that /autopay can do it.
+    p0.set_position(3)
+    game.purchase_property(p0.id)
+    p0.money = 1530
+    bot.msgs.clear()
+    game.pay(p0.id, None, 1540)
+    assert bot.msgs[0].endswith("/autopay will do that for you.")
+    game.autopay(p0.id)
+    assert game.pending_payments == []
+
+
+def test_bulk_building():
+    bot = FakeBot()
+    game = Game("aaa", {0: "testplayer_0", 1: "testplayer_1"}, bot)
+    p0 = game.players[0]
+    for pos in [5, 15, 16, 18, 19, 37, 39]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    orange = [game.board[pos] for pos in COLOR_GROUPS["Orange 🟧"]]
+    p0.money = 1000
+    bot.msgs.clear()
+
+    game.build_houses(p0.id, "orange", 4)
+    assert "costs $1200" in bot.msgs.pop()
+    assert all(p.get_houses() == 0 for p in orange)
+
+    game.build_houses(p0.id, "Orange", 3)
+    assert [p.get_houses() for p in orange] == [3, 3, 3]
+    assert p0.get_money() == 100
+    assert len(bot.msgs) == 1 and bot.msgs.pop().startswith("testplayer_0 built on Orange 🟧 for $900:\n")
+
+    game.sell_houses(p0.id, "orange", 1)
+    assert [p.get_houses() for p in orange] == [1, 1, 1]
+    assert p0.get_money() == 700
+    game.build_houses(p0.id, "railroads", 1)
+    assert "full set of railroads" in bot.msgs[-1]
+    bot.msgs.clear()
+
+    # Keeps $150 and builds evenly. Orange houses add more rent for their price than blue ones.
+    game.build_max(p0.id, 150)
+    assert len(bot.msgs) == 1
+    assert sorted(building_level(p) for p in orange) == [2, 3, 3]
+    assert game.board[37].get_houses() == game.board[39].get_houses() == 0
+    assert p0.get_money() == 200
+
+
+def test_bulk_mortgage():
+    bot = FakeBot()
+    game = Game("aaa", {0: "testplayer_0", 1: "testplayer_1"}, bot)
+    p0 = game.players[0]
+    for pos in [1, 5, 15]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    money = p0.get_money()
+    bot.msgs.clear()
+
+    game.mortgage_properties(p0.id, "all-railroads")
+    assert game.board[5].get_mortgaged() and game.board[15].get_mortgaged()
+    assert not game.board[1].get_mortgaged()
+    assert p0.get_money() == money + 200
+    assert len(bot.msgs) == 1
+
+    game.unmortgage_properties(p0.id, "railroads")
+    assert not game.board[5].get_mortgaged() and p0.get_money() == money
+    game.mortgage_properties(p0.id, "pink")
+    assert "nothing in pink" in bot.msgs[-1]
+    game.mortgage_properties(p0.id, "purple")
+    assert "is not a color" in bot.msgs[-1]
+
+
+def test_ownership_index(game):
+    p0 = game.get_players()[0]
+    p1 = game.get_players()[1]
+
+    for pos in [1, 3, 5, 15]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    assert p0.has_color_set("Brown 🟫")
+    assert not p0.has_color_set("Light Blue ⬜️")
+    assert p0.get_unmortgaged_count("Railroad") == 2
+
+    game.mortgage_property(p0.id, ["reading"])
+    assert p0.get_unmortgaged_count("Railroad") == 1
+
+    game.pending_trade = Trade(p0, p1, properties=([game.board[1], game.board[5]], []), agreed=(True, True))
+    game.trade()
+    assert not p0.has_color_set("Brown 🟫")
+    assert p0.get_unmortgaged_count("Railroad") == 1
+    assert p1.color_counts["Brown 🟫"] == 1
+    assert p1.get_unmortgaged_count("Railroad") == 0
+
+    game.turn = p1.id
+    game.unmortgage_property(p1.id, ["reading"])
+    assert p1.get_unmortgaged_count("Railroad") == 1
+
+
+def test_property_lookup(game):
+    p0 = game.get_players()[0]
+    p1 = game.get_players()[1]
+
+    for pos in [15, 34, 39, 1]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    # Sorted by color: Boardwalk, Mediterranean, Pennsylvania Avenue, Pennsylvania Railroad
+    assert p0.get_property_by_id(0).get_name() == "Boardwalk"
+    assert p0.get_property_by_id(4) is None
+    assert p0.get_property_by_id(-1) is None
+    assert p0.get_property_by_name("boardwalk").get_name() == "Boardwalk"
+    assert p0.get_property_by_name("Mediterranean Ave").get_name() == "Mediterranean Avenue"
+    assert p0.get_property_by_name("pennsylvania railroad").get_name() == "Pennsylvania Avenue"
+    assert p0.get_property_by_name("Park Place") is None
+
+    game.pending_trade = Trade(p0, p1, properties=([game.board[39]], []), agreed=(True, True))
+    game.trade()
+    assert p0.get_property_by_name("boardwalk") is None
+    assert p1.get_property_by_name("boardwalk").get_name() == "Boardwalk"
+    assert p0.get_property_by_id(0).get_name() == "Mediterranean Avenue"
+
+
+def test_trade_changes(game):
+    p0 = game.get_players()[0]
+    p1 = game.get_players()[1]
+    for pos in [1, 39]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    game.setup_trade(p0.id, str(p1.id))
+    game.clear_messages()
+
+    game.add_to_trade(p0.id, 0, 0, 0)
+    assert game.match_message(r"^The trade has changed:\n\+ Boardwalk from testplayer_0\n")
+    game.add_to_trade(p1.id, -1, 300, 0)
+    assert game.match_message(r"\+ \$300 from testplayer_1\n")
+    game.remove_from_trade(p1.id, -1, 1000, 0)
+    assert game.match_message(r"- \$300 from testplayer_1\n")
+    assert game.pending_trade.money == [0, 0]
+    game.add_to_trade(p1.id, -1, 100, 0)
+    game.clear_messages()
+
+    game.show_trade()
+    text = game.get_message()
+    assert "From testplayer_0:\n\nMoney: $0\n" in text
+    assert "Boardwalk : Blue 🟦 (0 houses ($200), 0 hotels ($200)) [Mortgage Value: 200] \n" in text
+    assert "From testplayer_1:\n\nMoney: $100\n" in text
+
+    # A property that gets mortgaged during the negotiation is shown as such.
+    game.mortgage_property(p0.id, ["boardwalk"])
+    game.show_trade()
+    game.clear_messages()
+    game.show_trade()
+    assert "[[Mortgaged]]" in game.get_message()
+
+    snapshot = game.snapshot()
+    game.remove_from_trade(p0.id, 0, 0, 0)
+    assert game.pending_trade.properties == [[], []]
+    game.restore(snapshot)
+    assert game.pending_trade.properties == [[game.board[39]], []]
+    assert Game.from_state(json.loads(json.dumps(game.get_state()))).get_state() == game.get_state()
+
+
+def test_player_lookup(game):
+    p2 = game.get_players()[2]
+    assert game.get_player_by_local_id(2) is p2
+    assert game.get_player_by_name("TestPlayer_2") is p2
+
+    game.bankrupt(p2.get_user_id(), "bank")
+    assert game.get_player_by_local_id(2) is None
+    assert game.get_player_by_name("testplayer_2") is None
+
+
+def test_compact_objects(game):
+    p0 = game.get_players()[0]
+    assert not hasattr(p0, "__dict__")
+    assert not any(hasattr(square, "__dict__") for square in game.board if not isinstance(square, str))
+
+    assert p0.icon_color is None
+    color = p0.get_icon_color()
+    assert len(color) == 3 and p0.get_icon_color() == color
+
+
+def test_snapshot_restore(game):
+    p0 = game.get_players()[0]
+    p1 = game.get_players()[1]
+    for pos in [1, 3, 5]:
+        p0.set_position(pos)
+        game.purchase_property(p0.id)
+    before = game.snapshot()
+
+    game.purchase_house(p0.id, ["mediterranean"])
+    game.mortgage_property(p0.id, ["reading"])
+    game.pending_payments.append((p1, p0, 10))
+    game.roll_dice(p0.id)
+    assert game.snapshot() != before
+
+    game.restore(before)
+    assert game.snapshot() == before
+    assert p0.get_money() == 1500 - 60 - 60 - 200
+    assert game.board[1].get_houses() == 0
+    assert p0.get_unmortgaged_count("Railroad") == 1
+    assert p0.has_color_set("Brown 🟫")
+    assert game.pending_payments == []
+
+    # The dice are restored too, so the same roll comes up again.
+    game.roll_dice(p0.id)
+    roll = game.last_roll
+    game.restore(before)
+    game.roll_dice(p0.id)
+    assert game.last_roll == roll
+
+
+def test_restore_after_bankruptcy(game):
+    p2 = game.get_players()[2]
+    p2.set_position(39)
+    game.turn = p2.id
+    game.purchase_property(p2.id)
+    before = game.snapshot()
+
+    game.bankrupt(p2.get_user_id(), "bank")
+    assert p2.get_user_id() not in game.players
+    assert game.board[39] in game.available_properties
+
+    game.restore(before)
+    assert game.get_player_by_name("testplayer_2") is p2
+    assert game.board[39].get_owner() is p2
+    assert game.board[39] not in game.available_properties
+
+
+def play_recorded_game(turns):
+    game = Game("events", {10: "a", 20: "b", 30: "c"}, None, quiet=True, record=True)
+    for _ in range(turns):
+        player = game.get_player_by_local_id(game.turn)
+        user_id = player.get_user_id()
+        if player.get_turns_left_in_jail() > 0:
+            game.pay_bail(user_id)
+        while sum(game.last_roll) == -1 and user_id in game.players:
+            game.roll_dice(user_id)
+        if game.board[player.get_position()] in game.available_properties:
+            game.purchase_property(user_id)
+        game.mortgage_property(user_id, ["0"])
+        game.end_turn(user_id)
+    return game
+
+
+def test_replay():
+    played = play_recorded_game(60)
+    assert any(event[0] == EVENT_DRAW for event in played.events)
+
+    replayed = Game.replay(json.loads(json.dumps(played.events)))
+    assert replayed.get_state()["players"] == played.get_state()["players"]
+    assert replayed.get_state()["properties"] == played.get_state()["properties"]
+    assert len(replayed.events) == len(played.events)
+
+
+def test_restore_cuts_event_log():
+    game = play_recorded_game(5)
+    player = game.get_player_by_local_id(game.turn)
+    before = game.snapshot()
+    log_length = len(game.events)
+
+    game.purchase_property(player.get_user_id())
+    game.roll_dice(player.get_user_id())
+    game.restore(before, log_length)
+    assert len(game.events) == log_length
+    assert Game.replay(game.events).get_state()["players"] == game.get_state()["players"]
+
+
+def test_event_log_is_cut_back_to_checkpoints(monkeypatch):
+    monkeypatch.setattr("monopoly.MAX_EVENTS", 50)
+    game = play_recorded_game(60)
+    assert len(game.events) <= 50
+    assert game.events[0][0] == EVENT_STATE
+    assert game.logged_events > 50
+
+    replayed = Game.replay(json.loads(json.dumps(game.events)))
+    assert replayed.get_state()["players"] == game.get_state()["players"]
+    assert replayed.get_state()["properties"] == game.get_state()["properties"]
+
+
+def test_restore_across_a_checkpoint(monkeypatch):
+    monkeypatch.setattr("monopoly.MAX_EVENTS", 20)
+    game = play_recorded_game(3)
+    player = game.get_player_by_local_id(game.turn)
+    before = game.snapshot()
+    log_length = game.logged_events
+
+    for _ in range(20):
+        game.mortgage_property(player.get_user_id(), ["0"])
+    assert game.events_dropped > 0
+    game.restore(before, log_length)
+    assert Game.replay(game.events).get_state()["players"] == game.get_state()["players"]
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+import outbox as outbox_module
+from outbox import MessageOutbox, split_message
+
+
+class RecordingBot:
+    def __init__(self, fail_first=0, error=None):
+        self.sent = []
+        self.fail_first = fail_first
+        self.error = RetryAfter(0) if error is None else error
+        self.attempts = 0
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self.lock:
+            self.attempts += 1
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                raise self.error
+            self.sent.append((chat_id, text, kwargs))
+
+
+def test_messages_are_coalesced_per_chat():
+    bot = RecordingBot()
+    outbox = MessageOutbox(bot, global_rate=1000)
+    outbox.send_message(chat_id=1, text="You rolled a [3,4]!")
+    outbox.send_message(chat_id=2, text="hello")
+    outbox.send_message(chat_id=1, text="You landed on Chance!")
+
+    assert bot.sent == []
+    outbox.flush(1)
+    assert outbox.wait_until_empty(timeout=5)
+    assert bot.sent == [(1, "You rolled a [3,4]!\nYou landed on Chance!", {})]
+    outbox.close()
+
+
+def test_formatted_messages_keep_their_order():
+    bot = RecordingBot()
+    outbox = MessageOutbox(bot, global_rate=1000)
+    outbox.chat_interval = lambda chat_id: 0
+    outbox.send_message(chat_id=1, text="first")
+    outbox.send_message(chat_id=1, text="*second*", parse_mode="Markdown")
+    outbox.send_message(chat_id=1, text="third")
+    outbox.flush(1)
+    assert outbox.wait_until_empty(timeout=5)
+    assert [text for _, text, _ in bot.sent] == ["first", "*second*", "third"]
+    outbox.close()
+
+
+def test_flood_control_is_retried():
+    bot = RecordingBot(fail_first=1)
+    outbox = MessageOutbox(bot, global_rate=1000)
+    outbox.send_message(chat_id=1, text="hi")
+    outbox.flush(1)
+    assert outbox.wait_until_empty(timeout=5)
+    assert bot.sent == [(1, "hi", {})]
+    outbox.close()
+
+
+def test_network_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(outbox_module, "FIRST_BACKOFF", 0.01)
+    bot = RecordingBot(fail_first=2, error=TimedOut())
+    outbox = MessageOutbox(bot, global_rate=1000)
+    outbox.send_message(chat_id=1, text="hi")
+    outbox.flush(1)
+    assert outbox.wait_until_empty(timeout=5)
+    assert bot.sent == [(1, "hi", {})]
+    assert outbox.failures == {}
+    outbox.close()
+
+    # Telegram never takes a message it refused, and one that keeps failing is given up on eventually.
+    for (error, attempts) in ((BadRequest("Chat not found"), 1), (TimedOut(), outbox_module.MAX_ATTEMPTS)):
+        bot = RecordingBot(fail_first=100, error=error)
+        outbox = MessageOutbox(bot, global_rate=1000)
+        outbox.send_message(chat_id=1, text="hi")
+        outbox.flush(1)
+        assert outbox.wait_until_empty(timeout=5)
+        assert (bot.sent, bot.attempts) == ([], attempts)
+        outbox.close()
+
+
+def test_idle_chats_are_forgotten():
+    bot = RecordingBot()
+    outbox = MessageOutbox(bot, global_rate=1000)
+    outbox.chat_interval = lambda chat_id: 0.01
+    for chat_id in range(100):
+        outbox.send_message(chat_id=chat_id, text="hi")
+    outbox.flush()
+    assert outbox.wait_until_empty(timeout=5)
+    assert len(bot.sent) == 100
+
+    time.sleep(0.05)
+    with outbox.cond:
+        outbox.sweep(time.monotonic())
+        assert outbox.next_send_at == {}
+    outbox.close()
+
+
+def test_split_message():
+    text = "\n".join(["x" * 10] * 10)
+    chunks = split_message(text, max_length=25)
+    assert all(len(c) <= 25 for c in chunks)
+    assert "\n".join(chunks) == text
+
+
+def test_photos_are_sent_after_earlier_messages():
+    sent = []
+
+    class PhotoBot(RecordingBot):
+        def send_photo(self, chat_id, photo):
+            self.sent.append((chat_id, photo.read(), {}))
+            return "message"
+
+    bot = PhotoBot()
+    outbox = MessageOutbox(bot, global_rate=1000)
+    outbox.chat_interval = lambda chat_id: 0
+    outbox.send_message(chat_id=1, text="Here's the board:")
+    outbox.send_photo(1, b"jpeg", on_sent=sent.append)
+    outbox.send_message(chat_id=1, text="after")
+    outbox.flush(1)
+    assert outbox.wait_until_empty(timeout=5)
+    assert [text for _, text, _ in bot.sent] == ["Here's the board:", b"jpeg", "after"]
+    assert sent == ["message"]
+    outbox.close()
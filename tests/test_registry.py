@@ -0,0 +1,116 @@
+import pytest
+import threading
+
+from game_registry import GameRegistry
+from game_store import GameStore
+from monopoly import Game
+
+
+class FakeBot:
+    def __init__(self):
+        self.msgs = []
+
+    def send_message(self, chat_id, text):
+        self.msgs.append((chat_id, text))
+
+
+@pytest.fixture
+def registry(tmp_path):
+    store = GameStore(str(tmp_path / "games.log"))
+    yield GameRegistry(FakeBot(), store, max_resident=2)
+    store.close()
+
+
+def start_game(registry, chat_id):
+    chat_data = registry.get(chat_id)
+    chat_data["game_obj"] = Game(chat_id, {1: "a", 2: "b"}, registry.bot)
+    return chat_data["game_obj"]
+
+
+def test_chats_are_separate(registry):
+    game_1 = start_game(registry, 100)
+    game_2 = start_game(registry, 200)
+
+    assert registry.get(100)["game_obj"] is game_1
+    assert registry.get(200)["game_obj"] is game_2
+
+
+def test_evicted_game_is_reloaded(registry):
+    game = start_game(registry, 100)
+    game.players[1].add_money(123)
+    start_game(registry, 200)
+    start_game(registry, 300)
+
+    assert 100 not in registry.chats
+    assert 100 in registry
+
+    reloaded = registry.get(100)["game_obj"]
+    assert reloaded is not game
+    assert reloaded.bot is registry.bot
+    assert reloaded.players[1].get_money() == 1500 + 123
+
+
+def test_empty_chats_are_not_saved(registry):
+    registry.get(100)
+    registry.get(200)
+    registry.get(300)
+
+    assert 100 not in registry
+    assert len(registry.store) == 0
+
+
+def test_chats_in_use_are_not_evicted(registry):
+    game = start_game(registry, 100)
+    with registry.in_use(100):
+        start_game(registry, 200)
+        start_game(registry, 300)
+        assert registry.chats[100]["game_obj"] is game
+    start_game(registry, 400)
+    assert 100 not in registry.chats
+
+
+def test_reloaded_game_keeps_recording(registry):
+    chat_data = registry.get(100)
+    game = chat_data["game_obj"] = Game(100, {1: "a", 2: "b"}, registry.bot, seed=3, record=True)
+    game.roll_dice(1)
+    start_game(registry, 200)
+    start_game(registry, 300)
+    assert 100 not in registry.chats
+
+    reloaded = registry.get(100)["game_obj"]
+    assert reloaded.events == game.events
+    reloaded.purchase_property(1)
+    reloaded.end_turn(1)
+    reloaded.roll_dice(2)
+    assert len(reloaded.events) > len(game.events)
+
+    replayed = Game.replay(reloaded.events)
+    assert replayed.get_state(events=False) == dict(reloaded.get_state(events=False), quiet=True)
+
+
+def test_other_chats_are_served_while_one_loads(registry):
+    start_game(registry, 100)
+    registry.chats.pop(100)
+    loading = threading.Event()
+    release = threading.Event()
+    load = registry.store.load
+
+    def slow_load(chat_id, bot=None):
+        if chat_id == 100:
+            loading.set()
+            release.wait(5)
+        return load(chat_id, bot)
+    registry.store.load = slow_load
+
+    results = {}
+    threads = [threading.Thread(target=lambda: results.setdefault("first", registry.get(100))),
+               threading.Thread(target=lambda: results.setdefault("second", registry.get(100)))]
+    threads[0].start()
+    assert loading.wait(5)
+    threads[1].start()
+    # Neither the load nor the lookup waiting for it holds up another chat.
+    start_game(registry, 200)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results["first"] is results["second"] is registry.chats[100]
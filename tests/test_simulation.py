@@ -0,0 +1,86 @@
+from monopoly import EVENT_COMMAND, Game, NullBot, Player
+from simulation import (Policy, PassivePolicy, SimulationResult, batch_simulate, new_game, play_game, play_turn,
+                        settle_payments, simulate)
+
+
+class CountingBot(NullBot):
+    def __init__(self):
+        self.count = 0
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.count += 1
+
+
+def test_game_without_bot():
+    game = Game("sim", {0: "a", 1: "b"})
+    game.roll_dice(0)
+    assert sum(game.last_roll) > 0
+
+
+def test_quiet_game_sends_nothing():
+    bot = CountingBot()
+    game = Game("sim", {0: "a", 1: "b"}, bot, seed=1, quiet=True)
+    play_game(game, PassivePolicy(), max_turns=50)
+    assert bot.count == 0
+
+
+def test_seeded_games_are_reproducible():
+    def positions(seed):
+        game = new_game(3, seed)
+        play_game(game, PassivePolicy(), max_turns=30)
+        return [(p.get_position(), p.get_money()) for p in game.players.values()]
+
+    assert positions(7) == positions(7)
+    assert positions(7) != positions(8)
+
+
+def test_recorded_rent_is_what_was_paid():
+    game = new_game(3, 5)
+    for player in game.players.values():
+        # Rich enough that every rent is paid in full.
+        player.add_money(100000)
+    stats = SimulationResult()
+    paid = 0
+    for _ in range(300):
+        roller = game.get_player_by_local_id(game.turn)
+        money = {p.get_id(): p.get_money() for p in game.players.values()}
+        play_turn(game, Policy(), stats)
+        # Rent is the only way money reaches another player on a roll that ends on a property.
+        owner = getattr(game.board[roller.get_position()], "owner", None)
+        if owner is not None and owner != roller:
+            paid += owner.get_money() - money[owner.get_id()]
+    assert paid > 0
+    assert sum(stats.rent.values()) == paid
+
+
+def test_refused_bankruptcy_is_recorded():
+    game = Game("sim", {0: "a", 1: "b"}, seed=1, quiet=True, record=True)
+    game.roll_dice(0)
+    # Owed to someone who has left the game, so Game.bankrupt refuses to bankrupt to them.
+    ghost = Player(2, 5, "ghost", 0)
+    game.pending_payments.append((game.players[0], ghost, 5000))
+    settle_payments(game)
+
+    assert game.pending_payments == []
+    assert game.events[-1] == (EVENT_COMMAND, "write_off_payments", 0)
+    assert Game.replay(game.events).get_state() == game.get_state()
+
+
+def test_simulate():
+    result = simulate(5, seed=3, max_turns=200)
+    assert result.games == 5
+    assert result.turns > 0
+    assert sum(result.wins.values()) == result.finished
+    assert result.games_per_second > 0
+
+
+def test_batch_matches_serial():
+    serial = simulate(8, seed=11, max_turns=100)
+    batch = batch_simulate(8, seed=11, max_turns=100, processes=2, chunk_size=3)
+
+    assert batch.games == serial.games
+    assert batch.turns == serial.turns
+    assert batch.landings == serial.landings
+    assert batch.rent == serial.rent
+    assert batch.game_lengths == serial.game_lengths
+    assert abs(sum(batch.landing_frequencies()) - 1) < 1e-9
@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from webhook import SECRET_HEADER, WebhookServer
+
+
+def post(server, body, path="/telegram", secret="s3cret"):
+    """Post like Telegram does, returning the status code."""
+    (host, port) = server.address
+    data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    request = urllib.request.Request(f"http://{host}:{port}{path}", data=data,
+                                     headers={"Content-Type": "application/json", SECRET_HEADER: secret})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def new_server(process, **kwargs):
+    server = WebhookServer(process, port=0, secret_token="s3cret", **kwargs)
+    server.start()
+    return server
+
+
+def test_updates_are_processed_in_order():
+    processed = []
+    done = threading.Event()
+
+    def process(update):
+        # The first update is slow, which mustn't let the ones after it overtake it.
+        if update["update_id"] == 0:
+            time.sleep(0.1)
+        processed.append(update["update_id"])
+        if len(processed) == 5:
+            done.set()
+
+    server = new_server(process)
+    for update_id in range(5):
+        assert post(server, {"update_id": update_id, "message": {"text": "/roll"}}) == 200
+    assert done.wait(5)
+    server.stop()
+    assert processed == list(range(5))
+    assert server.stats["processed"] == 5
+
+
+def test_invalid_requests_are_rejected():
+    processed = []
+    server = new_server(processed.append, max_body=100)
+    assert post(server, b"{not json") == 400
+    assert post(server, [1, 2]) == 400
+    assert post(server, {"message": {}}) == 400
+    assert post(server, {"update_id": "1"}) == 400
+    assert post(server, {"update_id": 1}, secret="wrong") == 403
+    assert post(server, {"update_id": 1}, path="/other") == 404
+    assert post(server, {"update_id": 1, "padding": "x" * 200}) == 413
+    server.stop()
+    assert processed == []
+    assert server.stats["invalid"] == 4
+
+
+def test_duplicates_are_processed_once():
+    processed = []
+    server = new_server(processed.append)
+    for _ in range(3):
+        assert post(server, {"update_id": 7}) == 200
+    server.stop()
+    assert processed == [{"update_id": 7}]
+    assert server.stats["duplicate"] == 2
+
+
+def test_full_queue_pushes_back():
+    release = threading.Event()
+    processed = []
+
+    def process(update):
+        release.wait(5)
+        processed.append(update["update_id"])
+
+    server = new_server(process, max_queue=2)
+    assert post(server, {"update_id": 0}) == 200
+    # Wait for the worker to pick it up, then fill the queue.
+    deadline = time.monotonic() + 5
+    while not server.queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert post(server, {"update_id": 1}) == 200
+    assert post(server, {"update_id": 2}) == 200
+    assert post(server, {"update_id": 3}) == 503
+    release.set()
+    # The rejected update isn't remembered, so Telegram's retry gets through once there's room.
+    deadline = time.monotonic() + 5
+    while post(server, {"update_id": 3}) == 503 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    server.stop()
+    assert processed == [0, 1, 2, 3]
+    assert server.stats["rejected"] >= 1
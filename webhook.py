@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+from __future__ import unicode_literals
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Optional, Set
+import hmac
+import json
+import logging
+import queue
+import threading
+
+LOGGER = logging.getLogger("webhook")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Receives Telegram updates as JSON POSTed to path, instead of polling for them.
+
+    Every request is validated (path, secret token, size and shape of the update) and answered straight away.
+    Valid updates go into a bounded queue, from which a single worker thread passes them to process in the order
+    they arrived, so a chat's updates are never handled out of order. process should be quick (e.g. hand the
+    update over to a ChatExecutor, which handles different chats in parallel). When the queue is full the request
+    is answered with 503, so Telegram backs off and delivers the update again later. Updates Telegram delivers
+    twice are only processed once.
+    """
+    def __init__(self, process: Callable[[dict], None], host="127.0.0.1", port=8443, path="/telegram",
+                 secret_token: Optional[str] = None, max_queue=1000, max_body=1 << 20, remembered_updates=10000):
+        self.process = process
+        self.path = path
+        self.secret_token = secret_token
+        self.max_body = max_body
+        self.queue: "queue.Queue[Optional[dict]]" = queue.Queue(max_queue)
+        self.lock = threading.Lock()
+        self.seen: Set[int] = set()
+        self.seen_order: Deque[int] = deque()
+        self.remembered_updates = remembered_updates
+        self.stats = {"accepted": 0, "duplicate": 0, "invalid": 0, "rejected": 0, "processed": 0, "failed": 0}
+
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.work, name="webhook-worker", daemon=True)
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread.start()
+        threading.Thread(target=self.server.serve_forever, name="webhook-server", daemon=True).start()
+
+    def stop(self):
+        """Stop accepting updates and finish the ones already queued."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.queue.put(None)
+        self.thread.join()
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def accept(self, body) -> int:
+        """Validate and queue a request body, returning the HTTP status to answer with."""
+        try:
+            update = json.loads(body.decode("utf-8"))
+        except ValueError:
+            self.count("invalid")
+            return 400
+        if not isinstance(update, dict) or type(update.get("update_id")) != int:
+            self.count("invalid")
+            return 400
+
+        update_id = update["update_id"]
+        with self.lock:
+            if update_id in self.seen:
+                self.stats["duplicate"] += 1
+                return 200
+            try:
+                self.queue.put_nowait(update)
+            except queue.Full:
+                # Not remembered, so Telegram's retry is taken once there's room.
+                self.stats["rejected"] += 1
+                return 503
+            self.seen.add(update_id)
+            self.seen_order.append(update_id)
+            if len(self.seen_order) > self.remembered_updates:
+                self.seen.discard(self.seen_order.popleft())
+            self.stats["accepted"] += 1
+        return 200
+
+    def work(self):
+        while True:
+            update = self.queue.get()
+            if update is None:
+                return
+            try:
+                self.process(update)
+                self.count("processed")
+            except Exception:
+                LOGGER.exception("Failed to process update %s", update.get("update_id"))
+                self.count("failed")
+
+    def handler_class(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != webhook.path:
+                    self.answer(404)
+                    return
+                if webhook.secret_token is not None and not hmac.compare_digest(
+                        self.headers.get(SECRET_HEADER, ""), webhook.secret_token):
+                    self.answer(403)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", ""))
+                except ValueError:
+                    self.answer(411)
+                    return
+                if length < 0 or length > webhook.max_body:
+                    self.answer(413)
+                    return
+                self.answer(webhook.accept(self.rfile.read(length)))
+
+            def answer(self, status):
+                self.send_response(status)
+                if status == 503:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler